@@ -0,0 +1,143 @@
+"""
+Change feed for clients that keep a local copy of parts and listings.
+
+Saves and deletes append a ChangeLog row once their transaction commits
+(see signals.py). /api/changes/ returns the rows after a client's cursor,
+with each changed object rendered as the list endpoints render it and
+deleted ones as tombstones (data null). A client takes a cursor first, then
+loads the lists, then polls from that cursor; changes it already has are
+replayed harmlessly because each entry replaces the whole object.
+
+Writes made with queryset.update() or bulk_create() send no signals and are
+not in the feed, as with the response cache and the conditional GETs.
+"""
+
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from .models import ChangeLog, Part, PartRequest, PartSale
+from .pagination import InvalidCursor, decode_cursor, encode_cursor
+from .projections import serialize_many
+from .serializers import PartRequestSerializer, PartSaleSerializer, PartSerializer
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+# Feed type name of each model in the feed
+FEED_KINDS = {Part: "parts", PartRequest: "requests", PartSale: "sales"}
+
+FEED_SERIALIZERS = {
+    "parts": PartSerializer,
+    "requests": PartRequestSerializer,
+    "sales": PartSaleSerializer,
+}
+
+
+class CursorExpired(InvalidCursor):
+    """Raised for cursors older than the retained change log."""
+
+
+def record_change(model, pk, action):
+    ChangeLog.objects.create(kind=FEED_KINDS[model], object_id=str(pk), action=action)
+
+
+def _settled(now):
+    """
+    Latest changed_at a read may return.
+
+    Sequence numbers are taken before commit, so a row can become visible after
+    a higher one; rows younger than the settle window are left for the next poll.
+    """
+    return now - timedelta(seconds=settings.CHANGE_FEED_SETTLE_SECONDS)
+
+
+def _cursor(position, as_of):
+    return encode_cursor([position, int(as_of.timestamp())])
+
+
+def head_cursor(now=None):
+    """Cursor positioned after every settled change."""
+    now = now or timezone.now()
+    settled = _settled(now)
+    position = ChangeLog.objects.filter(changed_at__lte=settled).aggregate(head=Max("id"))
+    return _cursor(position["head"] or 0, settled)
+
+
+def parse_cursor(cursor, now=None):
+    """The log position in `cursor`; CursorExpired if rows after it may have been pruned."""
+    values = decode_cursor(cursor)
+    if len(values) != 2 or not all(isinstance(value, int) for value in values):
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+    position, as_of = values
+    now = now or timezone.now()
+    if as_of < (now - timedelta(days=settings.CHANGE_LOG_RETENTION_DAYS)).timestamp():
+        raise CursorExpired("Cursor has expired; reload the lists and start a new feed")
+    return position
+
+
+def _latest_entries(entries):
+    """
+    One entry per object, at the position of its last change.
+
+    An object created and then updated within the page is still reported as
+    created; one deleted at the end is reported as deleted.
+    """
+    latest = {}
+    for entry in entries:
+        key = (entry.kind, entry.object_id)
+        created = key in latest and latest[key].action == ChangeLog.CREATED
+        if created and entry.action == ChangeLog.UPDATED:
+            entry.action = ChangeLog.CREATED
+        latest.pop(key, None)
+        latest[key] = entry
+    return list(latest.values())
+
+
+def _render(entries):
+    """{(kind, object_id): data} for the entries whose objects still exist."""
+    rendered = {}
+    for kind, serializer_class in FEED_SERIALIZERS.items():
+        ids = [e.object_id for e in entries if e.kind == kind and e.action != ChangeLog.DELETED]
+        if not ids:
+            continue
+        queryset = serializer_class.Meta.model.objects.filter(pk__in=ids)
+        for data in serialize_many(serializer_class, queryset):
+            rendered[(kind, str(data["id"]))] = data
+    return rendered
+
+
+def read_changes(position, kinds=None, limit=DEFAULT_LIMIT, now=None):
+    """
+    Changes after log `position` as {"changes": [...], "next": cursor, "has_more": bool}.
+
+    At most `limit` log rows are read per call, so payloads stay bounded
+    however far behind the client is.
+    """
+    now = now or timezone.now()
+    settled = _settled(now)
+    entries = ChangeLog.objects.filter(id__gt=position, changed_at__lte=settled)
+    if kinds is not None:
+        entries = entries.filter(kind__in=kinds)
+    entries = list(entries.order_by("id")[: limit + 1])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    if entries:
+        last = entries[-1]
+        # Rows still unread are at least as new as the last one returned
+        next_cursor = _cursor(last.id, last.changed_at if has_more else settled)
+    else:
+        next_cursor = _cursor(position, settled)
+
+    rendered = _render(entries)
+    changes = []
+    for entry in _latest_entries(entries):
+        data = rendered.get((entry.kind, entry.object_id))
+        # Objects gone since the entry was written are reported as deleted;
+        # their own tombstone follows later and changes nothing
+        action = entry.action if data is not None else ChangeLog.DELETED
+        changes.append(
+            {"type": entry.kind, "id": entry.object_id, "action": action, "data": data}
+        )
+    return {"changes": changes, "next": next_cursor, "has_more": has_more}
@@ -0,0 +1,111 @@
+"""
+ETag / Last-Modified validators for the public read endpoints.
+
+Validators come from updated_at (and a row count for lists, so deletes show)
+rather than from the rendered body. Lists only send an ETag: a delete leaves
+max(updated_at) where it was, so a Last-Modified alone would answer 304 for a
+list that lost a row. Nothing is rendered, so a 304 costs one or two aggregate
+queries and no serializer work. Rows changed with queryset.update() keep their
+old updated_at and are not noticed until something else changes.
+"""
+
+import hashlib
+from calendar import timegm
+from functools import wraps
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def _digest(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def _latest(timestamps):
+    timestamps = [timestamp for timestamp in timestamps if timestamp is not None]
+    return max(timestamps) if timestamps else None
+
+
+def list_validators(model, related=()):
+    """
+    Validators for a list of `model` whose rows also show `related` models.
+
+    Any change to a related table changes the validators, which is coarser
+    than needed but keeps every check to a handful of index lookups.
+    """
+
+    def validators(request, *args, **kwargs):
+        stats = model.objects.aggregate(count=Count("pk"), latest=Max("updated_at"))
+        latest = _latest(
+            [stats["latest"]]
+            + [rel.objects.aggregate(latest=Max("updated_at"))["latest"] for rel in related]
+        )
+        # Each page and filter of a list is a different representation
+        params = sorted(request.GET.lists())
+        return _digest(params, stats["count"], latest), None
+
+    return validators
+
+
+def detail_validators(model, kwarg, field="pk", related=()):
+    """
+    Validators for the `model` row whose `field` equals the `kwarg` URL argument.
+
+    `related` are lookups (e.g. "part__category") of nested rows in the
+    representation, read in the same query.
+    """
+    fields = ["updated_at", *(f"{name}__updated_at" for name in related)]
+
+    def validators(request, *args, **kwargs):
+        try:
+            row = model.objects.filter(**{field: kwargs[kwarg]}).values_list(*fields).first()
+        except (ValueError, ValidationError):
+            # Malformed ids are left for the view to report
+            return None
+        if row is None:
+            return None
+        latest = _latest(row)
+        # ?fields= / ?expand= change the representation
+        params = sorted(request.GET.lists())
+        return _digest(kwargs[kwarg], params, row), latest
+
+    return validators
+
+
+def conditional_get(validators):
+    """
+    Answer GET/HEAD with 304 when the client's copy is current, else tag the response.
+
+    Goes below @api_view (and any @permission_classes), so a 304 is only sent
+    to clients that pass authentication and permission checks, and above
+    @cached_response. `validators` returns (etag, last_modified), where
+    last_modified may be None, or None to leave the request alone.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+            found = validators(request, *args, **kwargs)
+            if found is None:
+                return view(request, *args, **kwargs)
+
+            etag, last_modified = found
+            etag = quote_etag(etag)
+            timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is not None:
+                return response
+
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                response.headers.setdefault("ETag", etag)
+                if timestamp is not None:
+                    response.headers.setdefault("Last-Modified", http_date(timestamp))
+            return response
+
+        return wrapper
+
+    return decorator
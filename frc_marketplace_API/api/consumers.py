@@ -1,7 +1,14 @@
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
+from django.utils import timezone
+import asyncio
+import collections
 import json
 import logging
+import uuid
+from . import presence
 
 logger = logging.getLogger(__name__)
 
@@ -9,6 +16,10 @@ class UserConsumer(AsyncJsonWebsocketConsumer):
     async def connect(self):
         self.user_id = self.scope['url_route']['kwargs']['team_number']
         self.user_group = f"user_{self.user_id}"
+        # Listing feed topics this socket follows, and the groups each one joined
+        self.topics = {}
+        # Ids of recent listing events, to drop copies arriving via overlapping topics
+        self.seen_events = collections.deque(maxlen=64)
 
         logger.info(f"Connecting user to personal group: {self.user_group}")
 
@@ -18,6 +29,8 @@ class UserConsumer(AsyncJsonWebsocketConsumer):
                 self.channel_name
             )
             await self.accept()
+            await sync_to_async(presence.heartbeat)(self.user_id, self.channel_name)
+            self.heartbeat_task = asyncio.create_task(self.heartbeat())
             logger.info(f"WebSocket connection established for user: {self.user_id}")
         except Exception as e:
             logger.error(f"Error during WebSocket connection: {e}")
@@ -26,6 +39,12 @@ class UserConsumer(AsyncJsonWebsocketConsumer):
     async def disconnect(self, close_code):
         logger.info(f"Disconnecting user: {self.user_id}")
         try:
+            heartbeat_task = getattr(self, "heartbeat_task", None)
+            if heartbeat_task:
+                heartbeat_task.cancel()
+            await sync_to_async(presence.leave)(self.user_id, self.channel_name)
+            for group in {group for groups in self.topics.values() for group in groups}:
+                await self.channel_layer.group_discard(group, self.channel_name)
             await self.channel_layer.group_discard(
                 self.user_group,
                 self.channel_name
@@ -33,12 +52,30 @@ class UserConsumer(AsyncJsonWebsocketConsumer):
         except Exception as e:
             logger.error(f"Error during WebSocket disconnection: {e}")
 
+    async def dispatch(self, message):
+        # Channels hops to a worker thread to close stale database connections
+        # before every handler; listing events never touch the database, and at
+        # one per subscriber per event that hop is most of the fan-out cost
+        if message["type"] == "listing.event":
+            await self.listing_event(message)
+            return
+        await super().dispatch(message)
+
+    async def heartbeat(self):
+        """Keep this socket's presence entry alive while it stays open"""
+        while True:
+            await asyncio.sleep(presence.HEARTBEAT_INTERVAL)
+            try:
+                await sync_to_async(presence.heartbeat)(self.user_id, self.channel_name)
+            except Exception as e:
+                logger.error(f"Error refreshing presence for user {self.user_id}: {e}")
+
     @database_sync_to_async
     def save_message_to_db(self, sender_id, receiver_id, message_content, message_id):
         """Save message to database synchronously"""
         try:
             # Import models here to avoid circular imports
-            from api.models import User, Message
+            from api.models import User, Message, Conversation
             from django.conf import settings
             
             sender = User.objects.get(team_number=sender_id)
@@ -51,16 +88,12 @@ class UserConsumer(AsyncJsonWebsocketConsumer):
                 message=message_content,
                 is_read=False
             )
+            Conversation.objects.record_message(message)
 
             # Import and call task here to avoid circular imports
-            from .tasks import send_dm_notification
-            # Send email notification
-            if receiver.email:
-                send_dm_notification.delay(
-                    sender_id=sender.id,
-                    recipient_id=receiver.id,
-                    message_content=message.message
-                )
+            from .tasks import queue_dm_notifications
+            # Send email notification unless the receiver is online
+            if queue_dm_notifications([message]):
                 logger.info(f"Email notification queued for {receiver.email}")
 
             return message
@@ -68,6 +101,71 @@ class UserConsumer(AsyncJsonWebsocketConsumer):
             logger.error(f"Error saving message to database: {e}")
             raise
 
+    async def buffer_message(self, sender_id, receiver_id, message_content, message_id):
+        """Build the message with a server timestamp and queue it for a batched write"""
+        # Import here to avoid circular imports (routing loads before the app registry)
+        from api.models import Message
+        from api.message_buffer import message_writer, resolve_team_users
+
+        sender_id, receiver_id = int(sender_id), int(receiver_id)
+        # A malformed id must fail here, before fan-out, not in the shared batch write
+        message_id = uuid.UUID(str(message_id)) if message_id else uuid.uuid4()
+        users = await resolve_team_users([sender_id, receiver_id])
+        if sender_id not in users or receiver_id not in users:
+            raise LookupError(f"Unknown team in message {sender_id} -> {receiver_id}")
+
+        message = Message(
+            id=message_id,
+            sender_id=users[sender_id],
+            receiver_id=users[receiver_id],
+            message=message_content,
+            timestamp=timezone.now(),
+            is_read=False,
+        )
+        message_writer.submit(message)
+        return message
+
+    @database_sync_to_async
+    def team_location(self):
+        from api.listing_feed import team_location
+
+        return team_location(self.user_id)
+
+    async def update_topics(self, action, topics):
+        """Join or leave the groups behind listing feed `topics` and report where the socket stands."""
+        from api.listing_feed import MAX_TOPICS, topic_groups
+
+        location = None
+        if action == "subscribe" and "nearby" in topics and "nearby" not in self.topics:
+            location = await self.team_location()
+        errors = {}
+        for topic in topics:
+            if not isinstance(topic, str):
+                continue
+            if action == "unsubscribe":
+                groups = self.topics.pop(topic, ())
+                # Other topics may still need a group this one shares
+                remaining = {group for groups in self.topics.values() for group in groups}
+                for group in set(groups) - remaining:
+                    await self.channel_layer.group_discard(group, self.channel_name)
+                continue
+            if topic in self.topics:
+                continue
+            if len(self.topics) >= MAX_TOPICS:
+                errors[topic] = f"At most {MAX_TOPICS} topics per connection"
+                continue
+            try:
+                groups = topic_groups(topic, location)
+            except ValueError as e:
+                errors[topic] = str(e)
+                continue
+            for group in groups:
+                await self.channel_layer.group_add(group, self.channel_name)
+            self.topics[topic] = groups
+        await self.send_json(
+            {"type": "subscriptions", "topics": sorted(self.topics), "errors": errors}
+        )
+
     async def receive_json(self, content):
         logger.info(f"Received message from user {self.user_id}: {content}")
         try:
@@ -79,9 +177,15 @@ class UserConsumer(AsyncJsonWebsocketConsumer):
                 message = content.get('message')
                 message_id = content.get('id')
 
-                # Save message to database first
+                # Write-behind queues the row and fans out right away; otherwise
+                # save to the database first
                 try:
-                    saved_message = await self.save_message_to_db(
+                    persist = (
+                        self.buffer_message
+                        if settings.CHAT_WRITE_BEHIND
+                        else self.save_message_to_db
+                    )
+                    saved_message = await persist(
                         sender_id=sender,
                         receiver_id=receiver,
                         message_content=message,
@@ -114,6 +218,10 @@ class UserConsumer(AsyncJsonWebsocketConsumer):
                 )
 
                 logger.info(f"Message routed to receiver {receiver} and sender {sender}")
+
+            elif message_type in ('subscribe', 'unsubscribe'):
+                topics = content.get('topics')
+                await self.update_topics(message_type, topics if isinstance(topics, list) else [])
         except Exception as e:
             logger.error(f"Error processing received message: {e}")
 
@@ -124,4 +232,29 @@ class UserConsumer(AsyncJsonWebsocketConsumer):
             await self.send_json(message)
             logger.info(f"Message sent to client: {message}")
         except Exception as e:
-            logger.error(f"Error sending message to client: {e}")
\ No newline at end of file
+            logger.error(f"Error sending message to client: {e}")
+
+    async def listing_event(self, event):
+        """Send a listing feed event to the WebSocket, once even if several topics matched"""
+        listing_event = event["event"]
+        if listing_event["id"] in self.seen_events:
+            return
+        self.seen_events.append(listing_event["id"])
+        try:
+            await self.send_json(listing_event)
+        except Exception as e:
+            logger.error(f"Error sending listing event to client: {e}")
+
+    async def match_found(self, event):
+        """Send a new request/sale match to the WebSocket"""
+        try:
+            await self.send_json(event["match"])
+        except Exception as e:
+            logger.error(f"Error sending match to client: {e}")
+
+    async def saved_search_match(self, event):
+        """Send a new listing that matched saved searches to the WebSocket"""
+        try:
+            await self.send_json(event["match"])
+        except Exception as e:
+            logger.error(f"Error sending saved search match to client: {e}")
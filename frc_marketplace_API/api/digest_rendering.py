@@ -0,0 +1,73 @@
+"""
+Daily digest rendering from shared per-request fragments.
+
+Neighbouring teams see the same requests, so each request's card is rendered
+once per run and reused for every user who gets it. The only per-user value
+on a card is the distance, which is rendered as a marker and substituted when
+the user's email is assembled. days_until is the same for every user on a
+given day, so it stays in the shared fragment.
+"""
+
+from functools import lru_cache
+from django.template.loader import get_template
+from django.utils import formats
+from django.utils.safestring import mark_safe
+
+DISTANCE_MARKER = "\x00distance\x00"
+
+
+@lru_cache(maxsize=None)
+def digest_template(name):
+    """Compiled template, kept for the worker's lifetime."""
+    return get_template(name)
+
+
+class DigestRenderer:
+    """Renders digest emails for one run, rendering each request card only once."""
+
+    def __init__(self, frontend_url, share_cards=True):
+        self.frontend_url = frontend_url
+        self.share_cards = share_cards
+        self._cards = {}
+
+    def _render_card(self, item):
+        context = {
+            "item": {
+                "request": item["request"],
+                "days_until": item["days_until"],
+                "distance": DISTANCE_MARKER,
+            },
+            "frontend_url": self.frontend_url,
+        }
+        return tuple(
+            digest_template(name).render(context).split(DISTANCE_MARKER)
+            for name in ("emails/daily_digest_request.html", "emails/daily_digest_request.txt")
+        )
+
+    def card(self, item):
+        """(html parts, text parts) of a request's card, split around the distance."""
+        if not self.share_cards:
+            return self._render_card(item)
+        key = (item["request"].id, item["days_until"])
+        if key not in self._cards:
+            self._cards[key] = self._render_card(item)
+        return self._cards[key]
+
+    def render(self, user, nearby_requests):
+        """(html, text) of one user's digest."""
+        html_cards, text_cards = [], []
+        for item in nearby_requests:
+            html_parts, text_parts = self.card(item)
+            distance = formats.localize(item["distance"])
+            html_cards.append(mark_safe(distance.join(html_parts)))
+            text_cards.append(mark_safe(distance.join(text_parts)))
+
+        context = {
+            "team_name": user.team_name,
+            "team_number": user.team_number,
+            "frontend_url": self.frontend_url,
+        }
+        return (
+            digest_template("emails/daily_digest.html").render({**context, "cards": html_cards}),
+            digest_template("emails/daily_digest.txt").render({**context, "cards": text_cards}),
+        )
@@ -0,0 +1,150 @@
+"""
+Live request and sale events pushed over the per-user WebSocket.
+
+A socket subscribes with {"type": "subscribe", "topics": [...]} and leaves
+with "unsubscribe". The topics are:
+- "all": every listing
+- "category:<id>" / "part:<id>": listings for one category or part
+- "nearby": listings posted within NEARBY_RADIUS_MILES of the team's address
+
+Each topic is one or more Channels groups. When a listing is created,
+edited or deleted, one event is sent to each group it belongs to (global,
+part, category and the poster's grid cell). The Channels layer then copies
+it to the subscribed sockets. Events carry the listing as a normalized row
+(part_id / user_team_number, see projections.py), so they stay small.
+Sockets on overlapping topics drop the repeats by event id.
+"""
+
+import logging
+import uuid
+import orjson
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from utils.utils import GridIndex
+from .changes import FEED_KINDS
+from .models import ChangeLog, Part, PartRequest, PartSale, User
+from .projections import empty_included, normalize_rows, projection_for
+from .renderers import ORJSONRenderer
+from .serializers import PartRequestSerializer, PartSaleSerializer
+
+logger = logging.getLogger(__name__)
+
+NEARBY_RADIUS_MILES = 50
+NEARBY_CELL_DEGREES = 1.0
+# Most topics one socket may hold at a time
+MAX_TOPICS = 25
+
+GLOBAL_GROUP = "listings"
+
+LISTING_SERIALIZERS = {PartRequest: PartRequestSerializer, PartSale: PartSaleSerializer}
+
+_grid = GridIndex(cell_degrees=NEARBY_CELL_DEGREES)
+
+
+def category_group(category_id):
+    return f"listings.category.{category_id}"
+
+
+def part_group(part_id):
+    return f"listings.part.{part_id}"
+
+
+def region_group(cell):
+    row, column = cell
+    return f"listings.region.{row}.{column}"
+
+
+def nearby_groups(latitude, longitude):
+    """Groups of every grid cell within NEARBY_RADIUS_MILES of (latitude, longitude)."""
+    return [
+        region_group(cell) for cell in _grid.cells_within(latitude, longitude, NEARBY_RADIUS_MILES)
+    ]
+
+
+def topic_groups(topic, location=None):
+    """
+    Groups a socket joins for `topic`; ValueError for topics it cannot have.
+
+    `location` is the team's (latitude, longitude), or None when it has none.
+    """
+    if topic == "all":
+        return [GLOBAL_GROUP]
+    if topic == "nearby":
+        if location is None:
+            raise ValueError("nearby needs an address with coordinates")
+        return nearby_groups(*location)
+    name, _, value = topic.partition(":")
+    # Ids are UUIDs; anything else could not name a valid group
+    if value and value.replace("-", "").isalnum() and len(value) <= 64:
+        if name == "category":
+            return [category_group(value)]
+        if name == "part":
+            return [part_group(value)]
+    raise ValueError(f"Unknown topic: {topic}")
+
+
+def team_location(team_number):
+    """(latitude, longitude) of a team's address, or None."""
+    location = (
+        User.objects.filter(team_number=team_number)
+        .values_list("address__latitude", "address__longitude")
+        .first()
+    )
+    return location if location and None not in location else None
+
+
+def listing_groups(part_id, category_id, location):
+    """Groups an event for a listing of `part_id` posted from `location` is sent to."""
+    groups = [GLOBAL_GROUP, part_group(part_id)]
+    if category_id is not None:
+        groups.append(category_group(category_id))
+    if location is not None and None not in location:
+        groups.append(region_group(_grid.cell(*location)))
+    return groups
+
+
+def build_event(model, pk, action, part_id, user_id):
+    """(groups, event) for a committed listing write, or None if it is already gone."""
+    event = {
+        "type": "listing",
+        "id": uuid.uuid4().hex,
+        "kind": FEED_KINDS[model],
+        "action": action,
+        "listing_id": str(pk),
+    }
+    if action == ChangeLog.DELETED:
+        category_id = Part.objects.filter(pk=part_id).values_list("category_id", flat=True).first()
+        location = (
+            User.objects.filter(pk=user_id)
+            .values_list("address__latitude", "address__longitude")
+            .first()
+        )
+        return listing_groups(part_id, category_id, location), event
+
+    serializer_class = LISTING_SERIALIZERS[model]
+    extra = ("part__category_id", "user__address__latitude", "user__address__longitude")
+    projection = projection_for(serializer_class, force=True)
+    row = projection.values(model.objects.filter(pk=pk), *extra).first()
+    if row is None:
+        return None
+    listing = normalize_rows(serializer_class, [row], empty_included())[0]
+    # Layers carry only plain JSON types; UUIDs, Decimals and dates go as the API renders them
+    event["listing"] = orjson.loads(ORJSONRenderer().render(listing))
+    location = (row["user__address__latitude"], row["user__address__longitude"])
+    return listing_groups(row["part"], row["part__category_id"], location), event
+
+
+async def fan_out(groups, event):
+    channel_layer = get_channel_layer()
+    for group in groups:
+        await channel_layer.group_send(group, {"type": "listing.event", "event": event})
+
+
+def publish(model, pk, action, part_id, user_id):
+    """Send the event for a committed listing write. A layer outage is logged; the write stands."""
+    try:
+        built = build_event(model, pk, action, part_id, user_id)
+        if built is not None:
+            async_to_sync(fan_out)(*built)
+    except Exception as e:
+        logger.error(f"Error publishing {action} event for {model.__name__} {pk}: {e}")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from api.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Flag users still awaiting approval as owed an activation email, so the "
+        "send_pending_activation_emails sweep covers accounts created before the flag existed."
+    )
+
+    def handle(self, *args, **options):
+        flagged = User.objects.filter(is_active=False, activation_email_pending=False).update(
+            activation_email_pending=True
+        )
+        self.stdout.write(self.style.SUCCESS(f"Flagged {flagged} pending users"))
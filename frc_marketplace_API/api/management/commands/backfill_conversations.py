@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.models import Conversation, Message
+
+
+class Command(BaseCommand):
+    help = "Rebuild the Conversation inbox rows from the Message table."
+
+    def handle(self, *args, **options):
+        conversations = {}
+        messages = Message.objects.order_by("timestamp").values(
+            "id", "sender_id", "receiver_id", "timestamp", "is_read"
+        )
+        for message in messages.iterator(chunk_size=2000):
+            pair = Conversation.objects.pair(message["sender_id"], message["receiver_id"])
+            conversation = conversations.setdefault(
+                pair,
+                Conversation(user_a_id=pair[0], user_b_id=pair[1]),
+            )
+            conversation.last_message_id = message["id"]
+            conversation.last_message_at = message["timestamp"]
+            if not message["is_read"]:
+                if str(message["receiver_id"]) == str(pair[0]):
+                    conversation.user_a_unread += 1
+                else:
+                    conversation.user_b_unread += 1
+
+        with transaction.atomic():
+            Conversation.objects.all().delete()
+            Conversation.objects.bulk_create(conversations.values(), batch_size=1000)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(conversations)} conversations"))
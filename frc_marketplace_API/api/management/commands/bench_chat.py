@@ -0,0 +1,84 @@
+import asyncio
+import time
+from unittest import mock
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from api.models import Message, User
+from api.message_buffer import message_writer, team_users
+from api.routing import websocket_urlpatterns
+
+# Team numbers well above any real FRC team so the bench never touches real users
+BENCH_TEAM_BASE = 990000
+
+
+class Command(BaseCommand):
+    help = "Compare chat messages/sec with synchronous saves and with write-behind."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pairs", type=int, default=10)
+        parser.add_argument("--messages", type=int, default=200)
+
+    def create_users(self, count):
+        return [
+            User.objects.create_user(
+                email=f"bench{BENCH_TEAM_BASE + i}@example.com",
+                password=None,
+                team_number=BENCH_TEAM_BASE + i,
+                phone=f"+1555{BENCH_TEAM_BASE + i:07d}",
+                is_active=True,
+            )
+            for i in range(count)
+        ]
+
+    async def run_pair(self, application, sender, receiver, count):
+        sender_socket = WebsocketCommunicator(application, f"/ws/user/{sender}/")
+        receiver_socket = WebsocketCommunicator(application, f"/ws/user/{receiver}/")
+        await sender_socket.connect()
+        await receiver_socket.connect()
+        for i in range(count):
+            await sender_socket.send_json_to(
+                {"type": "chat_message", "sender": sender, "receiver": receiver, "message": f"bench {i}"}
+            )
+        for _ in range(count):
+            await receiver_socket.receive_json_from(timeout=30)
+        await sender_socket.disconnect()
+        await receiver_socket.disconnect()
+
+    async def run(self, pairs, count):
+        application = URLRouter(websocket_urlpatterns)
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(
+                self.run_pair(application, BENCH_TEAM_BASE + 2 * i, BENCH_TEAM_BASE + 2 * i + 1, count)
+                for i in range(pairs)
+            )
+        )
+        delivered = time.perf_counter() - start
+        await message_writer.drain()
+        return delivered, time.perf_counter() - start
+
+    def handle(self, *args, **options):
+        pairs, count = options["pairs"], options["messages"]
+        total = pairs * count
+        users = self.create_users(2 * pairs)
+        try:
+            # Notification emails are not part of what is being measured
+            with mock.patch("api.tasks.send_dm_notification"):
+                for write_behind in (False, True):
+                    team_users.clear()
+                    with override_settings(CHAT_WRITE_BEHIND=write_behind):
+                        delivered, persisted = async_to_sync(self.run)(pairs, count)
+                    sent = Message.objects.filter(sender__in=users)
+                    stored = sent.count()
+                    self.stdout.write(
+                        f"{'write-behind' if write_behind else 'synchronous':>12}: "
+                        f"{total / delivered:>8.0f} msg/s delivered, "
+                        f"{total / persisted:>8.0f} msg/s persisted "
+                        f"({stored}/{total} stored)"
+                    )
+                    sent.delete()
+        finally:
+            User.objects.filter(pk__in=[u.pk for u in users]).delete()
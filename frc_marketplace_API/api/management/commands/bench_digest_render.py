@@ -0,0 +1,64 @@
+import random
+import time
+import uuid
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand
+from api.digest_rendering import DigestRenderer
+from api.models import Part, PartRequest, User
+
+
+class Command(BaseCommand):
+    help = "Compare digest render CPU with per-user cards and with shared card fragments."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--per-user", type=int, default=40, help="Nearby requests per user.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(3647)
+        today = date.today()
+        # Unsaved instances: this measures rendering only, not queries
+        posters = [User(team_number=n, team_name=f"Team {n}") for n in range(1, 201)]
+        requests = [
+            PartRequest(
+                id=uuid.uuid4(),
+                part=Part(name=f"Part {i}"),
+                user=rng.choice(posters),
+                quantity=rng.randint(1, 10),
+                needed_date=today + timedelta(days=rng.randint(-3, 30)),
+                additional_info="Spare for the district event",
+            )
+            for i in range(options["requests"])
+        ]
+        users = [User(team_number=10000 + i, team_name=f"Team {10000 + i}") for i in range(options["users"])]
+        digests = [
+            (
+                user,
+                [
+                    {
+                        "request": request,
+                        "distance": round(rng.uniform(0, 50), 1),
+                        "days_until": (request.needed_date - today).days,
+                    }
+                    for request in rng.sample(requests, options["per_user"])
+                ],
+            )
+            for user in users
+        ]
+
+        timings = {}
+        for label, share_cards in (("per-user cards", False), ("shared cards", True)):
+            renderer = DigestRenderer("https://example.com", share_cards=share_cards)
+            start = time.process_time()
+            for user, nearby in digests:
+                renderer.render(user, nearby)
+            timings[label] = time.process_time() - start
+            self.stdout.write(
+                f"{label:>15}: {timings[label]:>7.2f}s CPU, "
+                f"{timings[label] / len(users) * 1000:.2f} ms per user"
+            )
+        self.stdout.write(
+            f"{options['users']} users x {options['requests']} requests: "
+            f"{timings['per-user cards'] / timings['shared cards']:.1f}x less render CPU"
+        )
@@ -0,0 +1,96 @@
+import socketserver
+import threading
+import time
+from django.core.mail import send_mail
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from api.tasks import prepare_email, send_email_batch_task
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept and discard mail, with a fake handshake cost."""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        # Stands in for DNS, TCP and TLS setup to a real relay
+        time.sleep(self.server.handshake_delay)
+        self.reply("220 localhost bench sink")
+        while line := self.rfile.readline():
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self.reply("250 localhost")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                self.server.delivered += 1
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, handshake_delay):
+        super().__init__(("127.0.0.1", 0), SMTPSinkHandler)
+        self.handshake_delay = handshake_delay
+        self.delivered = 0
+
+
+class Command(BaseCommand):
+    help = "Compare one SMTP session per email with pooled batch sending, against a local sink."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--emails", type=int, default=300)
+        parser.add_argument(
+            "--handshake-ms", type=float, default=50,
+            help="Simulated connection setup cost of the real mail relay.",
+        )
+
+    def handle(self, *args, **options):
+        count = options["emails"]
+        sink = SMTPSink(options["handshake_ms"] / 1000)
+        threading.Thread(target=sink.serve_forever, daemon=True).start()
+
+        emails = [
+            prepare_email(
+                subject=f"Daily Part Requests Digest for FRC Team {i}",
+                message="digest body " * 50,
+                from_email="market@example.com",
+                recipient_list=[f"team{i}@example.com"],
+                html_message="<p>digest body</p>" * 50,
+            )
+            for i in range(count)
+        ]
+
+        smtp = override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+            EMAIL_HOST="127.0.0.1",
+            EMAIL_PORT=sink.server_address[1],
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER="",
+            EMAIL_HOST_PASSWORD="",
+        )
+        try:
+            with smtp:
+                start = time.perf_counter()
+                for email in emails:
+                    send_mail(fail_silently=False, **email)
+                single = time.perf_counter() - start
+
+                start = time.perf_counter()
+                send_email_batch_task(emails)
+                batched = time.perf_counter() - start
+        finally:
+            sink.shutdown()
+
+        self.stdout.write(f"{'per-email':>10}: {count / single:>8.1f} emails/s")
+        self.stdout.write(f"{'batched':>10}: {count / batched:>8.1f} emails/s ({single / batched:.1f}x)")
+        self.stdout.write(f"sink received {sink.delivered} of {2 * count}")
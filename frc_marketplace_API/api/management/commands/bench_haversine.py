@@ -0,0 +1,61 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from utils.utils import haversine, haversine_many, haversine_matrix, nearest_k
+
+
+class Command(BaseCommand):
+    help = "Compare the scalar haversine loop with the vectorized batch API."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000])
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def best_of(self, repeat, fn):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    def handle(self, *args, **options):
+        rng = random.Random(3647)
+        origin = (29.7604, -95.3698)
+        self.stdout.write(f"{'points':>8} {'scalar ms':>10} {'vector ms':>10} {'speedup':>8} {'top-10 ms':>10}")
+        for size in options["sizes"]:
+            lats = [rng.uniform(25, 49) for _ in range(size)]
+            lons = [rng.uniform(-124, -67) for _ in range(size)]
+
+            scalar = self.best_of(
+                options["repeat"],
+                lambda: [haversine(*origin, la, lo) for la, lo in zip(lats, lons)],
+            )
+            vector = self.best_of(
+                options["repeat"], lambda: haversine_many(*origin, lats, lons)
+            )
+            top_k = self.best_of(
+                options["repeat"], lambda: nearest_k(*origin, lats, lons, 10)
+            )
+            self.stdout.write(
+                f"{size:>8} {scalar * 1000:>10.2f} {vector * 1000:>10.2f} "
+                f"{scalar / vector:>7.1f}x {top_k * 1000:>10.2f}"
+            )
+
+        # M x N matrix against the equivalent nested scalar loop
+        users = [(rng.uniform(25, 49), rng.uniform(-124, -67)) for _ in range(200)]
+        requests = [(rng.uniform(25, 49), rng.uniform(-124, -67)) for _ in range(500)]
+        scalar = self.best_of(
+            1, lambda: [[haversine(*u, *r) for r in requests] for u in users]
+        )
+        vector = self.best_of(
+            options["repeat"],
+            lambda: haversine_matrix(
+                [u[0] for u in users], [u[1] for u in users],
+                [r[0] for r in requests], [r[1] for r in requests],
+            ),
+        )
+        self.stdout.write(
+            f"matrix 200x500: scalar {scalar * 1000:.2f} ms, "
+            f"vector {vector * 1000:.2f} ms ({scalar / vector:.1f}x)"
+        )
@@ -0,0 +1,129 @@
+import asyncio
+import statistics
+import time
+from contextlib import nullcontext
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from api.listing_feed import build_event, fan_out
+from api.models import ChangeLog, Part, PartCategory, PartRequest, User
+from api.routing import websocket_urlpatterns
+
+# Team numbers well above any real FRC team so the bench never touches real users
+BENCH_TEAM_BASE = 990000
+
+
+class SweepThrottledLayer(InMemoryChannelLayer):
+    """
+    InMemoryChannelLayer that sweeps expired messages at most once a second.
+
+    The stock layer sweeps every channel and group on each receive, which is
+    quadratic in sockets and would swamp what the bench is measuring.
+    """
+
+    swept_at = 0
+
+    def _clean_expired(self):
+        now = time.monotonic()
+        if now - self.swept_at >= 1:
+            self.swept_at = now
+            super()._clean_expired()
+
+
+class Command(BaseCommand):
+    help = "Measure listing feed fan-out to many subscribed WebSockets on the configured channel layer."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sockets", type=int, default=1000)
+        parser.add_argument("--events", type=int, default=20)
+
+    def create_event(self):
+        """A real listing event, built the way a save would build it."""
+        category = PartCategory.objects.create(name="Bench Category")
+        part = Part.objects.create(name="Bench Part", category=category)
+        user = User.objects.create_user(
+            email=f"bench{BENCH_TEAM_BASE}@example.com",
+            password=None,
+            team_number=BENCH_TEAM_BASE,
+            phone=f"+1555{BENCH_TEAM_BASE:07d}",
+            is_active=True,
+        )
+        request = PartRequest.objects.create(part=part, user=user, quantity=2)
+        return category, build_event(
+            PartRequest, request.pk, ChangeLog.CREATED, part.pk, user.pk
+        )
+
+    async def subscriber(self, application, team_number, topics):
+        socket = WebsocketCommunicator(application, f"/ws/user/{team_number}/")
+        await socket.connect()
+        await socket.send_json_to({"type": "subscribe", "topics": topics})
+        await socket.receive_json_from(timeout=30)
+        return socket
+
+    async def receive(self, socket, count, latencies):
+        for _ in range(count):
+            event = await socket.receive_json_from(timeout=60)
+            latencies.append(time.perf_counter() - event["sent"])
+
+    async def run(self, sockets, events, category, built):
+        application = URLRouter(websocket_urlpatterns)
+        groups, event = built
+        start = time.perf_counter()
+        # Half the sockets also follow the category, so they dedupe a second copy
+        subscribers = await asyncio.gather(
+            *(
+                self.subscriber(
+                    application,
+                    BENCH_TEAM_BASE + 1 + i,
+                    ["all", f"category:{category.id}"] if i % 2 else ["all"],
+                )
+                for i in range(sockets)
+            )
+        )
+        connected = time.perf_counter() - start
+
+        latencies = []
+        receivers = [
+            asyncio.create_task(self.receive(socket, events, latencies)) for socket in subscribers
+        ]
+        start = time.perf_counter()
+        for i in range(events):
+            await fan_out(groups, {**event, "id": f"bench-{i}", "sent": time.perf_counter()})
+        published = time.perf_counter() - start
+        await asyncio.gather(*receivers)
+        delivered = time.perf_counter() - start
+
+        await asyncio.gather(*(socket.disconnect() for socket in subscribers))
+        return connected, published, delivered, latencies
+
+    def handle(self, *args, **options):
+        sockets, events = options["sockets"], options["events"]
+        with transaction.atomic():
+            category, built = self.create_event()
+            transaction.set_rollback(True)
+
+        layers = None
+        if isinstance(get_channel_layer(), InMemoryChannelLayer):
+            layers = {"default": {"BACKEND": f"{__name__}.SweepThrottledLayer"}}
+        with override_settings(CHANNEL_LAYERS=layers) if layers else nullcontext():
+            layer = type(get_channel_layer()).__name__
+            connected, published, delivered, latencies = async_to_sync(self.run)(
+                sockets, events, category, built
+            )
+        latencies.sort()
+        total = sockets * events
+        self.stdout.write(f"layer: {layer}")
+        self.stdout.write(f"{sockets} sockets connected and subscribed in {connected:.2f}s")
+        self.stdout.write(
+            f"{events} events published in {published * 1000:.1f}ms, "
+            f"{total} deliveries in {delivered:.2f}s ({total / delivered:,.0f}/s), "
+            f"{len(latencies)}/{total} received"
+        )
+        self.stdout.write(
+            f"latency p50 {statistics.median(latencies) * 1000:.1f}ms, "
+            f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms"
+        )
@@ -0,0 +1,103 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from api.models import Part, PartCategory, PartManufacturer, PartRequest, PartSale, User
+from api.projections import normalized_list, projection_for
+from api.renderers import ORJSONRenderer
+from api.serializers import PartRequestSerializer, PartSaleSerializer, PublicUserSerializer
+
+# Team numbers well above any real FRC team so the bench never touches real users
+BENCH_TEAM_BASE = 990000
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare list serialization µs/row through DRF serializers, .values() projections "
+        "and normalized payloads."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--parts", type=int, default=100)
+        parser.add_argument("--listings", type=int, default=2000, help="Requests and sales each.")
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def create_rows(self, options):
+        rng = random.Random(3647)
+        manufacturer = PartManufacturer.objects.create(name="Bench Manufacturer")
+        category = PartCategory.objects.create(name="Bench Category")
+        users = User.objects.bulk_create(
+            User(
+                email=f"bench{BENCH_TEAM_BASE + i}@example.com",
+                team_number=BENCH_TEAM_BASE + i,
+                team_name=f"Bench Team {i}",
+                phone=f"+1555{BENCH_TEAM_BASE + i:07d}",
+                is_active=True,
+            )
+            for i in range(options["users"])
+        )
+        parts = Part.objects.bulk_create(
+            Part(name=f"Bench Part {i}", manufacturer=manufacturer, category=category)
+            for i in range(options["parts"])
+        )
+        for model, extra in ((PartRequest, {}), (PartSale, {"ask_price": 25})):
+            model.objects.bulk_create(
+                model(part=rng.choice(parts), user=rng.choice(users), **extra)
+                for _ in range(options["listings"])
+            )
+        return [user.id for user in users]
+
+    def best_of(self, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            timings.append(time.perf_counter() - start)
+        return min(timings), result
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user_ids = self.create_rows(options)
+            querysets = {
+                PartRequestSerializer: PartRequest.objects.filter(user_id__in=user_ids),
+                PartSaleSerializer: PartSale.objects.filter(user_id__in=user_ids),
+                PublicUserSerializer: User.objects.filter(id__in=user_ids),
+            }
+            for serializer_class, queryset in querysets.items():
+                queryset = queryset.order_by("pk")
+                rows = queryset.count()
+                projection = projection_for(serializer_class)
+
+                drf, drf_data = self.best_of(
+                    options["repeat"], lambda: serializer_class(queryset, many=True).data
+                )
+                fast, fast_data = self.best_of(options["repeat"], lambda: projection.rows(queryset))
+                drf_render, drf_body = self.best_of(
+                    options["repeat"], lambda: JSONRenderer().render(drf_data)
+                )
+                fast_render, fast_body = self.best_of(
+                    options["repeat"], lambda: ORJSONRenderer().render(fast_data)
+                )
+
+                self.stdout.write(
+                    f"{serializer_class.__name__:>22}: "
+                    f"serialize {drf / rows * 1e6:>6.1f} -> {fast / rows * 1e6:>5.1f} µs/row, "
+                    f"render {drf_render / rows * 1e6:>5.1f} -> {fast_render / rows * 1e6:>4.1f} µs/row, "
+                    f"total {(drf + drf_render) / (fast + fast_render):.1f}x "
+                    f"({'same bytes' if drf_body == fast_body else 'BYTES DIFFER'})"
+                )
+                if not projection.nested:
+                    continue
+                normalized, normalized_data = self.best_of(
+                    options["repeat"], lambda: normalized_list(serializer_class, queryset)
+                )
+                normalized_body = ORJSONRenderer().render(normalized_data)
+                self.stdout.write(
+                    f"{'normalized':>22}: "
+                    f"serialize {normalized / rows * 1e6:>5.1f} µs/row, "
+                    f"{len(fast_body) / rows:.0f} -> {len(normalized_body) / rows:.0f} bytes/row "
+                    f"({len(fast_body) / len(normalized_body):.1f}x smaller)"
+                )
+            transaction.set_rollback(True)
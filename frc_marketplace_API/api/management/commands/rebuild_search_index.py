@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from api.models import Part
+from api.search import update_part_search_vector
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored full-text search vector for every part."
+
+    def handle(self, *args, **options):
+        parts = Part.objects.select_related("manufacturer", "category")
+        count = 0
+        for part in parts.iterator(chunk_size=500):
+            update_part_search_vector(part)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Re-indexed {count} parts"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from api import metrics, notifications, percolator, response_cache  # noqa: F401 (registers counters)
+
+
+class Command(BaseCommand):
+    help = "Print the shared throughput counters."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Zero the counters afterwards.")
+
+    def handle(self, *args, **options):
+        for name, (value, description) in metrics.snapshot().items():
+            self.stdout.write(f"{name:<32} {value:>10}  {description}")
+
+        saved = notifications.savings()
+        self.stdout.write(
+            f"DM coalescing saved {saved['tasks_saved']} tasks and {saved['emails_saved']} emails"
+        )
+
+        if options["reset"]:
+            metrics.reset()
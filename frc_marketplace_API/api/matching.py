@@ -0,0 +1,126 @@
+"""
+Matching part requests with sales of the same part.
+
+A new or edited listing is compared with the other side's listings of the
+same part. The part_id foreign key index finds them, so a run never reads
+listings for other parts. Pairs from the same team are skipped. Each pair is
+scored from 0 to 1 on price, distance and quantity. A run adds at most the
+best MAX_MATCHES_PER_LISTING new pairs to ListingMatch and rescores the pairs
+the listing already has, including those the other side's runs created. It
+only deletes pairs that no longer match, e.g. after an edit changed the part.
+
+Prices follow the listing conventions: -1 means willing to trade, and 0 on a
+request is a donation wanted, on a sale a part given away.
+"""
+
+from decimal import Decimal
+from django.db import transaction
+from utils.utils import haversine
+from .models import ListingMatch, PartRequest, PartSale
+
+TRADE = Decimal("-1")
+FREE = Decimal("0")
+
+# A distance score halves every this many miles
+DISTANCE_HALF_MILES = 50
+# Weights of the price, distance and quantity scores
+PRICE_WEIGHT = 0.5
+DISTANCE_WEIGHT = 0.3
+QUANTITY_WEIGHT = 0.2
+# Most new matches one run adds for a listing
+MAX_MATCHES_PER_LISTING = 50
+
+
+def price_score(bid, ask):
+    """How well a sale's ask suits a request's bid, from 0 to 1."""
+    if ask == FREE:
+        return 1.0
+    if bid is None:
+        # The request named no price
+        return 0.5
+    if ask == TRADE:
+        return 1.0 if bid == TRADE else 0.5
+    if bid == TRADE:
+        return 0.25
+    if bid == FREE:
+        return 0.1
+    return min(float(bid / ask), 1.0)
+
+
+def distance_score(miles):
+    return 0.5 if miles is None else 1 / (1 + miles / DISTANCE_HALF_MILES)
+
+
+def quantity_score(wanted, offered):
+    return min(offered, wanted) / wanted if wanted > 0 else 1.0
+
+
+def listing_location(listing):
+    """(latitude, longitude) of the team that posted `listing`, or None."""
+    address = listing.user.address
+    if address is None or address.latitude is None or address.longitude is None:
+        return None
+    return address.latitude, address.longitude
+
+
+def distance_between(request, sale):
+    """Miles between the two teams, or None when either has no coordinates."""
+    here, there = listing_location(request), listing_location(sale)
+    return None if here is None or there is None else haversine(*here, *there)
+
+
+def score(request, sale):
+    """(score, distance_miles) for filling `request` with `sale`."""
+    miles = distance_between(request, sale)
+    total = (
+        PRICE_WEIGHT * price_score(request.bid_price, sale.ask_price)
+        + DISTANCE_WEIGHT * distance_score(miles)
+        + QUANTITY_WEIGHT * quantity_score(request.quantity, sale.quantity)
+    )
+    return round(total, 4), None if miles is None else round(miles, 1)
+
+
+def match_listing(model, pk):
+    """
+    Match one request or sale against the other side, rescoring its earlier matches.
+
+    Returns the matches that did not exist before, for notifications.
+    """
+    listing = model.objects.select_related("part", "user__address").filter(pk=pk).first()
+    if listing is None:
+        return []
+    is_request = model is PartRequest
+    other = PartSale if is_request else PartRequest
+    field = "request" if is_request else "sale"
+    candidates = (
+        other.objects.filter(part_id=listing.part_id)
+        .exclude(user_id=listing.user_id)
+        .select_related("part", "user__address")
+    )
+
+    scored = []
+    for candidate in candidates:
+        request, sale = (listing, candidate) if is_request else (candidate, listing)
+        value, miles = score(request, sale)
+        scored.append(ListingMatch(request=request, sale=sale, score=value, distance_miles=miles))
+    scored.sort(key=lambda match: match.score, reverse=True)
+
+    other_field = "sale_id" if is_request else "request_id"
+    existing = set(
+        ListingMatch.objects.filter(**{field: listing}).values_list(other_field, flat=True)
+    )
+    new = [match for match in scored if getattr(match, other_field) not in existing]
+    new = new[:MAX_MATCHES_PER_LISTING]
+    rescored = [match for match in scored if getattr(match, other_field) in existing]
+    with transaction.atomic():
+        # Only pairs that stopped matching go; ones past the cap stay, whoever made them
+        ListingMatch.objects.filter(**{field: listing}).exclude(
+            **{f"{other_field}__in": [getattr(match, other_field) for match in scored]}
+        ).delete()
+        ListingMatch.objects.bulk_create(
+            rescored + new,
+            update_conflicts=True,
+            unique_fields=["request", "sale"],
+            update_fields=["score", "distance_miles"],
+        )
+    return new
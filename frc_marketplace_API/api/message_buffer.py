@@ -0,0 +1,198 @@
+"""
+Write-behind persistence for chat messages sent over the WebSocket.
+
+With settings.CHAT_WRITE_BEHIND enabled, UserConsumer resolves both teams from
+an in-process cache, stamps the message with a server timestamp, fans it out,
+and only then hands it to `message_writer`. The writer batches messages from
+every socket in the process and writes each batch with one bulk_create.
+
+Delivery guarantees
+-------------------
+* Live delivery is at-most-once, as before: a message is fanned out once, to
+  whoever is connected.
+* Persistence is at-most-once and happens *after* live delivery, normally
+  within CHAT_FLUSH_INTERVAL_MS. If the process dies before the flush, up to
+  one window of messages was delivered live but never reaches message history,
+  the DM list, or email notifications.
+* Messages to unknown teams are rejected before fan-out, like the synchronous
+  path, and so are ids that are not UUIDs. Re-sent ids are skipped instead of
+  stored twice.
+* A batch that fails as a whole is retried row by row; rows that still fail
+  are logged and dropped.
+* Order within a conversation comes from the server timestamp, so a flush
+  landing late never reorders history.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from .models import Conversation, Message, User
+
+logger = logging.getLogger(__name__)
+
+TEAM_CACHE_TTL = 300
+
+
+class TeamUserCache:
+    """Process-local team number -> user id map. Misses are never cached."""
+
+    def __init__(self, ttl=TEAM_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}
+
+    def get_cached(self, team_numbers):
+        """Return ({team_number: user_id}, missing team numbers) without touching the DB."""
+        now = time.monotonic()
+        found, missing = {}, []
+        for team_number in team_numbers:
+            entry = self._entries.get(team_number)
+            if entry is not None and entry[0] > now:
+                found[team_number] = entry[1]
+            else:
+                missing.append(team_number)
+        return found, missing
+
+    def resolve(self, team_numbers):
+        """Like get_cached, but loads misses with a single query."""
+        found, missing = self.get_cached(team_numbers)
+        if missing:
+            expires = time.monotonic() + self.ttl
+            for team_number, user_id in User.objects.filter(
+                team_number__in=missing
+            ).values_list("team_number", "id"):
+                self._entries[team_number] = (expires, user_id)
+                found[team_number] = user_id
+        return found
+
+    def invalidate(self, *team_numbers):
+        for team_number in team_numbers:
+            self._entries.pop(team_number, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+team_users = TeamUserCache()
+
+
+async def resolve_team_users(team_numbers):
+    """Async wrapper that only leaves the event loop on a cache miss."""
+    found, missing = team_users.get_cached(team_numbers)
+    if not missing:
+        return found
+    return await database_sync_to_async(team_users.resolve)(team_numbers)
+
+
+def _save_batch(messages):
+    with transaction.atomic():
+        Message.objects.bulk_create(messages)
+        # Surface deferred FK violations (a user deleted since the lookup) here,
+        # inside the batch, rather than at some later commit
+        connection.check_constraints()
+        Conversation.objects.record_messages(messages)
+
+
+def _unsaved(messages):
+    """Drop messages whose id is already stored, e.g. a client re-sending after a reconnect."""
+    for message in messages:
+        # Compare as UUIDs; a client id in another spelling is still the same message
+        if not isinstance(message.id, uuid.UUID):
+            message.id = uuid.UUID(str(message.id))
+    existing = set(
+        Message.objects.filter(id__in=[m.id for m in messages]).values_list("id", flat=True)
+    )
+    return [m for m in messages if m.id not in existing]
+
+
+def persist_messages(messages):
+    """Write a batch of unsaved messages, their conversation rows and notifications."""
+    try:
+        messages = _unsaved(messages)
+        if not messages:
+            return []
+        _save_batch(messages)
+        saved = messages
+    except (IntegrityError, ValidationError, ValueError):
+        logger.warning("Chat batch failed, retrying %d messages one by one", len(messages))
+        saved = []
+        for message in messages:
+            try:
+                if _unsaved([message]):
+                    _save_batch([message])
+                    saved.append(message)
+            except (IntegrityError, ValidationError, ValueError) as e:
+                logger.error(f"Dropping chat message {message.id}: {e}")
+
+    # Imported here to avoid a circular import through api.tasks
+    from .tasks import queue_dm_notifications
+
+    queue_dm_notifications(saved)
+    return saved
+
+
+class MessageWriter:
+    """
+    Async queue of unsaved messages, flushed by a background task every
+    `flush_interval` seconds or as soon as `batch_size` messages are waiting.
+    """
+
+    def __init__(self, flush_interval=None, batch_size=None, persist=persist_messages):
+        self.flush_interval = (
+            flush_interval
+            if flush_interval is not None
+            else settings.CHAT_FLUSH_INTERVAL_MS / 1000
+        )
+        self.batch_size = batch_size or settings.CHAT_FLUSH_BATCH_SIZE
+        self.persist = persist
+        self.queue = None
+        self._loop = None
+        self._task = None
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self.queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+
+    def submit(self, message):
+        """Queue an unsaved Message; returns immediately."""
+        self._ensure_started()
+        self.queue.put_nowait(message)
+
+    async def drain(self):
+        """Wait until everything submitted so far has been flushed."""
+        if self.queue is not None:
+            await self.queue.join()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        try:
+            await database_sync_to_async(self.persist)(batch)
+        except Exception as e:
+            logger.error(f"Error flushing {len(batch)} chat messages: {e}", exc_info=True)
+        finally:
+            for _ in batch:
+                self.queue.task_done()
+
+
+message_writer = MessageWriter()
@@ -0,0 +1,47 @@
+"""
+Throughput counters shared by every web and worker process, kept in the cache.
+
+Modules register the counters they own so `manage.py show_metrics` can list
+them. Counters never expire; `reset` zeroes them.
+"""
+
+from django.core.cache import cache
+
+_counters = {}
+
+
+def register(name, description):
+    _counters[name] = description
+    return name
+
+
+def _key(name):
+    return f"metrics:{name}"
+
+
+def incr(name, amount=1):
+    if not amount:
+        return
+    cache.add(_key(name), 0, None)
+    try:
+        cache.incr(_key(name), amount)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(_key(name), amount, None)
+
+
+def get(name):
+    return cache.get(_key(name), 0)
+
+
+def snapshot():
+    """{name: (value, description)} for every registered counter."""
+    values = cache.get_many([_key(name) for name in _counters])
+    return {
+        name: (values.get(_key(name), 0), description)
+        for name, description in sorted(_counters.items())
+    }
+
+
+def reset(names=None):
+    cache.delete_many([_key(name) for name in (names or _counters)])
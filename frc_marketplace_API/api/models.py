@@ -1,15 +1,20 @@
 import uuid
+from collections import Counter
 from django.contrib.auth.base_user import BaseUserManager, AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin
 from django.conf import settings
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from django.db import models
+from django.db import models, transaction
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from phone_field import PhoneField
 from address.models import AddressField, Address, Locality
 import logging
 import os
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 
 # Default address for superusers
 DEFAULT_ADDRESS = {"raw": "1001 Avenida De Las Americas, Houston, TX 77010"}
@@ -35,6 +40,45 @@ def part_image_path(instance, filename):
     return f"parts/{instance.manufacturer.name}/{instance.category.name}/{filename}"
 
 
+class FieldTracker:
+    """
+    Model mixin that snapshots `tracked_fields` as loaded from the database,
+    so pre_save handlers can see what changed without re-reading the row.
+    """
+
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_tracked_fields()
+        return instance
+
+    def _snapshot_tracked_fields(self):
+        # Deferred fields are skipped so reading them never triggers a query
+        self._loaded_values = {
+            name: self.__dict__[name]
+            for name in self.tracked_fields
+            if name in self.__dict__
+        }
+
+    @property
+    def changed_fields(self):
+        """Tracked fields whose value differs from the database; empty when unsaved."""
+        loaded = getattr(self, "_loaded_values", {})
+        return {
+            name for name, value in loaded.items() if self.__dict__.get(name) != value
+        }
+
+    def previous_value(self, name):
+        """Value of a tracked field as last loaded or saved."""
+        return getattr(self, "_loaded_values", {}).get(name)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._snapshot_tracked_fields()
+
+
 class UserManager(BaseUserManager):
     """User manager for each account."""
 
@@ -44,6 +88,10 @@ class UserManager(BaseUserManager):
             raise ValueError("Email is required!")
         email = self.normalize_email(email)
 
+        # New accounts await manual approval; the activation email goes out once approved
+        extra_fields.setdefault(
+            "activation_email_pending", not extra_fields.get("is_active", False)
+        )
         user = self.model(email=email, **extra_fields)
         user.set_password(password)
 
@@ -67,10 +115,16 @@ class UserManager(BaseUserManager):
 
         return self.create_user(email, password, **extra_fields)
 
+    def public(self):
+        """Users visible to other teams (see PublicUserSerializer)."""
+        return self.filter(is_active=True, is_staff=False, is_superuser=False)
+
 
-class User(AbstractBaseUser, PermissionsMixin):
+class User(FieldTracker, AbstractBaseUser, PermissionsMixin):
     """User model."""
 
+    tracked_fields = ("is_active", "team_number")
+
     full_name = models.CharField(max_length=255, null=True, blank=True)
     email = models.EmailField(unique=True)
     team_name = models.CharField(max_length=255, null=True, blank=True)
@@ -85,12 +139,30 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_staff = models.BooleanField(default=False)  # Default user is not staff
     is_superuser = models.BooleanField(default=False)  # Default user is not superuser
     date_joined = models.DateTimeField(auto_now_add=True)
+    # Feeds the ETag / Last-Modified validators in api/conditional.py
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Set until the activation email is queued (see tasks.claim_activation_email)
+    activation_email_pending = models.BooleanField(default=False)
 
     objects = UserManager()
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
 
+    class Meta:
+        indexes = [
+            GinIndex(
+                name="user_team_name_trgm",
+                fields=["team_name"],
+                opclasses=["gin_trgm_ops"],
+            ),
+            models.Index(
+                name="user_activation_pending",
+                fields=["activation_email_pending"],
+                condition=models.Q(activation_email_pending=True),
+            ),
+        ]
+
     def __str__(self):
         return self.email
 
@@ -118,6 +190,9 @@ class Part(models.Model):
         validators=[validate_image_file],
     )
     link = models.URLField(null=True, blank=True)
+    # Maintained by api.search.update_part_search_vector, never edited directly
+    search_vector = SearchVectorField(null=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         constraints = [
@@ -126,6 +201,14 @@ class Part(models.Model):
                 name="unique_part",
             )
         ]
+        indexes = [
+            GinIndex(name="part_search_vector", fields=["search_vector"]),
+            GinIndex(
+                name="part_name_trgm",
+                fields=["name"],
+                opclasses=["gin_trgm_ops"],
+            ),
+        ]
 
 
 class PartManufacturer(models.Model):
@@ -134,6 +217,16 @@ class PartManufacturer(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=255, unique=True)
     website = models.URLField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            GinIndex(
+                name="manufacturer_name_trgm",
+                fields=["name"],
+                opclasses=["gin_trgm_ops"],
+            ),
+        ]
 
 
 class PartCategory(models.Model):
@@ -141,6 +234,16 @@ class PartCategory(models.Model):
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=255, unique=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            GinIndex(
+                name="category_name_trgm",
+                fields=["name"],
+                opclasses=["gin_trgm_ops"],
+            ),
+        ]
 
 
 class PartRequest(models.Model):
@@ -151,6 +254,11 @@ class PartRequest(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="requests")
     quantity = models.IntegerField(default=1)
     request_date = models.DateField(auto_now_add=True)
+    # request_date only has day precision; the digest needs exact ordering.
+    # Rows older than this column all got the deploy time, so the digest also
+    # bounds its window by request_date
+    created_at = models.DateTimeField(default=timezone.now, db_index=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     needed_date = models.DateField(null=True, blank=True)
     needed_for = models.CharField(max_length=255, null=True, blank=True)
     additional_info = models.TextField(null=True, blank=True)
@@ -160,6 +268,45 @@ class PartRequest(models.Model):
     # is_open = models.BooleanField(default=True) ADD IN V2
 
 
+class DigestState(models.Model):
+    """How far the daily requests digest has got for one user."""
+
+    user = models.OneToOneField(
+        User, primary_key=True, related_name="digest_state", on_delete=models.CASCADE
+    )
+    # Requests created up to this time have been considered for the user
+    processed_until = models.DateTimeField(null=True, blank=True)
+    last_request = models.ForeignKey(
+        PartRequest, related_name="+", on_delete=models.SET_NULL, null=True, blank=True
+    )
+    last_sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.user} digest up to {self.processed_until}"
+
+
+class DigestLog(models.Model):
+    """Sent-log: one row per digest email that went out."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, related_name="digest_logs", on_delete=models.CASCADE)
+    window_start = models.DateTimeField()
+    window_end = models.DateTimeField()
+    request_ids = models.JSONField(default=list)
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "window_end"],
+                name="unique_digest_window",
+            )
+        ]
+
+    def __str__(self):
+        return f"Digest for {self.user} at {self.sent_at}"
+
+
 class PartSale(models.Model):
     """Part Sale Model."""
 
@@ -168,6 +315,7 @@ class PartSale(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="sales")
     quantity = models.IntegerField(default=1)
     sale_creation_date = models.DateField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     ask_price = models.DecimalField(
         max_digits=10, decimal_places=2
     )  # -1 if trade, 0 for FREE
@@ -189,8 +337,230 @@ class Message(models.Model):
         User, related_name="received_messages", on_delete=models.CASCADE
     )
     message = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Assigned by the server when the message is accepted, which can be before the
+    # row is written (see api.message_buffer)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     is_read = models.BooleanField(default=False)
 
     def __str__(self):
         return f"{self.sender} to {self.receiver}: {self.message}"
+
+
+class ConversationManager(models.Manager):
+    """Maintains the per-pair inbox rows as messages are written."""
+
+    @staticmethod
+    def pair(user_id, other_id):
+        """Order a pair of user ids the way Conversation stores them."""
+        return tuple(sorted([user_id, other_id], key=str))
+
+    def for_user(self, user):
+        """Conversations `user` takes part in, most recent first."""
+        return self.filter(
+            models.Q(user_a=user) | models.Q(user_b=user)
+        ).order_by("-last_message_at")
+
+    def record_message(self, message):
+        """Fold a newly created message into its conversation row."""
+        self.record_messages([message])
+
+    def record_messages(self, messages):
+        """Fold a batch of newly created messages into their conversation rows."""
+        latest = {}
+        unread = Counter()
+        for message in messages:
+            pair = self.pair(message.sender_id, message.receiver_id)
+            unread_field = (
+                "user_a_unread" if str(message.receiver_id) == str(pair[0]) else "user_b_unread"
+            )
+            unread[pair, unread_field] += 1
+            if pair not in latest or latest[pair].timestamp <= message.timestamp:
+                latest[pair] = message
+
+        with transaction.atomic():
+            for (user_a_id, user_b_id), message in latest.items():
+                conversation, _ = self.get_or_create(user_a_id=user_a_id, user_b_id=user_b_id)
+                self.filter(pk=conversation.pk).update(
+                    **{
+                        field: models.F(field) + unread[(user_a_id, user_b_id), field]
+                        for field in ("user_a_unread", "user_b_unread")
+                        if unread[(user_a_id, user_b_id), field]
+                    }
+                )
+                # Messages can be recorded out of order; only move last_message forward
+                self.filter(pk=conversation.pk).filter(
+                    models.Q(last_message_at__isnull=True)
+                    | models.Q(last_message_at__lte=message.timestamp)
+                ).update(last_message=message, last_message_at=message.timestamp)
+
+    def mark_read(self, reader, other):
+        """Clear `reader`'s unread count in their conversation with `other`."""
+        user_a_id, user_b_id = self.pair(reader.id, other.id)
+        unread_field = "user_a_unread" if str(reader.id) == str(user_a_id) else "user_b_unread"
+        self.filter(user_a_id=user_a_id, user_b_id=user_b_id).update(**{unread_field: 0})
+
+
+class Conversation(models.Model):
+    """Conversation Model: one inbox row per unordered pair of users."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # user_a is always the lower id of the pair (see ConversationManager.pair)
+    user_a = models.ForeignKey(
+        User, related_name="conversations_as_a", on_delete=models.CASCADE
+    )
+    user_b = models.ForeignKey(
+        User, related_name="conversations_as_b", on_delete=models.CASCADE
+    )
+    last_message = models.ForeignKey(
+        Message, related_name="+", on_delete=models.SET_NULL, null=True, blank=True
+    )
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    user_a_unread = models.PositiveIntegerField(default=0)
+    user_b_unread = models.PositiveIntegerField(default=0)
+
+    objects = ConversationManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user_a", "user_b"],
+                name="unique_conversation",
+            )
+        ]
+        indexes = [
+            models.Index(fields=["user_a", "-last_message_at"], name="conversation_a_inbox"),
+            models.Index(fields=["user_b", "-last_message_at"], name="conversation_b_inbox"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_a} <-> {self.user_b}"
+
+    def other_user(self, user):
+        """The counterpart of `user` in this conversation."""
+        return self.user_b if self.user_a_id == user.id else self.user_a
+
+    def unread_for(self, user):
+        """How many messages `user` has not read yet."""
+        return self.user_a_unread if self.user_a_id == user.id else self.user_b_unread
+
+
+class FRCTeam(models.Model):
+    """Local copy of The Blue Alliance team directory."""
+
+    team_number = models.IntegerField(primary_key=True)
+    nickname = models.CharField(max_length=255, null=True, blank=True)
+    name = models.TextField(null=True, blank=True)
+    city = models.CharField(max_length=255, null=True, blank=True)
+    state_prov = models.CharField(max_length=255, null=True, blank=True)
+    country = models.CharField(max_length=255, null=True, blank=True)
+    rookie_year = models.IntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"frc{self.team_number} {self.nickname}"
+
+
+class TeamDirectoryPage(models.Model):
+    """Validators from the last fetch of one /teams/{page} listing, for conditional GETs."""
+
+    page = models.IntegerField(primary_key=True)
+    etag = models.CharField(max_length=255, null=True, blank=True)
+    last_modified = models.CharField(max_length=255, null=True, blank=True)
+    team_count = models.IntegerField(default=0)
+    synced_at = models.DateTimeField(auto_now=True)
+
+
+class ChangeLog(models.Model):
+    """
+    Append-only record of part and listing writes, read by the /api/changes/ feed.
+
+    The sequential id is the feed's position. Rows are pruned after
+    CHANGE_LOG_RETENTION_DAYS by tasks.prune_change_log.
+    """
+
+    CREATED = "created"
+    UPDATED = "updated"
+    DELETED = "deleted"
+    ACTIONS = [(CREATED, "Created"), (UPDATED, "Updated"), (DELETED, "Deleted")]
+
+    id = models.BigAutoField(primary_key=True)
+    # Feed type the row belongs to: "parts", "requests" or "sales"
+    kind = models.CharField(max_length=16)
+    object_id = models.CharField(max_length=64)
+    action = models.CharField(max_length=8, choices=ACTIONS)
+    changed_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"#{self.id} {self.kind} {self.object_id} {self.action}"
+
+
+class ListingMatch(models.Model):
+    """A sale that can fill a request for the same part, scored by api/matching.py."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    request = models.ForeignKey(PartRequest, related_name="matches", on_delete=models.CASCADE)
+    sale = models.ForeignKey(PartSale, related_name="matches", on_delete=models.CASCADE)
+    # 0..1, higher is better
+    score = models.FloatField(db_index=True)
+    # Between the two teams' addresses; null when either has no coordinates
+    distance_miles = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["request", "sale"], name="unique_listing_match")
+        ]
+
+    def __str__(self):
+        return f"{self.request_id} <-> {self.sale_id} ({self.score:.2f})"
+
+
+class SavedSearch(models.Model):
+    """
+    A team's standing query over new listings, checked by api/percolator.py.
+
+    Every criterion that is set must hold. `buckets` are the percolator's
+    index keys and are filled in on save.
+    """
+
+    REQUESTS = "requests"
+    SALES = "sales"
+    KINDS = [(REQUESTS, "Requests"), (SALES, "Sales")]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, related_name="saved_searches", on_delete=models.CASCADE)
+    name = models.CharField(max_length=255, blank=True)
+    # Null matches both requests and sales
+    kind = models.CharField(max_length=8, choices=KINDS, null=True, blank=True)
+    # Words that must all appear in the part's name, model, manufacturer or category
+    query = models.CharField(max_length=255, blank=True)
+    part = models.ForeignKey(
+        Part, related_name="+", on_delete=models.CASCADE, null=True, blank=True
+    )
+    manufacturer = models.ForeignKey(
+        PartManufacturer, related_name="+", on_delete=models.CASCADE, null=True, blank=True
+    )
+    category = models.ForeignKey(
+        PartCategory, related_name="+", on_delete=models.CASCADE, null=True, blank=True
+    )
+    # Highest ask price of a matching sale; trades (-1) and free parts (0) always pass
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # Distance from the team's address when the search was saved
+    radius_miles = models.FloatField(null=True, blank=True)
+    latitude = models.FloatField(null=True, blank=True, editable=False)
+    longitude = models.FloatField(null=True, blank=True, editable=False)
+    buckets = ArrayField(models.CharField(max_length=64), default=list, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [GinIndex(name="saved_search_buckets", fields=["buckets"])]
+
+    def save(self, *args, **kwargs):
+        # Imported here because the percolator imports these models
+        from .percolator import search_buckets
+
+        self.buckets = search_buckets(self)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.user} search {self.name or self.id}"
@@ -0,0 +1,118 @@
+"""
+Per-recipient coalescing of DM notification emails.
+
+Each message to an offline team is appended to that recipient's pending list
+in the cache (a sequence counter plus one key per entry). The first pending
+message schedules tasks.flush_dm_notifications after the quiet window; if more
+messages arrived in the meantime the flush pushes itself back, up to
+DM_NOTIFICATION_MAX_WAIT after the first one. The flush then sends one email
+covering everything still pending, and only drops those entries once the
+email is handed to the mail queue; a failed send leaves them for the retry.
+"""
+
+import time
+from django.conf import settings
+from django.core.cache import cache
+from . import metrics
+
+# Long enough to outlive any flush delay; pending state is cleaned up by the flush
+PENDING_TTL = 60 * 60 * 24
+
+
+def scheduled_ttl():
+    """How long a scheduled flush blocks new ones; a lost flush task is replaced after this."""
+    return settings.DM_NOTIFICATION_MAX_WAIT + settings.DM_NOTIFICATION_WINDOW
+
+QUEUED = metrics.register(
+    "dm_notifications_queued", "DMs added to a pending digest (previously 2 tasks + 1 email each)"
+)
+SUPPRESSED = metrics.register(
+    "dm_notifications_suppressed", "DMs not emailed because the recipient was online"
+)
+FLUSH_TASKS = metrics.register("dm_digest_tasks", "Digest flush tasks scheduled")
+EMAILS = metrics.register("dm_digest_emails", "DM digest emails sent")
+
+
+def _key(recipient_id, name):
+    return f"dm-pending:{recipient_id}:{name}"
+
+
+def schedule_flush(recipient_id, countdown):
+    # Imported here to avoid a circular import through api.tasks
+    from .tasks import flush_dm_notifications
+
+    flush_dm_notifications.apply_async((str(recipient_id),), countdown=countdown)
+    metrics.incr(FLUSH_TASKS)
+
+
+def enqueue(message):
+    """Add a saved message to its recipient's pending digest."""
+    recipient_id = message.receiver_id
+    now = time.time()
+
+    sequence_key = _key(recipient_id, "seq")
+    cache.add(sequence_key, 0, None)
+    position = cache.incr(sequence_key)
+    cache.set(
+        _key(recipient_id, position),
+        {"sender_id": str(message.sender_id), "message": message.message},
+        PENDING_TTL,
+    )
+    cache.set(_key(recipient_id, "last"), now, PENDING_TTL)
+    cache.add(_key(recipient_id, "first"), now, PENDING_TTL)
+    metrics.incr(QUEUED)
+
+    # Only the first message of a burst schedules a flush
+    if cache.add(_key(recipient_id, "scheduled"), 1, scheduled_ttl()):
+        schedule_flush(recipient_id, settings.DM_NOTIFICATION_WINDOW)
+
+
+def flush_delay(recipient_id, now=None):
+    """Seconds until the recipient's digest is due, or 0 if it is due now."""
+    now = now or time.time()
+    times = cache.get_many([_key(recipient_id, "last"), _key(recipient_id, "first")])
+    last = times.get(_key(recipient_id, "last"), 0)
+    first = times.get(_key(recipient_id, "first"), 0)
+    quiet = settings.DM_NOTIFICATION_WINDOW - (now - last)
+    deadline = settings.DM_NOTIFICATION_MAX_WAIT - (now - first)
+    return max(0, min(quiet, deadline))
+
+
+def pending(recipient_id):
+    """(entries, position) for the recipient's pending entries, oldest first; nothing is removed."""
+    sequence = cache.get(_key(recipient_id, "seq"), 0)
+    flushed = cache.get(_key(recipient_id, "flushed"), 0)
+    keys = [_key(recipient_id, position) for position in range(flushed + 1, sequence + 1)]
+    entries = cache.get_many(keys)
+    return [entries[key] for key in keys if key in entries], sequence
+
+
+def unschedule(recipient_id):
+    """Let the next message schedule a flush, e.g. after this one gave up retrying."""
+    cache.delete(_key(recipient_id, "scheduled"))
+
+
+def acknowledge(recipient_id, position):
+    """Drop entries up to `position` once they have been sent (or deliberately skipped)."""
+    flushed = cache.get(_key(recipient_id, "flushed"), 0)
+    cache.delete_many([_key(recipient_id, n) for n in range(flushed + 1, position + 1)])
+    cache.set(_key(recipient_id, "flushed"), max(flushed, position), None)
+    cache.delete_many([_key(recipient_id, "first"), _key(recipient_id, "scheduled")])
+
+    # A message that landed while we were sending saw the flush still scheduled;
+    # make sure it gets one of its own
+    if cache.get(_key(recipient_id, "seq"), 0) > position and cache.add(
+        _key(recipient_id, "scheduled"), 1, scheduled_ttl()
+    ):
+        cache.add(_key(recipient_id, "first"), time.time(), PENDING_TTL)
+        schedule_flush(recipient_id, settings.DM_NOTIFICATION_WINDOW)
+
+
+def savings():
+    """Celery tasks and emails avoided compared to one notification per message."""
+    queued, flush_tasks, emails = (metrics.get(name) for name in (QUEUED, FLUSH_TASKS, EMAILS))
+    # Each message used to be a send_dm_notification task plus a send_email_task
+    return {
+        "tasks_saved": 2 * queued - (flush_tasks + emails),
+        "emails_saved": queued - emails,
+    }
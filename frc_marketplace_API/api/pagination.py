@@ -0,0 +1,161 @@
+import base64
+import datetime
+import decimal
+import json
+import uuid
+from functools import reduce
+from operator import or_
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework import status
+from rest_framework.response import Response
+from .projections import empty_included, normalize_rows, projection_for, wants_normalized
+from .serializers import FieldSpec
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+# Stable keyset orderings for each list endpoint; the last key must be unique.
+PART_ORDERING = ("name", "id")
+REQUEST_ORDERING = ("-request_date", "-id")
+SALE_ORDERING = ("-sale_creation_date", "-id")
+USER_ORDERING = ("date_joined", "id")
+MESSAGE_ORDERING = ("-timestamp", "-id")
+NAME_ORDERING = ("name", "id")
+MATCH_ORDERING = ("-score", "-id")
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor we did not issue."""
+
+
+def encode_cursor(values):
+    """Encode a list of keyset values into an opaque, URL-safe cursor."""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor back into its keyset values."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+    if not isinstance(values, list):
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+    return values
+
+
+def _cursor_value(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, (uuid.UUID, decimal.Decimal)):
+        return str(value)
+    return value
+
+
+def _typed_values(model, ordering, values, cursor):
+    """Cursor values as their ordering fields' types, so a tampered cursor is a 400."""
+    try:
+        return [
+            model._meta.get_field(key.lstrip("-")).to_python(value)
+            for key, value in zip(ordering, values)
+        ]
+    except (ValidationError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+
+def row_value(row, key):
+    """Ordering key value of a model instance or a .values() row."""
+    key = key.lstrip("-")
+    return row[key] if isinstance(row, dict) else getattr(row, key)
+
+
+def _after(ordering, values):
+    """Q matching rows strictly after `values` in keyset `ordering`."""
+    clauses = []
+    for i, key in enumerate(ordering):
+        field = key.lstrip("-")
+        lookup = "lt" if key.startswith("-") else "gt"
+        equal = {k.lstrip("-"): v for k, v in zip(ordering[:i], values[:i])}
+        clauses.append(Q(**equal, **{f"{field}__{lookup}": values[i]}))
+    return reduce(or_, clauses)
+
+
+def paginate_keyset(queryset, ordering, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Return one page of `queryset` in keyset `ordering` as (rows, next_cursor).
+
+    Each page is an indexed range scan starting after the cursor, so there is no
+    COUNT(*) and no OFFSET and page cost stays flat as the table grows.
+    """
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(ordering):
+            raise InvalidCursor(f"Invalid cursor: {cursor}")
+        values = _typed_values(queryset.model, ordering, values, cursor)
+        queryset = queryset.filter(_after(ordering, values))
+
+    rows = list(queryset[: page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor([_cursor_value(row_value(last, key)) for key in ordering])
+    return rows, next_cursor
+
+
+def wants_cursor_page(request):
+    """Cursor pagination is opt-in so existing clients keep receiving full lists."""
+    params = request.query_params
+    return "cursor" in params or "page_size" in params
+
+
+def get_page_size(request):
+    page_size = int(request.query_params.get("page_size", DEFAULT_PAGE_SIZE))
+    if page_size < 1:
+        raise ValueError("page_size must be positive")
+    return min(page_size, MAX_PAGE_SIZE)
+
+
+def paginated_response(request, queryset, serializer_class, ordering, **kwargs):
+    """
+    Serialize one keyset page as {"results": [...], "next": cursor}.
+
+    The page honours ?fields= / ?expand= on serializers that take a spec,
+    normalized or not.
+    """
+    # Serializer context has no meaning for a projection
+    normalized = not kwargs and wants_normalized(request, serializer_class)
+    eager = hasattr(serializer_class, "setup_eager_loading")
+    spec = FieldSpec.from_request(request) if eager else None
+    projection = None if kwargs else projection_for(serializer_class, normalized, spec)
+    if projection:
+        queryset = projection.values(queryset, *(key.lstrip("-") for key in ordering))
+    elif eager:
+        queryset = serializer_class.setup_eager_loading(queryset, spec)
+        if spec is not None:
+            kwargs["spec"] = spec
+    try:
+        rows, next_cursor = paginate_keyset(
+            queryset,
+            ordering,
+            cursor=request.query_params.get("cursor"),
+            page_size=get_page_size(request),
+        )
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if normalized:
+        included = empty_included()
+        results = normalize_rows(serializer_class, rows, included, spec)
+        return Response(
+            {"results": results, "next": next_cursor, **included}, status=status.HTTP_200_OK
+        )
+    if projection:
+        results = [projection.represent(row) for row in rows]
+    else:
+        results = serializer_class(rows, many=True, **kwargs).data
+    return Response({"results": results, "next": next_cursor}, status=status.HTTP_200_OK)
@@ -0,0 +1,135 @@
+"""
+Checking new listings against saved searches.
+
+Each SavedSearch is filed under bucket keys when it is saved. The key is its
+part if it names one, else its manufacturer, else its category, else the
+grid cells its radius covers, else its longest query word, else "all". A new
+listing works out every key a search it satisfies could be filed under: its
+part, manufacturer and category, the poster's cell, the words of the part,
+and "all". One GIN index lookup (buckets && keys) then returns just the
+searches filed under those keys, and only they are checked in full. The cost
+of a listing therefore follows the number of relevant searches, not the
+number of saved searches.
+
+Query words match whole words after lowercasing and dropping a plural "s",
+so "NEO motors" finds a "NEO Brushless Motor".
+"""
+
+import re
+from django.db.models import Q
+from utils.utils import GridIndex, haversine
+from . import metrics
+from .matching import listing_location
+from .models import PartRequest, SavedSearch
+
+REGION_DEGREES = 1.0
+# Largest radius a saved search may use; wider ones would be filed under hundreds of cells
+MAX_RADIUS_MILES = 500
+
+CANDIDATES = metrics.register(
+    "saved_search_candidates", "Saved searches checked in full against a new listing"
+)
+HITS = metrics.register("saved_search_hits", "Saved searches a new listing matched")
+
+_grid = GridIndex(cell_degrees=REGION_DEGREES)
+
+
+def terms(text):
+    """Lowercase words of `text`, with a trailing plural "s" dropped."""
+    words = re.findall(r"[a-z0-9]+", (text or "").lower())
+    return {word[:-1] if len(word) > 3 and word.endswith("s") else word for word in words}
+
+
+def _region(cell):
+    row, column = cell
+    return f"region:{row}.{column}"
+
+
+def search_buckets(search):
+    """Index keys a saved search is filed under: its most selective criterion."""
+    if search.part_id:
+        return [f"part:{search.part_id}"]
+    if search.manufacturer_id:
+        return [f"manufacturer:{search.manufacturer_id}"]
+    if search.category_id:
+        return [f"category:{search.category_id}"]
+    if search.radius_miles is not None and search.latitude is not None:
+        cells = _grid.cells_within(search.latitude, search.longitude, search.radius_miles)
+        return [_region(cell) for cell in cells]
+    words = terms(search.query)
+    if words:
+        # Longer words tend to be rarer; any one word will do, as all must match
+        return [f"term:{max(sorted(words), key=len)}"]
+    return ["all"]
+
+
+def part_terms(part):
+    """Words a query can match on a part."""
+    names = [part.name, part.model_id]
+    if part.manufacturer_id:
+        names.append(part.manufacturer.name)
+    if part.category_id:
+        names.append(part.category.name)
+    return terms(" ".join(name for name in names if name))
+
+
+def listing_buckets(listing, words, location):
+    """Every key a search `listing` satisfies could be filed under."""
+    part = listing.part
+    keys = ["all", f"part:{part.id}"]
+    if part.manufacturer_id:
+        keys.append(f"manufacturer:{part.manufacturer_id}")
+    if part.category_id:
+        keys.append(f"category:{part.category_id}")
+    if location is not None:
+        keys.append(_region(_grid.cell(*location)))
+    keys += [f"term:{word}" for word in sorted(words)]
+    return keys
+
+
+def search_matches(search, listing, kind, words, location):
+    """Whether `listing` (of `kind`) meets every criterion `search` sets."""
+    part = listing.part
+    if search.kind is not None and search.kind != kind:
+        return False
+    if search.part_id is not None and search.part_id != part.id:
+        return False
+    if search.manufacturer_id is not None and search.manufacturer_id != part.manufacturer_id:
+        return False
+    if search.category_id is not None and search.category_id != part.category_id:
+        return False
+    if search.query and not terms(search.query) <= words:
+        return False
+    if search.max_price is not None and kind == SavedSearch.SALES:
+        if listing.ask_price > search.max_price:
+            return False
+    if search.radius_miles is not None:
+        if location is None or search.latitude is None:
+            return False
+        if haversine(search.latitude, search.longitude, *location) > search.radius_miles:
+            return False
+    return True
+
+
+def percolate(model, pk):
+    """(listing, saved searches of other teams it matches) for a new request or sale."""
+    listing = (
+        model.objects.select_related("part__manufacturer", "part__category", "user__address")
+        .filter(pk=pk)
+        .first()
+    )
+    if listing is None:
+        return None, []
+    kind = SavedSearch.REQUESTS if model is PartRequest else SavedSearch.SALES
+    words = part_terms(listing.part)
+    location = listing_location(listing)
+    candidates = list(
+        SavedSearch.objects.filter(buckets__overlap=listing_buckets(listing, words, location))
+        .filter(Q(kind__isnull=True) | Q(kind=kind))
+        .exclude(user_id=listing.user_id)
+        .select_related("user")
+    )
+    hits = [search for search in candidates if search_matches(search, listing, kind, words, location)]
+    metrics.incr(CANDIDATES, len(candidates))
+    metrics.incr(HITS, len(hits))
+    return listing, hits
@@ -0,0 +1,61 @@
+"""
+Which teams have a chat socket open, kept in Redis next to the shared cache.
+
+Each team has a sorted set of its open connections (channel names), scored by
+the time each one expires. UserConsumer re-adds its entry every
+HEARTBEAT_INTERVAL seconds and removes it on disconnect, so a socket lost in a
+crash drops out after PRESENCE_TTL. ZADD and ZREM touch only the caller's own
+member, so tabs and workers updating the same team never overwrite each other.
+"""
+
+import time
+from django.core.cache import cache
+
+PRESENCE_TTL = 90
+HEARTBEAT_INTERVAL = 30
+
+
+def _redis():
+    # The cache API has no sorted sets; use the RedisCache backend's own client
+    return cache._cache.get_client(write=True)
+
+
+def _key(team_number):
+    return cache.make_and_validate_key(f"presence:{team_number}")
+
+
+def heartbeat(team_number, connection_id):
+    """Mark one socket of `team_number` as alive for another PRESENCE_TTL seconds."""
+    now = time.time()
+    key = _key(team_number)
+    pipeline = _redis().pipeline()
+    pipeline.zadd(key, {connection_id: now + PRESENCE_TTL})
+    pipeline.zremrangebyscore(key, "-inf", now)
+    # The whole set goes once its newest socket stops heartbeating
+    pipeline.expire(key, PRESENCE_TTL)
+    pipeline.execute()
+
+
+def leave(team_number, connection_id):
+    """Forget one socket; the team stays online while it has others."""
+    _redis().zrem(_key(team_number), connection_id)
+
+
+def is_online(team_number):
+    return _redis().zcount(_key(team_number), f"({time.time()}", "+inf") > 0
+
+
+def online_teams(team_numbers):
+    """The subset of `team_numbers` with at least one live socket, in one round trip."""
+    team_numbers = list(team_numbers)
+    if not team_numbers:
+        return set()
+    now = f"({time.time()}"
+    pipeline = _redis().pipeline(transaction=False)
+    for team_number in team_numbers:
+        pipeline.zcount(_key(team_number), now, "+inf")
+    return {
+        team_number
+        for team_number, live in zip(team_numbers, pipeline.execute())
+        if live
+    }
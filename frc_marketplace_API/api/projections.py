@@ -0,0 +1,322 @@
+"""
+Serializer-equivalent rows read with .values(), for the large read endpoints.
+
+A projection selects exactly the columns its serializer shows (nested rows
+included) in one joined query and builds the same dicts as the serializer,
+without creating model instances or walking the serializer field by field for
+every row. The serializers stay the single definition of the payload: declared
+fields and their to_representation come from them, and only each
+serializer's hand-written to_representation is mirrored here. The tests render
+both and compare the bytes.
+"""
+
+from functools import lru_cache
+from django.conf import settings
+from rest_framework.relations import RelatedField
+from .models import Part
+from .renderers import NormalizedJSONRenderer
+from .serializers import (
+    FieldSpec,
+    PartCategorySerializer,
+    PartManufacturerSerializer,
+    PartRequestSerializer,
+    PartSaleSerializer,
+    PartSerializer,
+    PublicUserSerializer,
+)
+
+
+class RowProjection:
+    """
+    Builds `serializer_class` output from .values() rows.
+
+    `nested` maps an output key to (relation, projection class, reference) for
+    nested serializers, where `reference` is the key that holds the nested
+    object's `key_field` in normalized rows and in rows that do not expand it.
+    `extra_columns` are columns only `finish` reads; `computed_columns` are
+    those an output key the serializer adds itself needs. A FieldSpec narrows
+    all of these to what the client asked for, as it does for the serializer.
+    """
+
+    serializer_class = None
+    nested = {}
+    extra_columns = ()
+    computed_columns = {}
+    # Read but not converted, because `finish` replaces them
+    raw_fields = ()
+    # Where normalized payloads collect this projection's objects, and their key
+    collection = None
+    key_field = "id"
+
+    def __init__(self, prefix="", spec=None):
+        self.prefix = prefix
+        self.spec = spec
+        self.scalars = []
+        for name, field in self.serializer_class(spec=spec).fields.items():
+            if field.write_only:
+                continue
+            # Primary key fields render the raw column value
+            raw = isinstance(field, RelatedField) or name in self.raw_fields
+            convert = None if raw else field.to_representation
+            self.scalars.append((name, prefix + field.source, convert))
+        # (key, relation, projection, reference, embedded), in serializer order
+        self.children = []
+        for key, (relation, projection, reference) in self.nested.items():
+            if not self.includes(key):
+                continue
+            embedded = spec is None or spec.embeds(key)
+            child_spec = None if spec is None else spec.child(key)
+            child = projection(f"{prefix}{relation}__", child_spec)
+            self.children.append((key, prefix + relation, child, reference, embedded))
+        # What the serializer gives for a null relation
+        self.empty = dict(self.serializer_class(None, spec=spec).data) if prefix else None
+
+    def includes(self, name):
+        return self.spec is None or self.spec.includes(name)
+
+    def columns(self):
+        """Every .values() lookup this projection and its children read."""
+        columns = [column for _, column, _ in self.scalars]
+        columns += [self.prefix + column for column in self.extra_columns]
+        for name, computed in self.computed_columns.items():
+            if self.includes(name):
+                columns += [self.prefix + column for column in computed]
+        for _, relation, child, _, embedded in self.children:
+            columns.append(relation)
+            if embedded:
+                # Normalized payloads key the object even when ?fields= leaves its key out
+                columns += child.columns() + child.reference_columns()
+            elif child.key_field != "id":
+                columns += child.reference_columns()
+        return list(dict.fromkeys(columns))
+
+    def reference_columns(self):
+        """Columns `reference` reads."""
+        return [self.prefix + column for column in (self.key_field, *self.extra_columns)]
+
+    def column(self, row, name):
+        return row[self.prefix + name]
+
+    def reference(self, row):
+        """How rows that do not expand this object refer to it."""
+        return self.column(row, self.key_field)
+
+    def represent_scalars(self, row):
+        data = {}
+        for name, column, convert in self.scalars:
+            value = row[column]
+            data[name] = value if value is None or convert is None else convert(value)
+        return data
+
+    def represent(self, row):
+        data = self.represent_scalars(row)
+        for key, relation, child, reference, embedded in self.children:
+            if embedded:
+                data[key] = child.empty if row[relation] is None else child.represent(row)
+            elif child.key_field == "id":
+                # The foreign key column already holds it
+                data[reference] = row[relation]
+            else:
+                data[reference] = None if row[relation] is None else child.reference(row)
+        return self.finish(row, data)
+
+    def represent_normalized(self, row, included):
+        """
+        Like represent, with nested objects moved into `included` and referenced
+        by key. Objects the spec does not expand are referenced but not sideloaded.
+        """
+        data = self.represent_scalars(row)
+        for _, relation, child, reference, embedded in self.children:
+            if row[relation] is None:
+                data[reference] = None
+            elif embedded:
+                data[reference] = child.include(row, included)
+            else:
+                data[reference] = row[relation] if child.key_field == "id" else child.reference(row)
+        return self.finish(row, data)
+
+    def include(self, row, included):
+        """Add this row's object to `included` once and return its key, or None if hidden."""
+        key = row[self.prefix + self.key_field]
+        if key is None:
+            return None
+        objects = included.setdefault(self.collection, {})
+        name = str(key)
+        if name not in objects:
+            objects[name] = self.represent_normalized(row, included)
+        return key if objects[name] is not None else None
+
+    def finish(self, row, data):
+        """The serializer's own to_representation adjustments."""
+        return data
+
+    def values(self, queryset, *extra):
+        """`queryset` as .values() rows carrying these columns and any `extra` ones."""
+        return queryset.values(*dict.fromkeys([*self.columns(), *extra]))
+
+    def rows(self, queryset):
+        return [self.represent(row) for row in self.values(queryset)]
+
+
+class PartManufacturerProjection(RowProjection):
+    serializer_class = PartManufacturerSerializer
+    collection = "manufacturers"
+
+
+class PartCategoryProjection(RowProjection):
+    serializer_class = PartCategorySerializer
+    collection = "categories"
+
+
+class PartProjection(RowProjection):
+    serializer_class = PartSerializer
+    nested = {
+        "manufacturer": ("manufacturer", PartManufacturerProjection, "manufacturer_id"),
+        "category": ("category", PartCategoryProjection, "category_id"),
+    }
+    raw_fields = ("image",)
+    collection = "parts"
+
+    def finish(self, row, data):
+        if self.includes("image"):
+            image = self.column(row, "image")
+            data["image"] = Part._meta.get_field("image").storage.url(image) if image else None
+        return data
+
+
+class PublicUserProjection(RowProjection):
+    serializer_class = PublicUserSerializer
+    # Team numbers are how users are identified everywhere else in the API
+    collection = "users"
+    key_field = "team_number"
+    extra_columns = ("is_superuser", "is_staff", "is_active")
+    computed_columns = {
+        "formatted_address": (
+            "address",
+            "address__locality",
+            "address__locality__name",
+            "address__locality__state__name",
+            "address__latitude",
+            "address__longitude",
+        ),
+    }
+
+    def is_public(self, row):
+        column = lambda name: self.column(row, name)
+        return not (column("is_superuser") or column("is_staff") or not column("is_active"))
+
+    def reference(self, row):
+        return super().reference(row) if self.is_public(row) else None
+
+    def finish(self, row, data):
+        if not self.is_public(row):
+            return None
+        column = lambda name: self.column(row, name)
+        if self.includes("formatted_address") and column("address") is not None:
+            has_locality = column("address__locality") is not None
+            data["formatted_address"] = {
+                "city": column("address__locality__name") if has_locality else "Unknown",
+                "state": column("address__locality__state__name") if has_locality else "Unknown",
+                "latitude": column("address__latitude") or 0,
+                "longitude": column("address__longitude") or 0,
+            }
+        return data
+
+
+class ListingProjection(RowProjection):
+    nested = {
+        "part": ("part", PartProjection, "part_id"),
+        "user": ("user", PublicUserProjection, "user_team_number"),
+    }
+
+
+class PartRequestProjection(ListingProjection):
+    serializer_class = PartRequestSerializer
+
+
+class PartSaleProjection(ListingProjection):
+    serializer_class = PartSaleSerializer
+
+
+# Sideloaded dictionaries of a normalized payload, always present even if empty
+INCLUDED_COLLECTIONS = ("parts", "users", "manufacturers", "categories")
+
+PROJECTIONS = {
+    PartSerializer: PartProjection,
+    PublicUserSerializer: PublicUserProjection,
+    PartRequestSerializer: PartRequestProjection,
+    PartSaleSerializer: PartSaleProjection,
+}
+
+
+# Specs come from query strings, so only the most recent ones are kept
+@lru_cache(maxsize=256)
+def _projection(serializer_class, spec=None):
+    return PROJECTIONS[serializer_class](spec=spec)
+
+
+def projection_for(serializer_class, force=False, spec=None):
+    """
+    The projection standing in for `serializer_class`, or None to serialize normally.
+
+    `force` ignores API_FAST_ROWS, for callers that need rows (normalized payloads).
+    """
+    if serializer_class not in PROJECTIONS or not (force or settings.API_FAST_ROWS):
+        return None
+    return _projection(serializer_class, spec)
+
+
+def serialize_many(serializer_class, queryset, spec=None):
+    """List data for `queryset`, built by its projection when it has one."""
+    projection = projection_for(serializer_class, spec=spec)
+    if projection is None:
+        return serializer_class(queryset, many=True, spec=spec).data
+    return projection.rows(queryset)
+
+
+def normalized_format(request):
+    """True when the client asked for ?format=normalized."""
+    renderer = getattr(request, "accepted_renderer", None)
+    return renderer is not None and renderer.format == NormalizedJSONRenderer.format
+
+
+def wants_normalized(request, serializer_class):
+    """True for ?format=normalized on a serializer with nested rows to sideload."""
+    return (
+        normalized_format(request)
+        and serializer_class in PROJECTIONS
+        and bool(PROJECTIONS[serializer_class].nested)
+    )
+
+
+def empty_included():
+    return {collection: {} for collection in INCLUDED_COLLECTIONS}
+
+
+def normalize_rows(serializer_class, rows, included, spec=None):
+    """Normalized output for .values() `rows` read for `spec`, sideloading into `included`."""
+    projection = _projection(serializer_class, spec)
+    results = [projection.represent_normalized(row, included) for row in rows]
+    # Hidden users are only marked so they are looked at once; drop the markers
+    for objects in included.values():
+        for name in [name for name, value in objects.items() if value is None]:
+            del objects[name]
+    return results
+
+
+def normalized_list(serializer_class, queryset, spec=None):
+    """{"results": rows, <collection>: {key: object}} for a whole list."""
+    included = empty_included()
+    rows = _projection(serializer_class, spec).values(queryset)
+    return {"results": normalize_rows(serializer_class, rows, included, spec), **included}
+
+
+def list_data(request, serializer_class, queryset):
+    """
+    Payload for a full list endpoint, normalized when asked for, narrowed to
+    ?fields= / ?expand= either way.
+    """
+    spec = FieldSpec.from_request(request)
+    if wants_normalized(request, serializer_class):
+        return normalized_list(serializer_class, queryset, spec)
+    return serialize_many(serializer_class, queryset, spec)
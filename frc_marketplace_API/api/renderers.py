@@ -0,0 +1,42 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# Serialized natively by orjson exactly as JSONEncoder would; everything else
+# (datetimes, Decimals, lazy strings, ...) goes through JSONEncoder.default
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when producing the default compact output.
+
+    The bytes match JSONRenderer's, including its escaping of U+2028/U+2029,
+    except for floats orjson writes in exponent form (1e16 rather than 1e+16),
+    which no payload here produces. Indented or ASCII-only output is left to
+    JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+        if indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=JSONEncoder().default, option=ORJSON_OPTIONS)
+        # Same escaping as JSONRenderer: these are valid JSON but not valid JavaScript
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+
+class NormalizedJSONRenderer(ORJSONRenderer):
+    """
+    Picked with ?format=normalized.
+
+    The bytes are plain JSON; list views that support it see this renderer and
+    return rows that reference sideloaded parts, users, manufacturers and
+    categories instead of nesting them (see api/projections.py).
+    """
+
+    format = "normalized"
@@ -0,0 +1,97 @@
+"""
+Shared cache of rendered list responses, invalidated by per-model version stamps.
+
+Each cached endpoint names the models its payload is built from. The cache key
+combines the endpoint, the query string and the current version of each of
+those models, and signals.py bumps a model's version after any save or delete
+commits. Old entries are never deleted, they just stop being looked up and
+expire after RESPONSE_CACHE_TTL. Writes that skip signals (queryset.update(),
+raw SQL) show up once that TTL runs out.
+
+Bodies are stored as the zlib-compressed JSON that DRF rendered on the miss,
+so a hit does no serializer or renderer work.
+"""
+
+import hashlib
+import time
+import zlib
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from . import metrics
+
+HITS = metrics.register("response_cache_hits", "List responses served from the response cache")
+MISSES = metrics.register("response_cache_misses", "List responses rendered and stored in the response cache")
+
+
+def _version_key(model):
+    return f"version:{model._meta.label_lower}"
+
+
+def get_versions(models):
+    """Current version stamp of each model, in order, in one cache round trip."""
+    keys = [_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Start evicted or new stamps at the clock so they never reuse an old value
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_version(model):
+    """Invalidate every cached response built from `model`."""
+    key = _version_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def response_key(endpoint, request, models):
+    params = sorted(request.query_params.lists())
+    digest = hashlib.sha1(repr(params).encode()).hexdigest()
+    versions = ".".join(str(version) for version in get_versions(models))
+    return f"response:{endpoint}:{digest}:{versions}"
+
+
+def cached_response(endpoint, models):
+    """
+    Cache successful JSON GET responses of a DRF function view.
+
+    Goes below @api_view, so content negotiation has already picked the
+    renderer; other methods and non-JSON formats pass straight through.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            renderer = getattr(request, "accepted_renderer", None)
+            if request.method != "GET" or not isinstance(renderer, JSONRenderer):
+                return view(request, *args, **kwargs)
+
+            key = response_key(endpoint, request, models)
+            body = cache.get(key)
+            if body is not None:
+                metrics.incr(HITS)
+                return HttpResponse(zlib.decompress(body), content_type="application/json")
+
+            metrics.incr(MISSES)
+            response = view(request, *args, **kwargs)
+            if isinstance(response, Response) and response.status_code == status.HTTP_200_OK:
+                # Store the body DRF renders anyway instead of rendering it twice
+                response.add_post_render_callback(
+                    lambda rendered: cache.set(
+                        key, zlib.compress(rendered.content), settings.RESPONSE_CACHE_TTL
+                    )
+                )
+            return response
+
+        return wrapper
+
+    return decorator
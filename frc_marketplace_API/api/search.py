@@ -0,0 +1,183 @@
+"""Ranked catalog search backed by Postgres full-text and trigram indexes."""
+
+import uuid
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramSimilarity,
+)
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Coalesce
+from .models import Part, PartRequest, PartSale, User
+from .pagination import InvalidCursor, decode_cursor, encode_cursor, row_value
+
+SEARCH_CONFIG = "english"
+SEARCH_TYPES = ("users", "parts", "requests", "sales")
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+
+def part_search_vector(part):
+    """Weighted tsvector for a part: name/model, then brand/category, then description."""
+    manufacturer = part.manufacturer.name if part.manufacturer_id else ""
+    category = part.category.name if part.category_id else ""
+    return (
+        SearchVector(Value(part.name), weight="A", config=SEARCH_CONFIG)
+        + SearchVector(Value(part.model_id or ""), weight="A", config=SEARCH_CONFIG)
+        + SearchVector(Value(manufacturer), weight="B", config=SEARCH_CONFIG)
+        + SearchVector(Value(category), weight="B", config=SEARCH_CONFIG)
+        + SearchVector(Value(part.description or ""), weight="C", config=SEARCH_CONFIG)
+    )
+
+
+def update_part_search_vector(part):
+    """Recompute the stored search vector for a single part."""
+    Part.objects.filter(pk=part.pk).update(search_vector=part_search_vector(part))
+
+
+def parse_team_number(q):
+    """Return the team number a query refers to ("254", "frc254"), if any."""
+    value = q.strip().lower().removeprefix("frc")
+    return int(value) if value.isdigit() else None
+
+
+def _similarity(field, q, weight=1.0):
+    return Coalesce(
+        TrigramSimilarity(field, q), Value(0.0), output_field=FloatField()
+    ) * Value(weight)
+
+
+def _text_rank(field, ts_query):
+    return Coalesce(
+        SearchRank(F(field), ts_query), Value(0.0), output_field=FloatField()
+    )
+
+
+def _team_bonus(field, team_number):
+    if team_number is None:
+        return Value(0.0)
+    return Case(
+        When(**{field: team_number}, then=Value(1.0)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def _part_match(q, ts_query, prefix=""):
+    return (
+        Q(**{f"{prefix}search_vector": ts_query})
+        | Q(**{f"{prefix}name__trigram_similar": q})
+        | Q(**{f"{prefix}model_id__iexact": q})
+        | Q(**{f"{prefix}manufacturer__name__trigram_similar": q})
+        | Q(**{f"{prefix}category__name__trigram_similar": q})
+    )
+
+
+def _part_rank(q, ts_query, prefix=""):
+    return (
+        _text_rank(f"{prefix}search_vector", ts_query)
+        + _similarity(f"{prefix}name", q)
+        + _similarity(f"{prefix}manufacturer__name", q, 0.5)
+        + _similarity(f"{prefix}category__name", q, 0.5)
+    )
+
+
+def _ranked_parts(q, ts_query, team_number):
+    return (
+        Part.objects.select_related("manufacturer", "category")
+        .filter(_part_match(q, ts_query))
+        .annotate(rank=_part_rank(q, ts_query))
+    )
+
+
+def _ranked_listings(model, q, ts_query, team_number):
+    match = _part_match(q, ts_query, "part__") | Q(user__team_name__trigram_similar=q)
+    if team_number is not None:
+        match |= Q(user__team_number=team_number)
+    return (
+        model.objects.select_related(
+            "part__manufacturer", "part__category", "user__address__locality__state"
+        )
+        .filter(match)
+        .annotate(
+            rank=_part_rank(q, ts_query, "part__")
+            + _similarity("user__team_name", q, 0.5)
+            + _team_bonus("user__team_number", team_number)
+        )
+    )
+
+
+def _ranked_users(q, ts_query, team_number):
+    match = Q(team_name__trigram_similar=q)
+    if team_number is not None:
+        match |= Q(team_number=team_number)
+    return (
+        User.objects.public()
+        .select_related("address__locality__state")
+        .filter(match)
+        .annotate(
+            rank=_similarity("team_name", q)
+            + _team_bonus("team_number", team_number)
+        )
+    )
+
+
+_RANKERS = {
+    "users": _ranked_users,
+    "parts": _ranked_parts,
+    "requests": lambda *args: _ranked_listings(PartRequest, *args),
+    "sales": lambda *args: _ranked_listings(PartSale, *args),
+}
+
+
+def _decode_search_cursor(cursor):
+    """The (rank, id) position a search cursor points after."""
+    values = decode_cursor(cursor)
+    if len(values) != 2:
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+    rank, last_id = values
+    if isinstance(rank, bool) or not isinstance(rank, (int, float)):
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+    try:
+        return float(rank), uuid.UUID(str(last_id))
+    except ValueError as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+
+def search(q, types=SEARCH_TYPES, limit=DEFAULT_LIMIT, cursors=None, projections=None):
+    """
+    Run a ranked search for `q` over each requested type.
+
+    Returns {type: (instances, next_cursor)} with at most `limit` hits per type,
+    ordered by descending rank. Cursors are keyset positions (rank, id), so
+    paging never rescans earlier hits. Types with a projection in `projections`
+    come back as .values() rows for that projection instead of instances.
+    """
+    cursors = cursors or {}
+    projections = projections or {}
+    ts_query = SearchQuery(q, search_type="websearch", config=SEARCH_CONFIG)
+    team_number = parse_team_number(q)
+
+    results = {}
+    for search_type in types:
+        queryset = _RANKERS[search_type](q, ts_query, team_number)
+        if cursors.get(search_type):
+            rank, last_id = _decode_search_cursor(cursors[search_type])
+            queryset = queryset.filter(
+                Q(rank__lt=rank) | Q(rank=rank, id__gt=last_id)
+            )
+        projection = projections.get(search_type)
+        if projection:
+            queryset = projection.values(queryset, "id", "rank")
+        hits = list(queryset.order_by("-rank", "id")[: limit + 1])
+
+        next_cursor = None
+        if len(hits) > limit:
+            hits = hits[:limit]
+            last = hits[-1]
+            next_cursor = encode_cursor(
+                [row_value(last, "rank"), str(row_value(last, "id"))]
+            )
+        results[search_type] = (hits, next_cursor)
+    return results
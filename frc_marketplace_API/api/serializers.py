@@ -2,6 +2,7 @@
 from django.forms import ValidationError
 from rest_framework import serializers
 from .models import (
+    ListingMatch,
     PartSale,
     User,
     Part,
@@ -9,18 +10,220 @@ from .models import (
     Message,
     PartManufacturer,
     PartCategory,
+    SavedSearch,
 )
-import googlemaps
+from .percolator import MAX_RADIUS_MILES
 from address.models import State, Country, Locality, Address
-from decouple import config
-from utils.geolocation import get_coordinates
+from utils.geolocation import geocode, coordinates_from_result
 from utils.blueAlliance import getTeamName
+from django.core.exceptions import FieldDoesNotExist
 from django.core.files.images import get_image_dimensions
+from django.db.models import QuerySet
 
 
-class UserSerializer(serializers.ModelSerializer):
+def _parse_paths(value):
+    """"a,b.c,b.d" -> {"a": {}, "b": {"c": {}, "d": {}}}"""
+    tree = {}
+    for path in value.split(","):
+        node = tree
+        for name in filter(None, (name.strip() for name in path.split("."))):
+            node = node.setdefault(name, {})
+    return tree
+
+
+def _freeze(tree):
+    return None if tree is None else tuple(sorted((k, _freeze(v)) for k, v in tree.items()))
+
+
+class FieldSpec:
+    """
+    The fields and embedded objects a client asked for with ?fields= and ?expand=.
+
+    Both take comma separated, dotted paths (fields=id,part.name&expand=part).
+    Without ?fields= every field is included; naming a nested object without
+    sub-fields includes all of its fields. Without ?expand= every nested object
+    is embedded as before; with it, only the listed ones are, and the others
+    appear as a reference (e.g. part_id) instead.
+    """
+
+    def __init__(self, fields=None, expand=None):
+        self.fields = fields
+        self.expand = expand
+
+    @classmethod
+    def from_request(cls, request):
+        """The spec in `request`'s query string, or None when it has neither parameter."""
+        params = request.query_params
+        if "fields" not in params and "expand" not in params:
+            return None
+        return cls(
+            _parse_paths(params["fields"]) if "fields" in params else None,
+            _parse_paths(params["expand"]) if "expand" in params else None,
+        )
+
+    def includes(self, name):
+        return self.fields is None or name in self.fields
+
+    def embeds(self, name):
+        return self.expand is None or name in self.expand
+
+    def child(self, name):
+        """The spec for the object nested under `name`."""
+        return FieldSpec(
+            (self.fields or {}).get(name) or None,
+            None if self.expand is None else self.expand.get(name, {}),
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, FieldSpec) and hash(self) == hash(other)
+
+    def __hash__(self):
+        return hash((_freeze(self.fields), _freeze(self.expand)))
+
+
+def _hops(lookup):
+    """"a__b__c" -> ["a", "a__b", "a__b__c"]"""
+    names = lookup.split("__")
+    return ["__".join(names[: i + 1]) for i in range(len(names))]
+
+
+class EagerLoadingMixin:
+    """
+    Lets a serializer declare the joins it walks so querysets are loaded up front.
+
+    `select_related_fields` / `prefetch_related_fields` list this serializer's own
+    relations; `nested_serializers` maps a relation name to the serializer used to
+    render it, whose plan is folded in under that prefix. Passing a QuerySet with
+    many=True applies the plan automatically.
+
+    With a FieldSpec (the `spec` argument) only the requested fields are rendered
+    and loaded: `nested_references` names the key a nested object's reference
+    goes under when it is not expanded, `key_field` is what other serializers
+    reference this one by, `required_columns` are read by to_representation
+    regardless of fields, and `computed_fields` maps output keys that are not
+    declared fields to the (select_related, columns) lookups they read.
+    """
+
+    select_related_fields = ()
+    prefetch_related_fields = ()
+    nested_serializers = {}
+    nested_references = {}
+    key_field = "id"
+    required_columns = ()
+    computed_fields = {}
+
+    def __init__(self, *args, spec=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.spec = spec
+        if spec is not None and spec.fields is not None:
+            for name in [name for name in self.fields if not spec.includes(name)]:
+                self.fields.pop(name)
+
+    def includes(self, name):
+        return self.spec is None or self.spec.includes(name)
+
+    @classmethod
+    def reference_to(cls, obj):
+        """How other serializers refer to `obj` when it is not expanded."""
+        return None if obj is None else getattr(obj, cls.key_field)
+
+    def represent_nested(self, data, instance):
+        """Embed each nested object, or reference it when the spec does not expand it."""
+        for key, nested in self.nested_serializers.items():
+            if self.spec is None:
+                data[key] = nested(getattr(instance, key)).data
+            elif not self.spec.includes(key):
+                continue
+            elif self.spec.embeds(key):
+                data[key] = nested(getattr(instance, key), spec=self.spec.child(key)).data
+            elif nested.key_field == "id":
+                # The foreign key column already holds it; no join needed
+                data[self.nested_references[key]] = getattr(instance, f"{key}_id")
+            else:
+                data[self.nested_references[key]] = nested.reference_to(getattr(instance, key))
+        return data
+
+    @classmethod
+    def get_sparse_plan(cls, spec, prefix=""):
+        """Return (select_related, only) lookups that load just what `spec` renders."""
+        model = cls.Meta.model
+        select, only = [], [prefix + model._meta.pk.name]
+        for name, field in cls().fields.items():
+            if field.write_only or not spec.includes(name):
+                continue
+            try:
+                model_field = model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                continue
+            if model_field.concrete:
+                only.append(prefix + model_field.name)
+        only += [prefix + column for column in cls.required_columns]
+        for name, (relations, columns) in cls.computed_fields.items():
+            if spec.includes(name):
+                select += [prefix + relation for relation in relations]
+                only += [prefix + hop for column in columns for hop in _hops(column)]
+        for key, nested in cls.nested_serializers.items():
+            if not spec.includes(key):
+                continue
+            if spec.embeds(key):
+                nested_select, nested_only = nested.get_sparse_plan(
+                    spec.child(key), f"{prefix}{key}__"
+                )
+                select += [prefix + key, *nested_select]
+                only += [prefix + key, *nested_only]
+            elif nested.key_field == "id":
+                only.append(prefix + key)
+            else:
+                select.append(prefix + key)
+                only += [prefix + key] + [
+                    f"{prefix}{key}__{column}"
+                    for column in (nested.key_field, *nested.required_columns)
+                ]
+        return select, only
+
+    @classmethod
+    def get_eager_loading_plan(cls, prefix=""):
+        """Return (select_related, prefetch_related) lookups for this serializer."""
+        select = [prefix + field for field in cls.select_related_fields]
+        prefetch = [prefix + field for field in cls.prefetch_related_fields]
+        for field, nested in cls.nested_serializers.items():
+            nested_select, nested_prefetch = nested.get_eager_loading_plan(
+                f"{prefix}{field}__"
+            )
+            select.extend(nested_select)
+            prefetch.extend(nested_prefetch)
+        return select, prefetch
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, spec=None):
+        """Apply this serializer's select/prefetch plan to a queryset, narrowed to `spec`."""
+        if spec is not None:
+            select, only = cls.get_sparse_plan(spec)
+            if select:
+                queryset = queryset.select_related(*dict.fromkeys(select))
+            return queryset.only(*dict.fromkeys(only))
+        select, prefetch = cls.get_eager_loading_plan()
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        spec = kwargs.get("spec")
+        if args and isinstance(args[0], QuerySet):
+            args = (cls.setup_eager_loading(args[0], spec),) + args[1:]
+        elif isinstance(kwargs.get("instance"), QuerySet):
+            kwargs["instance"] = cls.setup_eager_loading(kwargs["instance"], spec)
+        return super().many_init(*args, **kwargs)
+
+
+class UserSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     address = serializers.CharField(required=True, write_only=True)
 
+    select_related_fields = ("address",)
+
     class Meta:
         model = User
         fields = [
@@ -40,7 +243,9 @@ class UserSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["id", "date_joined"]
 
-    def create_address_from_components(self, components, raw_address: str) -> Address:
+    def create_address_from_components(
+        self, components, raw_address: str, coordinates
+    ) -> Address:
         """Create storable Address object from Google Maps components"""
 
         def get_component(component_type):
@@ -63,7 +268,7 @@ class UserSerializer(serializers.ModelSerializer):
             defaults={"postal_code": get_component("postal_code") or "N/A"},
         )
 
-        lat, lon = get_coordinates(raw_address)
+        lat, lon = coordinates
 
         # Create address (full or partial)
         address = Address.objects.create(
@@ -79,10 +284,8 @@ class UserSerializer(serializers.ModelSerializer):
 
     def validate_address(self, value) -> Address:
         try:
-            gmaps = googlemaps.Client(key=config("GOOGLE_API_KEY"))
-
-            # Geocode the address
-            geocode_result = gmaps.geocode(value)
+            # Geocode the address (cached, one external call at most)
+            geocode_result = geocode(value)
 
             if not geocode_result:
                 raise ValidationError("Could not verify the provided address")
@@ -95,7 +298,9 @@ class UserSerializer(serializers.ModelSerializer):
 
             # Create new address if it doesn't exist in the database
             return self.create_address_from_components(
-                geocode_result[0]["address_components"], formatted_address
+                geocode_result[0]["address_components"],
+                formatted_address,
+                coordinates_from_result(geocode_result[0]),
             )
 
         except Exception as e:
@@ -135,21 +340,45 @@ class UserSerializer(serializers.ModelSerializer):
         return representation
 
 
-class PublicUserSerializer(serializers.ModelSerializer):
+class PublicUserSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     """Public serializer for the User model."""
 
+    select_related_fields = ("address__locality__state",)
+    # Team numbers are how users are identified everywhere else in the API
+    key_field = "team_number"
+    required_columns = ("is_superuser", "is_staff", "is_active")
+    computed_fields = {
+        "formatted_address": (
+            ("address__locality__state",),
+            (
+                "address__latitude",
+                "address__longitude",
+                "address__locality__name",
+                "address__locality__state__name",
+            ),
+        ),
+    }
+
     class Meta:
         model = User
         fields = ["team_name", "team_number", "profile_photo", "address"]
 
+    @staticmethod
+    def is_public(instance):
+        return not (instance.is_superuser or instance.is_staff or not instance.is_active)
+
+    @classmethod
+    def reference_to(cls, obj):
+        return super().reference_to(obj) if obj is not None and cls.is_public(obj) else None
+
     def to_representation(self, instance):
         """Output representation"""
-        if instance.is_superuser or instance.is_staff or not instance.is_active:
+        if not self.is_public(instance):
             return None
 
         representation = super().to_representation(instance)
 
-        if instance.address:
+        if self.includes("formatted_address") and instance.address:
             representation["formatted_address"] = {
                 "city": instance.address.locality.name if instance.address.locality != None else "Unknown",
                 "state": instance.address.locality.state.name if instance.address.locality != None else "Unknown",
@@ -160,9 +389,32 @@ class PublicUserSerializer(serializers.ModelSerializer):
         return representation
 
 
-class PartSerializer(serializers.ModelSerializer):
+class PartManufacturerSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    """Serializer for the PartManufacturer model."""
+
+    class Meta:
+        model = PartManufacturer
+        fields = ["id", "name", "website"]
+
+
+class PartCategorySerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    """Serializer for the PartCategory model."""
+
+    class Meta:
+        model = PartCategory
+        fields = ["id", "name"]
+
+
+class PartSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     """Serializer for the Part model."""
 
+    select_related_fields = ("manufacturer", "category")
+    nested_serializers = {
+        "manufacturer": PartManufacturerSerializer,
+        "category": PartCategorySerializer,
+    }
+    nested_references = {"manufacturer": "manufacturer_id", "category": "category_id"}
+
     manufacturer_id = serializers.PrimaryKeyRelatedField(
         queryset=PartManufacturer.objects.all(), source="manufacturer"
     )
@@ -208,32 +460,19 @@ class PartSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         """Customize the serialized output."""
-        data = super().to_representation(instance)
-        data["manufacturer"] = PartManufacturerSerializer(instance.manufacturer).data
-        data["category"] = PartCategorySerializer(instance.category).data
-        data["image"] = instance.image.url if instance.image else None
+        data = self.represent_nested(super().to_representation(instance), instance)
+        if self.includes("image"):
+            data["image"] = instance.image.url if instance.image else None
         return data
 
 
-class PartManufacturerSerializer(serializers.ModelSerializer):
-    """Serializer for the PartManufacturer model."""
-
-    class Meta:
-        model = PartManufacturer
-        fields = ["id", "name", "website"]
-
-
-class PartCategorySerializer(serializers.ModelSerializer):
-    """Serializer for the PartCategory model."""
-
-    class Meta:
-        model = PartCategory
-        fields = ["id", "name"]
-
-
-class PartRequestSerializer(serializers.ModelSerializer):
+class PartRequestSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     """Serializer for the PartRequest model."""
 
+    select_related_fields = ("part", "user")
+    nested_serializers = {"part": PartSerializer, "user": PublicUserSerializer}
+    nested_references = {"part": "part_id", "user": "user_team_number"}
+
     # Include part_id for write operations
     part_id = serializers.PrimaryKeyRelatedField(
         queryset=Part.objects.all(), source="part", write_only=True
@@ -262,15 +501,17 @@ class PartRequestSerializer(serializers.ModelSerializer):
         """Customize the serialized output."""
         data = super().to_representation(instance)
 
-        # Optionally include `user` or other computed fields here
-        data["part"] = PartSerializer(instance.part).data  # Include part details
-        data["user"] = PublicUserSerializer(instance.user).data  # Include user details
-        return data
+        # Include part and user details
+        return self.represent_nested(data, instance)
 
 
-class PartSaleSerializer(serializers.ModelSerializer):
+class PartSaleSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     """Serializer for the PartSale model."""
 
+    select_related_fields = ("part", "user")
+    nested_serializers = {"part": PartSerializer, "user": PublicUserSerializer}
+    nested_references = {"part": "part_id", "user": "user_team_number"}
+
     part_id = serializers.PrimaryKeyRelatedField(
         queryset=Part.objects.all(), source="part", write_only=True
     )
@@ -298,15 +539,19 @@ class PartSaleSerializer(serializers.ModelSerializer):
         """Customize the serialized output."""
         data = super().to_representation(instance)
 
-        data["part"] = PartSerializer(instance.part).data
-        data["user"] = PublicUserSerializer(instance.user).data
-        return data
+        return self.represent_nested(data, instance)
 
 
-class MessageSerializer(serializers.ModelSerializer):
+class MessageSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     sender = serializers.SerializerMethodField()
     receiver = serializers.SerializerMethodField()
 
+    select_related_fields = ("sender", "receiver")
+    computed_fields = {
+        "sender": (("sender",), ("sender__team_number",)),
+        "receiver": (("receiver",), ("receiver__team_number",)),
+    }
+
     class Meta:
         model = Message
         fields = ["id", "sender", "receiver", "message", "timestamp"]
@@ -326,3 +571,85 @@ class MessageSerializer(serializers.ModelSerializer):
         return Message.objects.create(
             sender_id=sender_id, receiver=receiver, **validated_data
         )
+
+
+class ListingMatchSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    """Serializer for the ListingMatch model, with both listings nested."""
+
+    select_related_fields = ("request", "sale")
+    nested_serializers = {"request": PartRequestSerializer, "sale": PartSaleSerializer}
+    nested_references = {"request": "request_id", "sale": "sale_id"}
+
+    class Meta:
+        model = ListingMatch
+        fields = ["id", "score", "distance_miles", "created_at"]
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        return self.represent_nested(data, instance)
+
+
+class SavedSearchSerializer(serializers.ModelSerializer):
+    """Serializer for the SavedSearch model; the search belongs to the requesting user."""
+
+    part_id = serializers.PrimaryKeyRelatedField(
+        queryset=Part.objects.all(), source="part", allow_null=True, required=False
+    )
+    manufacturer_id = serializers.PrimaryKeyRelatedField(
+        queryset=PartManufacturer.objects.all(),
+        source="manufacturer",
+        allow_null=True,
+        required=False,
+    )
+    category_id = serializers.PrimaryKeyRelatedField(
+        queryset=PartCategory.objects.all(),
+        source="category",
+        allow_null=True,
+        required=False,
+    )
+
+    class Meta:
+        model = SavedSearch
+        fields = [
+            "id",
+            "name",
+            "kind",
+            "query",
+            "part_id",
+            "manufacturer_id",
+            "category_id",
+            "max_price",
+            "radius_miles",
+            "created_at",
+        ]
+        read_only_fields = ["created_at"]
+
+    def validate_radius_miles(self, value):
+        if value is not None and not 0 < value <= MAX_RADIUS_MILES:
+            raise serializers.ValidationError(
+                f"Radius must be between 0 and {MAX_RADIUS_MILES} miles"
+            )
+        return value
+
+    def validate(self, attrs):
+        merged = {
+            field: attrs.get(field, getattr(self.instance, field, None))
+            for field in ("query", "part", "manufacturer", "category", "max_price", "radius_miles")
+        }
+        if not any(value not in (None, "") for value in merged.values()):
+            raise serializers.ValidationError("Set at least one search criterion")
+        if merged["radius_miles"] is not None:
+            address = self.context["request"].user.address
+            if address is None or address.latitude is None or address.longitude is None:
+                raise serializers.ValidationError(
+                    {"radius_miles": "A radius needs an address with coordinates"}
+                )
+            attrs["latitude"], attrs["longitude"] = address.latitude, address.longitude
+        else:
+            attrs["latitude"] = attrs["longitude"] = None
+        return attrs
+
+    def create(self, validated_data):
+        """Add the requesting user to the validated data."""
+        validated_data["user"] = self.context["request"].user
+        return super().create(validated_data)
@@ -1,8 +1,26 @@
-from django.db.models.signals import pre_save, post_save
+from django.db.models.signals import pre_save, post_save, post_delete, pre_migrate
 from django.dispatch import receiver
-from django.db import models, connection
-from .models import User
-from .tasks import send_activation_email
+from django.db import connections, transaction
+from .models import (
+    ChangeLog,
+    User,
+    Part,
+    PartManufacturer,
+    PartCategory,
+    PartRequest,
+    PartSale,
+)
+from .tasks import (
+    claim_activation_email,
+    match_listing_task,
+    percolate_listing_task,
+    send_activation_email,
+)
+from .search import update_part_search_vector
+from .message_buffer import team_users
+from .response_cache import bump_version
+from .changes import FEED_KINDS, record_change
+from . import listing_feed
 import logging
 
 logger = logging.getLogger(__name__)
@@ -20,47 +38,179 @@ def register_signals():
 @receiver(pre_save, sender=User, dispatch_uid="user_activation_signal")
 def user_activation_handler(sender, instance, raw=False, **kwargs):
     """
-    Signal handler to send activation email when a user's is_active status changes from False to True.
-    This handles both Django ORM updates and direct database changes via pgAdmin.
+    Queue the activation email when a loaded user's is_active flips from False to True.
+
+    The previous value comes from the model's load-time snapshot, so ordinary saves
+    cost no extra query. Activations made directly in the database are picked up by
+    tasks.send_pending_activation_emails instead.
+    """
+    if raw or "is_active" not in instance.changed_fields or not instance.is_active:
+        return
+
+    user_id = instance.id
+    # Users flagged at signup are claimed so the periodic sweep cannot double-send
+    needs_claim = instance.activation_email_pending
+
+    def queue_activation_email():
+        if needs_claim:
+            if not claim_activation_email(user_id):
+                return
+            instance.activation_email_pending = False
+        logger.info(f"Queuing activation email for team {instance.team_number}")
+        send_activation_email.delay(user_id)
+
+    transaction.on_commit(queue_activation_email)
+
+
+@receiver(post_save, sender=User, dispatch_uid="team_user_cache_save_signal")
+@receiver(post_delete, sender=User, dispatch_uid="team_user_cache_delete_signal")
+def team_user_cache_handler(sender, instance, **kwargs):
+    """Drop this process's cached chat lookups for a renumbered or deleted team."""
+    team_users.invalidate(instance.team_number, instance.previous_value("team_number"))
+
+
+CACHED_MODELS = (User, Part, PartRequest, PartSale, PartCategory, PartManufacturer)
+
+
+def response_cache_handler(sender, raw=False, **kwargs):
+    """
+    Retire cached list responses built from this model once the write commits.
+
+    Bumping any earlier would let a concurrent request cache the old rows under
+    the new version.
     """
-    try:
-        logger.info("----------------------------------------")
-        logger.info("User Activation Signal Triggered")
-        logger.info(f"Team Number: {instance.team_number}")
-        logger.info(f"User ID: {instance.id}")
-        logger.info(f"Current is_active state: {instance.is_active}")
-        
-        # Get the current state directly from the database
-        with connection.cursor() as cursor:
-            cursor.execute(
-                "SELECT is_active FROM api_user WHERE id = %s",
-                [instance.id]
-            )
-            result = cursor.fetchone()
-            if result:
-                previous_active = bool(result[0])
-                logger.info(f"Previous is_active state (from DB): {previous_active}")
-                logger.info(f"New is_active state: {instance.is_active}")
-                
-                # Check if is_active changed from False to True
-                if instance.is_active and not previous_active:
-                    logger.info(f"ACTIVATION DETECTED: User {instance.team_number} is being activated!")
-                    logger.info("Queuing activation email...")
-                    send_activation_email.delay(instance.id)
-                    logger.info(f"Activation email queued successfully for team {instance.team_number}")
-                else:
-                    logger.info("No activation change detected")
-            else:
-                logger.info("New user being created - no activation email needed")
-            
-        logger.info("----------------------------------------")
-            
-    except Exception as e:
-        logger.error("----------------------------------------")
-        logger.error(f"ERROR in user_activation_handler")
-        logger.error(f"Error details: {str(e)}")
-        logger.error("Full traceback:", exc_info=True)
-        logger.error("----------------------------------------")
+    if raw:
+        return
+    transaction.on_commit(lambda: bump_version(sender))
+
+
+for model in CACHED_MODELS:
+    post_save.connect(
+        response_cache_handler,
+        sender=model,
+        dispatch_uid=f"response_cache_save_{model._meta.model_name}",
+    )
+    post_delete.connect(
+        response_cache_handler,
+        sender=model,
+        dispatch_uid=f"response_cache_delete_{model._meta.model_name}",
+    )
+
+
+def change_log_save_handler(sender, instance, created=False, raw=False, **kwargs):
+    """Append the save to the change feed once it commits; rolled back writes never show."""
+    if raw:
+        return
+    action = ChangeLog.CREATED if created else ChangeLog.UPDATED
+    pk = instance.pk
+    transaction.on_commit(lambda: record_change(sender, pk, action))
+
+
+def change_log_delete_handler(sender, instance, **kwargs):
+    """Leave a tombstone in the change feed once the delete commits."""
+    pk = instance.pk
+    transaction.on_commit(lambda: record_change(sender, pk, ChangeLog.DELETED))
+
+
+for model in FEED_KINDS:
+    post_save.connect(
+        change_log_save_handler,
+        sender=model,
+        dispatch_uid=f"change_log_save_{model._meta.model_name}",
+    )
+    post_delete.connect(
+        change_log_delete_handler,
+        sender=model,
+        dispatch_uid=f"change_log_delete_{model._meta.model_name}",
+    )
+
+
+def listing_feed_save_handler(sender, instance, created=False, raw=False, **kwargs):
+    """Push the saved listing to its WebSocket topics once the write commits."""
+    if raw:
+        return
+    action = ChangeLog.CREATED if created else ChangeLog.UPDATED
+    args = (sender, instance.pk, action, instance.part_id, instance.user_id)
+    transaction.on_commit(lambda: listing_feed.publish(*args))
+
+
+def listing_feed_delete_handler(sender, instance, **kwargs):
+    """Tell the listing's WebSocket topics it is gone once the delete commits."""
+    args = (sender, instance.pk, ChangeLog.DELETED, instance.part_id, instance.user_id)
+    transaction.on_commit(lambda: listing_feed.publish(*args))
+
+
+for model in listing_feed.LISTING_SERIALIZERS:
+    post_save.connect(
+        listing_feed_save_handler,
+        sender=model,
+        dispatch_uid=f"listing_feed_save_{model._meta.model_name}",
+    )
+    post_delete.connect(
+        listing_feed_delete_handler,
+        sender=model,
+        dispatch_uid=f"listing_feed_delete_{model._meta.model_name}",
+    )
+
+
+def listing_match_handler(sender, instance, raw=False, **kwargs):
+    """Match a new or edited listing against the other side once the write commits."""
+    if raw:
+        return
+    args = (FEED_KINDS[sender], str(instance.pk))
+    transaction.on_commit(lambda: match_listing_task.delay(*args))
+
+
+for model in listing_feed.LISTING_SERIALIZERS:
+    post_save.connect(
+        listing_match_handler,
+        sender=model,
+        dispatch_uid=f"listing_match_{model._meta.model_name}",
+    )
+
+
+def saved_search_handler(sender, instance, created=False, raw=False, **kwargs):
+    """Check a new listing against the saved searches once it commits. Edits are not re-announced."""
+    if raw or not created:
+        return
+    args = (FEED_KINDS[sender], str(instance.pk))
+    transaction.on_commit(lambda: percolate_listing_task.delay(*args))
+
+
+for model in listing_feed.LISTING_SERIALIZERS:
+    post_save.connect(
+        saved_search_handler,
+        sender=model,
+        dispatch_uid=f"saved_search_{model._meta.model_name}",
+    )
+
+
+@receiver(pre_migrate, dispatch_uid="search_extensions_signal")
+def ensure_search_extensions(sender, using="default", **kwargs):
+    """Trigram indexes and similarity() need pg_trgm before the api tables are built."""
+    if sender.name != "api" or connections[using].vendor != "postgresql":
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+
+@receiver(post_save, sender=Part, dispatch_uid="part_search_vector_signal")
+def part_search_vector_handler(sender, instance, raw=False, **kwargs):
+    """Keep a part's stored search vector in sync with its text fields."""
+    if raw:
+        return
+    update_part_search_vector(instance)
+
+
+@receiver(post_save, sender=PartManufacturer, dispatch_uid="manufacturer_search_vector_signal")
+@receiver(post_save, sender=PartCategory, dispatch_uid="category_search_vector_signal")
+def part_owner_search_vector_handler(sender, instance, created=False, raw=False, **kwargs):
+    """Manufacturer and category names are indexed on their parts, so renames re-index them."""
+    if raw or created:
+        return
+    for part in instance.parts.select_related("manufacturer", "category"):
+        update_part_search_vector(part)
+
 
 # Register signals when the module is imported
 register_signals() 
\ No newline at end of file
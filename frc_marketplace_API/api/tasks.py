@@ -1,16 +1,41 @@
-from celery import shared_task
-from django.core.mail import send_mail
+import time
+import uuid
+from math import floor
+from asgiref.sync import async_to_sync
+from celery import chord, shared_task
+from channels.layers import get_channel_layer
+from django.core.mail import EmailMultiAlternatives, get_connection, send_mail
 import logging
 from django.conf import settings
-from .models import User, PartRequest
+from django.db import transaction
+from django.db.models import Min, Q
+from .models import (
+    ChangeLog,
+    PartSale,
+    User,
+    Message,
+    PartRequest,
+    DigestState,
+    DigestLog,
+    FRCTeam,
+    TeamDirectoryPage,
+)
+from .presence import is_online, online_teams
+from .digest_rendering import DigestRenderer
+from . import matching, metrics, notifications, percolator
 from django.template.loader import render_to_string
 from django.utils import timezone
-from datetime import timedelta
-from utils.utils import haversine
+from django.utils.text import Truncator
+from datetime import datetime, timedelta
+from utils.utils import GridIndex
+from utils.blueAlliance import clear_team_names, fetch_teams_page, TEAM_FIELDS
 from celery.exceptions import MaxRetriesExceededError
 
 logger = logging.getLogger(__name__)
 
+DM_SNIPPET_LENGTH = 200
+DM_SNIPPETS_PER_SENDER = 5
+
 @shared_task(bind=True, max_retries=3, default_retry_delay=5)
 def send_email_task(self, subject, message, from_email, recipient_list, html_message=None):
     try:
@@ -35,106 +60,501 @@ def send_email_task(self, subject, message, from_email, recipient_list, html_mes
             logger.error(f"Max retries exceeded for email to {recipient_list}: {str(e)}")
             return f"Failed to send email after {self.max_retries} retries: {str(e)}"
 
+# Emails sent per SMTP session by send_email_batch_task
+EMAIL_BATCH_SIZE = 100
+EMAIL_MAX_ATTEMPTS = 4
+
+
+def prepare_email(subject, message, from_email, recipient_list, html_message=None):
+    """A JSON-serializable email for send_email_batch_task."""
+    return {
+        "subject": subject,
+        "message": message,
+        "from_email": from_email,
+        "recipient_list": list(recipient_list),
+        "html_message": html_message,
+    }
+
+
+def _build_email(email, connection):
+    built = EmailMultiAlternatives(
+        subject=email["subject"],
+        body=email["message"],
+        from_email=email["from_email"],
+        to=email["recipient_list"],
+        connection=connection,
+    )
+    if email.get("html_message"):
+        built.attach_alternative(email["html_message"], "text/html")
+    return built
+
+
+def queue_emails(emails, batch_size=EMAIL_BATCH_SIZE):
+    """Split prepared emails into send_email_batch_task chunks."""
+    for start in range(0, len(emails), batch_size):
+        send_email_batch_task.delay(emails[start:start + batch_size])
+
+
 @shared_task
-def send_daily_requests_digest():
-    # Get all active users
-    users = User.objects.filter(is_active=True)
+def send_email_batch_task(emails, attempts=None):
+    """
+    Send prepared emails over one reused SMTP connection.
+
+    Each email is sent on its own so one bad address cannot sink the batch.
+    Failures are re-queued together with their attempt counts, using the same
+    backoff as send_email_task, until EMAIL_MAX_ATTEMPTS.
+    """
+    attempts = attempts or [0] * len(emails)
+    sent = 0
+    retry, retry_attempts = [], []
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        # No session at all, so every email in the batch failed this attempt
+        logger.error(f"Failed to open email connection: {str(e)}")
+        retry, retry_attempts = emails, [attempt + 1 for attempt in attempts]
+    else:
+        try:
+            for i, (email, attempt) in enumerate(zip(emails, attempts)):
+                try:
+                    sent += connection.send_messages([_build_email(email, connection)])
+                except Exception as e:
+                    logger.error(f"Failed to send email to {email['recipient_list']}: {str(e)}")
+                    retry.append(email)
+                    retry_attempts.append(attempt + 1)
+                    # The server may have dropped us; start a fresh session for the rest
+                    try:
+                        connection.close()
+                        connection.open()
+                    except Exception as e:
+                        logger.error(f"Email connection lost: {str(e)}")
+                        retry += emails[i + 1:]
+                        retry_attempts += [attempt + 1 for attempt in attempts[i + 1:]]
+                        break
+        finally:
+            connection.close()
+
+    pending = [(e, a) for e, a in zip(retry, retry_attempts) if a < EMAIL_MAX_ATTEMPTS]
+    for email, attempt in zip(retry, retry_attempts):
+        if attempt >= EMAIL_MAX_ATTEMPTS:
+            logger.error(f"Max retries exceeded for email to {email['recipient_list']}")
+    if pending:
+        # Exponential backoff: 5s, 20s, 45s
+        countdown = 5 * max(attempt for _, attempt in pending) ** 2
+        send_email_batch_task.apply_async(
+            ([e for e, _ in pending], [a for _, a in pending]), countdown=countdown
+        )
 
-    # Get requests from the last 24 hours
-    recent_requests = PartRequest.objects.filter(
-        request_date__gte=timezone.now() - timedelta(days=1)
-    ).order_by(
-        "needed_date"
-    )  # First sort by needed_date at database level
+    logger.info(f"Sent {sent} of {len(emails)} emails, {len(pending)} to retry")
+    return {"sent": sent, "retrying": len(pending), "failed": len(retry) - len(pending)}
 
-    for user in users:
-        if not user.address:  # Check if user has an address
-            continue
+DIGEST_RADIUS_MILES = 50
+# A user's first digest, or one after a long gap, reaches back at most this far
+DIGEST_LOOKBACK = timedelta(days=1)
+# Users per send_digest_chunk task, grouped by cells this many degrees on a side
+DIGEST_CHUNK_SIZE = 200
+DIGEST_REGION_DEGREES = 5.0
 
-        # Filter requests within 50 miles and exclude user's own requests
-        nearby_requests = []
-        for request in recent_requests:
-            # Skip if it's the user's own request or if request user has no address
-            if request.user == user or not request.user.address:
-                continue
 
-            distance = haversine(
-                user.address.latitude,
-                user.address.longitude,
-                request.user.address.latitude,
-                request.user.address.longitude,
+def build_request_index(requests):
+    """Grid-index requests by their poster's coordinates, remembering list order."""
+    index = GridIndex(cell_degrees=1.0)
+    for position, request in enumerate(requests):
+        address = request.user.address
+        if address is None or address.latitude is None or address.longitude is None:
+            continue
+        index.insert(address.latitude, address.longitude, (position, request))
+    return index
+
+
+def nearby_requests_for(user, index, today, since=None):
+    """
+    Digest rows for requests within DIGEST_RADIUS_MILES of the user, soonest
+    first, optionally only those created after `since`.
+    """
+    address = user.address
+    nearby = []
+    for (position, request), distance in index.within(
+        address.latitude, address.longitude, DIGEST_RADIUS_MILES
+    ):
+        # Skip the user's own requests and ones an earlier digest covered
+        if request.user_id == user.id:
+            continue
+        if since is not None and request.created_at <= since:
+            continue
+
+        # Calculate days until needed
+        days_until = None
+        if request.needed_date:
+            days_until = (request.needed_date - today).days
+
+        nearby.append(
+            (
+                position,
+                {
+                    "request": request,
+                    "distance": round(distance, 1),
+                    "days_until": days_until,
+                },
             )
+        )
 
-            if distance <= 50:  # 50 miles radius
-                # Calculate days until needed
-                days_until = None
-                if request.needed_date:
-                    days_until = (request.needed_date - timezone.now().date()).days
-
-                nearby_requests.append(
-                    {
-                        "request": request,
-                        "distance": round(distance, 1),
-                        "days_until": days_until,
-                    }
-                )
+    # Restore query order first so ties keep the needed_date ordering, then
+    # sort by days_until (None values last)
+    nearby.sort(key=lambda x: x[0])
+    return sorted(
+        (item for _, item in nearby),
+        key=lambda x: (
+            x["days_until"] is None,  # None values last
+            x["days_until"] if x["days_until"] is not None else float("inf"),
+        ),
+    )
+
+
+def partition_by_region(users, chunk_size=DIGEST_CHUNK_SIZE, cell_degrees=DIGEST_REGION_DEGREES):
+    """
+    Split (id, latitude, longitude) rows into chunks of at most `chunk_size`,
+    keeping users from the same region cell together so each chunk only needs
+    the requests near one area.
+    """
+    regions = {}
+    for user in users:
+        cell = (floor(user[1] / cell_degrees), floor(user[2] / cell_degrees))
+        regions.setdefault(cell, []).append(user)
+
+    chunks, current = [], []
+    for cell in sorted(regions):
+        for user in regions[cell]:
+            current.append(user)
+            if len(current) == chunk_size:
+                chunks.append(current)
+                current = []
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def requests_near(index, users):
+    """Ids of indexed requests any of `users` might see, in query order."""
+    positions = {}
+    for _, latitude, longitude in users:
+        for cell in index.cells_within(latitude, longitude, DIGEST_RADIUS_MILES):
+            for _, _, (position, request) in index.cells.get(cell, ()):
+                positions[position] = request.id
+    return [str(positions[position]) for position in sorted(positions)]
+
+
+def render_digest_email(user, nearby_requests, renderer=None):
+    """Prepared digest email for one user; share `renderer` across a run to reuse request cards."""
+    renderer = renderer or DigestRenderer(settings.FRONTEND_URL)
+    html_content, text_content = renderer.render(user, nearby_requests)
+
+    return prepare_email(
+        subject=f"Daily Part Requests Digest for FRC Team {user.team_number}",
+        message=text_content,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        recipient_list=[user.email],
+        html_message=html_content,
+    )
+
+
+def digest_window_start(users, cutoff):
+    """
+    Oldest creation time any of `users` still needs: their high-water mark,
+    but never further back than DIGEST_LOOKBACK.
+    """
+    earliest = cutoff - DIGEST_LOOKBACK
+    if users.filter(
+        Q(digest_state__isnull=True) | Q(digest_state__processed_until__isnull=True)
+    ).exists():
+        return earliest
+    oldest = DigestState.objects.filter(user__in=users).aggregate(
+        oldest=Min("processed_until")
+    )["oldest"]
+    return max(earliest, oldest) if oldest else earliest
+
+
+def advance_digest_marks(user_ids, cutoff):
+    """Move users' high-water marks up to `cutoff`, never backwards."""
+    DigestState.objects.bulk_create(
+        [DigestState(user_id=user_id, processed_until=cutoff) for user_id in user_ids],
+        ignore_conflicts=True,
+    )
+    DigestState.objects.filter(user_id__in=user_ids).filter(
+        Q(processed_until__isnull=True) | Q(processed_until__lt=cutoff)
+    ).update(processed_until=cutoff)
 
-        if nearby_requests:
-            # Sort requests by days_until (None values last)
-            nearby_requests.sort(
-                key=lambda x: (
-                    x["days_until"] is None,  # None values last
-                    x["days_until"] if x["days_until"] is not None else float("inf"),
-                )
+
+@shared_task
+def send_daily_requests_digest():
+    """
+    Coordinator: load the requests created since users' last digest once,
+    split located users into region chunks and fan the chunks out as a chord
+    of send_digest_chunk tasks. Runs are incremental and idempotent: each
+    user's DigestState records how far they have been processed.
+    """
+    started = time.time()
+    cutoff = timezone.now()
+
+    # Get all active users with a located address
+    users = User.objects.filter(
+        is_active=True,
+        address__latitude__isnull=False,
+        address__longitude__isnull=False,
+    )
+
+    # Only requests created since the stalest user's mark, with posters joined in once
+    recent_requests = list(
+        PartRequest.objects.filter(
+            created_at__gt=digest_window_start(users, cutoff),
+            created_at__lte=cutoff,
+            # Rows from before created_at existed were all stamped with the
+            # deploy time; their request_date still says how old they are
+            request_date__gte=(cutoff - DIGEST_LOOKBACK).date(),
+        )
+        .select_related("user__address")
+        .order_by("needed_date")  # First sort by needed_date at database level
+    )
+    index = build_request_index(recent_requests)
+    if not index.size:
+        return 0
+
+    chunks = []
+    idle_user_ids = []
+    for users_chunk in partition_by_region(
+        users.values_list("id", "address__latitude", "address__longitude"), DIGEST_CHUNK_SIZE
+    ):
+        request_ids = requests_near(index, users_chunk)
+        user_ids = [str(user_id) for user_id, _, _ in users_chunk]
+        if request_ids:
+            chunks.append(
+                send_digest_chunk.s(len(chunks), user_ids, request_ids, cutoff.isoformat())
             )
+        else:
+            idle_user_ids += user_ids
 
-            # Create email content
-            context = {
-                "team_name": user.team_name,
-                "team_number": user.team_number,
-                "requests": nearby_requests,
-                "frontend_url": settings.FRONTEND_URL,
-            }
+    # Nothing new reached these users, so they are done up to the cutoff
+    advance_digest_marks(idle_user_ids, cutoff)
+    if chunks:
+        chord(chunks)(finish_daily_digest.s(started))
+    logger.info(f"Daily digest dispatched {len(chunks)} chunks for {index.size} requests")
+    return len(chunks)
 
-            html_content = render_to_string("emails/daily_digest.html", context)
-            text_content = render_to_string("emails/daily_digest.txt", context)
 
-            # Send email
-            send_email_task.delay(
-                subject=f"Daily Part Requests Digest for FRC Team {user.team_number}",
-                message=text_content,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[user.email],
-                html_message=html_content,
+@shared_task
+def send_digest_chunk(chunk, user_ids, request_ids, cutoff):
+    """Compute, render and batch-send the digest for one region chunk of users."""
+    started = time.perf_counter()
+    cutoff = datetime.fromisoformat(cutoff)
+    earliest = cutoff - DIGEST_LOOKBACK
+    requests = PartRequest.objects.select_related("user__address", "part").in_bulk(request_ids)
+    # Keep the coordinator's needed_date order
+    ordered = [requests[request_id] for request_id in map(uuid.UUID, request_ids) if request_id in requests]
+    index = build_request_index(ordered)
+    users = list(User.objects.filter(id__in=user_ids).select_related("address"))
+
+    emails, logs, skipped = [], [], 0
+    renderer = DigestRenderer(settings.FRONTEND_URL)
+    with transaction.atomic():
+        DigestState.objects.bulk_create(
+            [DigestState(user=user) for user in users], ignore_conflicts=True
+        )
+        # Locking the chunk's rows makes a retried or overlapping run wait for
+        # this one and then skip everything it already covered
+        states = DigestState.objects.select_for_update().in_bulk([user.id for user in users])
+        for user in users:
+            state = states[user.id]
+            if state.processed_until and state.processed_until >= cutoff:
+                skipped += 1
+                continue
+
+            since = max(state.processed_until or earliest, earliest)
+            nearby_requests = nearby_requests_for(user, index, cutoff.date(), since=since)
+            state.processed_until = cutoff
+            if nearby_requests:
+                emails.append(render_digest_email(user, nearby_requests, renderer))
+                included = [item["request"] for item in nearby_requests]
+                state.last_request = max(included, key=lambda request: request.created_at)
+                state.last_sent_at = timezone.now()
+                logs.append(DigestLog(
+                    user=user,
+                    window_start=since,
+                    window_end=cutoff,
+                    request_ids=[str(request.id) for request in included],
+                ))
+
+        DigestState.objects.bulk_update(
+            states.values(), ["processed_until", "last_request", "last_sent_at"]
+        )
+        DigestLog.objects.bulk_create(logs)
+        # Send in batches that each share one SMTP connection, once the marks are saved
+        transaction.on_commit(lambda: queue_emails(emails))
+
+    stats = {
+        "chunk": chunk,
+        "users": len(user_ids),
+        "skipped": skipped,
+        "requests": len(ordered),
+        "emails": len(emails),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    logger.info(
+        f"Digest chunk {chunk}: {stats['emails']} emails for {stats['users']} users "
+        f"({skipped} already covered) from {stats['requests']} requests in {stats['seconds']}s"
+    )
+    return stats
+
+
+@shared_task
+def finish_daily_digest(results, started):
+    """Chord callback: log totals for the whole digest run."""
+    summary = {
+        "chunks": len(results),
+        "users": sum(result["users"] for result in results),
+        "emails": sum(result["emails"] for result in results),
+        "slowest_chunk_seconds": max((result["seconds"] for result in results), default=0),
+        "seconds": round(time.time() - started, 3),
+    }
+    logger.info(
+        f"Daily digest finished: {summary['emails']} emails to {summary['users']} users "
+        f"in {summary['chunks']} chunks, {summary['seconds']}s wall clock "
+        f"(slowest chunk {summary['slowest_chunk_seconds']}s)"
+    )
+    return summary
+
+
+def queue_dm_notifications(messages):
+    """Add new messages to their recipients' pending digests, skipping teams that are online."""
+    recipients = {
+        message.receiver_id: (message.receiver.team_number, message.receiver.email)
+        for message in messages
+        if Message.receiver.is_cached(message)
+    }
+    missing = {message.receiver_id for message in messages} - recipients.keys()
+    if missing:
+        recipients.update(
+            (user_id, (team_number, email))
+            for user_id, team_number, email in User.objects.filter(id__in=missing).values_list(
+                "id", "team_number", "email"
             )
+        )
+    online = online_teams({team_number for team_number, _ in recipients.values()})
 
+    queued = 0
+    for message in messages:
+        team_number, email = recipients.get(message.receiver_id, (None, None))
+        if not email:
+            continue
+        if team_number in online:
+            metrics.incr(notifications.SUPPRESSED)
+            continue
+        notifications.enqueue(message)
+        queued += 1
+    return queued
+
+def dm_digest_context(recipient, entries, senders):
+    """Group pending DMs ({"sender_id", "message"}) by sender for the dm_notification templates."""
+    grouped = {}
+    for entry in entries:
+        sender = senders.get(entry["sender_id"])
+        if sender is None:
+            continue
+        group = grouped.setdefault(sender.id, {
+            "team_number": sender.team_number,
+            "team_name": sender.team_name,
+            "messages": [],
+            "count": 0,
+        })
+        group["count"] += 1
+        if len(group["messages"]) < DM_SNIPPETS_PER_SENDER:
+            group["messages"].append(Truncator(entry["message"]).chars(DM_SNIPPET_LENGTH))
+    for group in grouped.values():
+        group["more"] = group["count"] - len(group["messages"])
+
+    return {
+        "recipient_team_number": recipient.team_number,
+        "senders": list(grouped.values()),
+        "message_count": sum(group["count"] for group in grouped.values()),
+        "frontend_url": settings.FRONTEND_URL,
+    }
+
+def send_dm_digest(recipient, entries):
+    """Render and queue a single email covering `entries`; False if nothing was left to send."""
+    sender_ids = {entry["sender_id"] for entry in entries}
+    senders = {str(user.id): user for user in User.objects.filter(id__in=sender_ids)}
+    context = dm_digest_context(recipient, entries, senders)
+    if not context["senders"]:
+        return False
+
+    # Render both HTML and text versions once for the whole digest
+    html_content = render_to_string("emails/dm_notification.html", context)
+    text_content = render_to_string("emails/dm_notification.txt", context)
+
+    count, teams = context["message_count"], context["senders"]
+    if len(teams) > 1:
+        subject = f"{count} New Messages from {len(teams)} Teams"
+    elif count > 1:
+        subject = f"{count} New Messages from Team {teams[0]['team_number']}"
+    else:
+        subject = f"New Message from Team {teams[0]['team_number']}"
+
+    send_email_task.delay(
+        subject=subject,
+        message=text_content,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        recipient_list=[recipient.email],
+        html_message=html_content,
+    )
+    metrics.incr(notifications.EMAILS)
+    return True
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def flush_dm_notifications(self, recipient_id):
+    """Email everything pending for `recipient_id` once their chat has gone quiet."""
+    delay = notifications.flush_delay(recipient_id)
+    # Eager (test) runs have no countdown, so they flush straight away
+    if delay > 0 and not self.request.is_eager:
+        notifications.schedule_flush(recipient_id, delay)
+        return
+
+    entries, position = notifications.pending(recipient_id)
+    if not entries:
+        notifications.acknowledge(recipient_id, position)
+        return
+    try:
+        recipient = User.objects.get(id=recipient_id)
+        # They may have opened the chat since the messages were queued
+        if is_online(recipient.team_number):
+            metrics.incr(notifications.SUPPRESSED, len(entries))
+            logger.info(f"Skipping DM email, team {recipient.team_number} is online")
+        elif send_dm_digest(recipient, entries):
+            logger.info(f"Coalesced {len(entries)} DMs into one email for team {recipient.team_number}")
+    except User.DoesNotExist:
+        logger.error("User not found when trying to send DM notification")
+    except Exception as e:
+        # Entries stay pending; the retry (or the next message's flush) sends them
+        logger.error(f"Error sending DM notification: {str(e)}")
+        # retry(exc=e) re-raises e on the last attempt, so give up explicitly
+        if self.request.retries >= self.max_retries:
+            logger.error(f"Max retries exceeded for DM digest to {recipient_id}: {str(e)}")
+            notifications.unschedule(recipient_id)
+            return
+        raise self.retry(exc=e)
+    notifications.acknowledge(recipient_id, position)
 
 @shared_task
 def send_dm_notification(sender_id, recipient_id, message_content):
+    """Single-message notification, kept for tasks queued before digests existed."""
     try:
-        sender = User.objects.get(id=sender_id)
         recipient = User.objects.get(id=recipient_id)
 
-        context = {
-            "sender_team_name": sender.team_name,
-            "sender_team_number": sender.team_number,
-            "recipient_team_number": recipient.team_number,
-            "message_content": message_content,
-            "frontend_url": settings.FRONTEND_URL,
-        }
-
-        # Render both HTML and text versions
-        html_content = render_to_string("emails/dm_notification.html", context)
-        text_content = render_to_string("emails/dm_notification.txt", context)
+        # They may have opened the chat since the notification was queued
+        if is_online(recipient.team_number):
+            logger.info(f"Skipping DM email, team {recipient.team_number} is online")
+            return
 
-        # Send email with both HTML and text versions
-        send_email_task.delay(
-            subject=f"New Message from Team {sender.team_number}",
-            message=text_content,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[recipient.email],
-            html_message=html_content,
-        )
+        send_dm_digest(recipient, [{"sender_id": str(sender_id), "message": message_content}])
 
     except User.DoesNotExist:
         logger.error("User not found when trying to send DM notification")
@@ -154,22 +574,23 @@ def send_welcome_email(email):
         html_content = render_to_string('emails/welcome_email.html', context)
         text_content = render_to_string('emails/welcome_email.txt', context)
 
-        # Send email with both HTML and text versions
-        send_email_task.delay(
-            subject=f'Millennium Market Registration',
-            message=text_content,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            html_message=html_content
-        )
-
-        send_email_task.delay(
-            subject=f'Team {user.team_number} - {user.team_name} needs to be verified!',
-            message=text_content,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[settings.DEFAULT_FROM_EMAIL, settings.DEFAULT_NOTIFICATION_EMAIL],
-            html_message=html_content
-        )
+        # Send both emails with HTML and text versions over one connection
+        queue_emails([
+            prepare_email(
+                subject=f'Millennium Market Registration',
+                message=text_content,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                recipient_list=[user.email],
+                html_message=html_content
+            ),
+            prepare_email(
+                subject=f'Team {user.team_number} - {user.team_name} needs to be verified!',
+                message=text_content,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                recipient_list=[settings.DEFAULT_FROM_EMAIL, settings.DEFAULT_NOTIFICATION_EMAIL],
+                html_message=html_content
+            ),
+        ])
 
     except User.DoesNotExist:
         logger.error("User not found when trying to send welcome email")
@@ -201,6 +622,28 @@ def send_activation_email(user_id):
     except Exception as e:
         logger.error(f"Error sending activation email: {str(e)}")
 
+def claim_activation_email(user_id):
+    """Clear a user's pending flag; True only for the caller that actually cleared it."""
+    return bool(
+        User.objects.filter(pk=user_id, activation_email_pending=True).update(
+            activation_email_pending=False
+        )
+    )
+
+@shared_task
+def send_pending_activation_emails():
+    """
+    Send activation emails for users activated outside the ORM (pgAdmin,
+    queryset.update), which never reach the pre_save signal.
+    """
+    pending = User.objects.filter(is_active=True, activation_email_pending=True)
+    sent = 0
+    for user_id in pending.values_list("id", flat=True):
+        if claim_activation_email(user_id):
+            send_activation_email.delay(user_id)
+            sent += 1
+    return sent
+
 @shared_task
 def send_password_reset_email(user_id, reset_url):
     try:
@@ -225,4 +668,230 @@ def send_password_reset_email(user_id, reset_url):
     except User.DoesNotExist:
         logger.error(f"User {user_id} not found when trying to send password reset email")
     except Exception as e:
-        logger.error(f"Error sending password reset email: {str(e)}")
\ No newline at end of file
+        logger.error(f"Error sending password reset email: {str(e)}")
+
+
+@shared_task
+def sync_team_directory():
+    """
+    Page through TBA's /teams/{page} listing into the local FRCTeam table.
+    Pages that have not changed since the last sync answer 304 and are skipped.
+    """
+    page = 0
+    stats = {"pages": 0, "unchanged": 0, "teams": 0}
+    while True:
+        state = TeamDirectoryPage.objects.filter(page=page).first()
+        try:
+            status_code, teams, headers = fetch_teams_page(
+                page,
+                etag=state.etag if state else None,
+                last_modified=state.last_modified if state else None,
+            )
+        except Exception as e:
+            logger.error(f"Team directory sync failed on page {page}: {str(e)}")
+            break
+
+        stats["pages"] += 1
+        if status_code == 304:
+            stats["unchanged"] += 1
+            # An unchanged empty page is still the end of the listing
+            if state.team_count == 0:
+                break
+            page += 1
+            continue
+
+        if teams:
+            FRCTeam.objects.bulk_create(
+                [
+                    FRCTeam(
+                        team_number=team["team_number"],
+                        **{field: team.get(field) for field in TEAM_FIELDS},
+                    )
+                    for team in teams
+                ],
+                update_conflicts=True,
+                unique_fields=["team_number"],
+                update_fields=[*TEAM_FIELDS, "updated_at"],
+            )
+            stats["teams"] += len(teams)
+
+        TeamDirectoryPage.objects.update_or_create(
+            page=page,
+            defaults={
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "team_count": len(teams),
+            },
+        )
+        if not teams:
+            break
+        page += 1
+
+    if stats["teams"]:
+        clear_team_names()
+    logger.info(f"Team directory sync finished: {stats}")
+    return stats
+
+
+@shared_task
+def prune_change_log():
+    """Drop change feed rows older than CHANGE_LOG_RETENTION_DAYS; cursors that old are refused."""
+    cutoff = timezone.now() - timedelta(days=settings.CHANGE_LOG_RETENTION_DAYS)
+    deleted, _ = ChangeLog.objects.filter(changed_at__lt=cutoff).delete()
+    logger.info(f"Pruned {deleted} change log rows older than {cutoff}")
+    return deleted
+
+
+def match_summary(match):
+    """What both teams are told about a new match, as plain JSON types."""
+    return {
+        "type": "match",
+        "id": str(match.id),
+        "score": match.score,
+        "distance_miles": match.distance_miles,
+        "request_id": str(match.request_id),
+        "sale_id": str(match.sale_id),
+        "part_id": str(match.request.part_id),
+        "part_name": match.request.part.name,
+        "ask_price": str(match.sale.ask_price),
+        "buyer_team_number": match.request.user.team_number,
+        "seller_team_number": match.sale.user.team_number,
+    }
+
+
+def notify_matches(matches):
+    """
+    Push new matches to both teams' sockets and email each offline team once.
+
+    `matches` need request.part, request.user and sale.user loaded, as
+    matching.match_listing returns them.
+    """
+    by_team = {}
+    for match in matches:
+        summary = match_summary(match)
+        for user, other, role in (
+            (match.request.user, match.sale.user, "buyer"),
+            (match.sale.user, match.request.user, "seller"),
+        ):
+            entries = by_team.setdefault(user.team_number, (user, []))[1]
+            entries.append({**summary, "role": role, "other_team_number": other.team_number})
+
+    channel_layer = get_channel_layer()
+    for team_number, (_, entries) in by_team.items():
+        for entry in entries:
+            try:
+                async_to_sync(channel_layer.group_send)(
+                    f"user_{team_number}", {"type": "match.found", "match": entry}
+                )
+            except Exception as e:
+                logger.error(f"Error pushing match to team {team_number}: {str(e)}")
+
+    online = online_teams(set(by_team))
+    emails = []
+    for team_number, (user, entries) in by_team.items():
+        if team_number in online or not user.email:
+            continue
+        context = {
+            "recipient_team_number": team_number,
+            "matches": entries,
+            "frontend_url": settings.FRONTEND_URL,
+        }
+        if len(entries) > 1:
+            subject = f"{len(entries)} New Matches for Your Listings"
+        else:
+            subject = f"New Match for {entries[0]['part_name']}"
+        emails.append(prepare_email(
+            subject,
+            render_to_string("emails/match_notification.txt", context),
+            settings.DEFAULT_FROM_EMAIL,
+            [user.email],
+            html_message=render_to_string("emails/match_notification.html", context),
+        ))
+    queue_emails(emails)
+    return len(emails)
+
+
+@shared_task
+def match_listing_task(kind, listing_id):
+    """Match a saved request or sale against the other side and tell both teams about new pairs."""
+    model = {"requests": PartRequest, "sales": PartSale}[kind]
+    try:
+        new_matches = matching.match_listing(model, listing_id)
+        if new_matches:
+            notify_matches(new_matches)
+        logger.info(f"Matched {kind} {listing_id}: {len(new_matches)} new")
+        return len(new_matches)
+    except Exception as e:
+        logger.error(f"Error matching {kind} {listing_id}: {str(e)}")
+
+
+def notify_saved_searches(kind, listing, searches):
+    """
+    Push a listing that matched saved searches to each owner's socket, and
+    email each offline owner once however many of their searches it matched.
+    """
+    by_team = {}
+    for search in searches:
+        by_team.setdefault(search.user.team_number, (search.user, []))[1].append(search)
+
+    summary = {
+        "type": "saved_search",
+        "kind": kind,
+        "listing_id": str(listing.id),
+        "part_id": str(listing.part_id),
+        "part_name": listing.part.name,
+        "team_number": listing.user.team_number,
+    }
+    if kind == "sales":
+        summary["ask_price"] = str(listing.ask_price)
+
+    channel_layer = get_channel_layer()
+    entries = {}
+    for team_number, (_, team_searches) in by_team.items():
+        entries[team_number] = {
+            **summary,
+            "searches": [
+                {"id": str(search.id), "name": search.name} for search in team_searches
+            ],
+        }
+        try:
+            async_to_sync(channel_layer.group_send)(
+                f"user_{team_number}",
+                {"type": "saved_search.match", "match": entries[team_number]},
+            )
+        except Exception as e:
+            logger.error(f"Error pushing saved search match to team {team_number}: {str(e)}")
+
+    online = online_teams(set(by_team))
+    emails = []
+    for team_number, (user, _) in by_team.items():
+        if team_number in online or not user.email:
+            continue
+        context = {
+            "recipient_team_number": team_number,
+            "match": entries[team_number],
+            "frontend_url": settings.FRONTEND_URL,
+        }
+        emails.append(prepare_email(
+            f"New {'Request' if kind == 'requests' else 'Sale'} for {listing.part.name}",
+            render_to_string("emails/saved_search_notification.txt", context),
+            settings.DEFAULT_FROM_EMAIL,
+            [user.email],
+            html_message=render_to_string("emails/saved_search_notification.html", context),
+        ))
+    queue_emails(emails)
+    return len(emails)
+
+
+@shared_task
+def percolate_listing_task(kind, listing_id):
+    """Check a new request or sale against the saved searches and tell their owners."""
+    model = {"requests": PartRequest, "sales": PartSale}[kind]
+    try:
+        listing, searches = percolator.percolate(model, listing_id)
+        if searches:
+            notify_saved_searches(kind, listing, searches)
+        logger.info(f"Percolated {kind} {listing_id}: {len(searches)} saved searches matched")
+        return len(searches)
+    except Exception as e:
+        logger.error(f"Error percolating {kind} {listing_id}: {str(e)}")
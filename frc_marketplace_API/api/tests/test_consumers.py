@@ -0,0 +1,294 @@
+import time
+from unittest import mock
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from address.models import Address
+from api.models import User, Message, Conversation, Part, PartCategory, PartRequest, PartSale
+from api.message_buffer import persist_messages, team_users, message_writer
+from api.routing import websocket_urlpatterns
+from api.tasks import queue_dm_notifications, send_dm_notification
+from api import presence
+
+
+def make_user(team_number):
+    return User.objects.create_user(
+        email=f"team{team_number}@example.com",
+        password="pass123",
+        team_number=team_number,
+        phone=f"555{team_number:07d}",
+        is_active=True,
+    )
+
+
+@mock.patch("api.notifications.enqueue")
+class PersistMessagesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sender = make_user(254)
+        self.receiver = make_user(1678)
+
+    def build(self, text):
+        return Message(
+            sender_id=self.sender.id,
+            receiver_id=self.receiver.id,
+            message=text,
+            timestamp=timezone.now(),
+        )
+
+    def test_batch_is_written_once(self, notify):
+        """A batch is stored, folded into the conversation and notified per message"""
+        batch = [self.build(f"message {i}") for i in range(3)]
+        self.assertEqual(len(persist_messages(batch)), 3)
+        # Re-sent ids are skipped
+        self.assertEqual(persist_messages(batch), [])
+
+        conversation = Conversation.objects.get()
+        self.assertEqual(Message.objects.count(), 3)
+        self.assertEqual(conversation.unread_for(self.receiver), 3)
+        self.assertEqual(conversation.last_message_id, batch[-1].id)
+        self.assertEqual(notify.call_count, 3)
+
+    def test_resent_client_ids_are_skipped(self, notify):
+        """Ids sent as strings, in any case, match the stored UUIDs"""
+        first = self.build("hello")
+        persist_messages([first])
+        again = self.build("hello")
+        again.id = str(first.id).upper()
+        bad = self.build("bad id")
+        bad.id = "not-a-uuid"
+
+        self.assertEqual(persist_messages([again, bad, self.build("new")])[0].message, "new")
+        self.assertEqual(Message.objects.count(), 2)
+
+    def test_bad_row_does_not_sink_batch(self, notify):
+        """A message whose user vanished is dropped and the rest are kept"""
+        stray = self.build("to nobody")
+        stray.receiver_id = make_user(118).id
+        User.objects.filter(team_number=118).delete()
+
+        saved = persist_messages([self.build("hello"), stray])
+        self.assertEqual([m.message for m in saved], ["hello"])
+        self.assertEqual(Message.objects.count(), 1)
+
+    def test_team_cache_follows_renumbering(self, notify):
+        """Changing a team number drops the stale chat lookup"""
+        self.assertEqual(team_users.resolve([254]), {254: self.sender.id})
+        self.sender.team_number = 9254
+        self.sender.save()
+        self.assertEqual(team_users.get_cached([254, 9254]), ({}, [254, 9254]))
+
+
+@override_settings(CHAT_WRITE_BEHIND=True)
+@mock.patch("api.notifications.enqueue")
+class WriteBehindConsumerTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        team_users.clear()
+        self.sender = make_user(254)
+        self.receiver = make_user(1678)
+
+    async def exchange(self):
+        application = URLRouter(websocket_urlpatterns)
+        sender = WebsocketCommunicator(application, "/ws/user/254/")
+        receiver = WebsocketCommunicator(application, "/ws/user/1678/")
+        await sender.connect()
+        await receiver.connect()
+
+        await sender.send_json_to(
+            {"type": "chat_message", "sender": 254, "receiver": 1678, "message": "hi"}
+        )
+        delivered = await receiver.receive_json_from()
+        echoed = await sender.receive_json_from()
+        await message_writer.drain()
+
+        await sender.disconnect()
+        await receiver.disconnect()
+        return delivered, echoed
+
+    async def send_bad_id(self):
+        application = URLRouter(websocket_urlpatterns)
+        receiver = WebsocketCommunicator(application, "/ws/user/1678/")
+        await receiver.connect()
+        await receiver.send_json_to(
+            {"type": "chat_message", "sender": 254, "receiver": 1678, "message": "hi", "id": "x"}
+        )
+        nothing = await receiver.receive_nothing()
+        await message_writer.drain()
+        await receiver.disconnect()
+        return nothing
+
+    def test_malformed_id_is_rejected_before_fan_out(self, notify):
+        """A message whose id is not a UUID is neither delivered nor queued"""
+        self.assertTrue(async_to_sync(self.send_bad_id)())
+        self.assertFalse(Message.objects.exists())
+
+    def test_fans_out_then_persists(self, notify):
+        """Both sockets get the message with a server timestamp; the online receiver gets no email"""
+        delivered, echoed = async_to_sync(self.exchange)()
+
+        self.assertEqual(delivered, echoed)
+        self.assertEqual(delivered["message"], "hi")
+        message = Message.objects.get()
+        self.assertEqual(delivered["timestamp"], message.timestamp.isoformat())
+        self.assertEqual(message.receiver, self.receiver)
+        self.assertEqual(Conversation.objects.get().unread_for(self.receiver), 1)
+        notify.assert_not_called()
+        self.assertFalse(presence.is_online(1678))
+
+
+class PresenceTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sender = make_user(254)
+        self.receiver = make_user(1678)
+
+    def test_online_until_last_socket_leaves(self):
+        """A team stays online while any of its sockets is open"""
+        presence.heartbeat(1678, "tab-1")
+        presence.heartbeat(1678, "tab-2")
+        presence.leave(1678, "tab-1")
+        self.assertTrue(presence.is_online(1678))
+        self.assertEqual(presence.online_teams([254, 1678]), {1678})
+
+        presence.leave(1678, "tab-2")
+        self.assertFalse(presence.is_online(1678))
+
+    def test_missed_heartbeats_expire(self):
+        """A socket that stops heartbeating drops out after the TTL"""
+        presence.heartbeat(1678, "tab-1")
+        with mock.patch("api.presence.time.time", return_value=time.time() + presence.PRESENCE_TTL + 1):
+            self.assertFalse(presence.is_online(1678))
+
+    @mock.patch("api.notifications.enqueue")
+    def test_online_recipients_are_not_emailed(self, notify):
+        """Only messages to offline teams queue an email"""
+        presence.heartbeat(1678, "tab-1")
+        to_online = Message(sender=self.sender, receiver=self.receiver, message="hi")
+        to_offline = Message(sender_id=self.receiver.id, receiver_id=self.sender.id, message="hey")
+
+        self.assertEqual(queue_dm_notifications([to_online, to_offline]), 1)
+        notify.assert_called_once_with(to_offline)
+
+    @mock.patch("api.notifications.enqueue")
+    def test_recipients_without_email_are_skipped(self, notify):
+        """Messages to a team with no email address queue nothing"""
+        User.objects.filter(id=self.receiver.id).update(email="")
+        message = Message(sender_id=self.sender.id, receiver_id=self.receiver.id, message="hi")
+
+        self.assertEqual(queue_dm_notifications([message]), 0)
+        notify.assert_not_called()
+
+    def test_each_socket_is_its_own_member(self):
+        """A heartbeat for one tab never resurrects or drops another"""
+        presence.heartbeat(1678, "tab-1")
+        later = time.time() + presence.PRESENCE_TTL - 1
+        with mock.patch("api.presence.time.time", return_value=later):
+            presence.heartbeat(1678, "tab-2")
+            presence.leave(1678, "tab-2")
+        with mock.patch("api.presence.time.time", return_value=later + 2):
+            self.assertEqual(presence.online_teams([1678]), set())
+
+    @mock.patch("api.tasks.send_email_task")
+    def test_notification_task_rechecks_presence(self, send_email):
+        """A recipient who came online after queueing gets no email"""
+        presence.heartbeat(1678, "tab-1")
+        send_dm_notification(self.sender.id, self.receiver.id, "hi")
+        send_email.delay.assert_not_called()
+
+
+class ListingFeedConsumerTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        houston = Address.objects.create(raw="Houston", latitude=29.76, longitude=-95.37)
+        self.user = make_user(3647)
+        self.user.address = houston
+        self.user.save()
+        self.neighbour = make_user(118)
+        self.neighbour.address = Address.objects.create(
+            raw="Sugar Land", latitude=29.62, longitude=-95.63
+        )
+        self.neighbour.save()
+        self.category = PartCategory.objects.create(name="Motors")
+        self.part = Part.objects.create(name="NEO", category=self.category)
+        self.other_part = Part.objects.create(name="Bumper Kit")
+
+    async def connect(self, team_number, *topics):
+        socket = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/user/{team_number}/")
+        await socket.connect()
+        await socket.send_json_to({"type": "subscribe", "topics": list(topics)})
+        reply = await socket.receive_json_from()
+        return socket, reply
+
+    def test_subscribers_get_each_event_once(self):
+        """Overlapping topics deliver one copy; other parts' subscribers get nothing"""
+
+        async def run():
+            follower, reply = await self.connect(3647, "all", f"category:{self.category.id}")
+            bystander, _ = await self.connect(254, f"part:{self.other_part.id}")
+            self.assertEqual(reply["topics"], ["all", f"category:{self.category.id}"])
+
+            request = await database_sync_to_async(PartRequest.objects.create)(
+                part=self.part, user=self.neighbour, quantity=3
+            )
+            request_id = str(request.id)
+            event = await follower.receive_json_from()
+            self.assertTrue(await follower.receive_nothing())
+            self.assertTrue(await bystander.receive_nothing())
+
+            await database_sync_to_async(request.delete)()
+            deleted = await follower.receive_json_from()
+            await follower.disconnect()
+            await bystander.disconnect()
+            return request_id, event, deleted
+
+        request_id, event, deleted = async_to_sync(run)()
+        self.assertEqual((event["kind"], event["action"]), ("requests", "created"))
+        self.assertEqual(event["listing"]["quantity"], 3)
+        self.assertEqual(event["listing"]["user_team_number"], 118)
+        self.assertEqual(event["listing"]["part_id"], str(self.part.id))
+        self.assertEqual(
+            (deleted["action"], deleted["listing_id"]), ("deleted", request_id)
+        )
+
+    def test_nearby_and_unsubscribe(self):
+        """Nearby follows the team's address and unsubscribing stops the events"""
+
+        async def run():
+            socket, reply = await self.connect(3647, "nearby", "bogus")
+            await database_sync_to_async(PartSale.objects.create)(
+                part=self.part, user=self.neighbour, ask_price=20
+            )
+            event = await socket.receive_json_from()
+
+            await socket.send_json_to({"type": "unsubscribe", "topics": ["nearby"]})
+            after = await socket.receive_json_from()
+            await database_sync_to_async(PartSale.objects.create)(
+                part=self.part, user=self.neighbour, ask_price=30
+            )
+            quiet = await socket.receive_nothing()
+            await socket.disconnect()
+            return reply, event, after, quiet
+
+        reply, event, after, quiet = async_to_sync(run)()
+        self.assertEqual(reply["topics"], ["nearby"])
+        self.assertIn("bogus", reply["errors"])
+        self.assertEqual(event["kind"], "sales")
+        self.assertEqual(after["topics"], [])
+        self.assertTrue(quiet)
+
+    def test_nearby_needs_coordinates(self):
+        """Teams without a located address cannot follow nearby listings"""
+
+        async def run():
+            socket, reply = await self.connect(254, "nearby")
+            await socket.disconnect()
+            return reply
+
+        reply = async_to_sync(run)()
+        self.assertEqual(reply["topics"], [])
+        self.assertIn("nearby", reply["errors"])
@@ -11,6 +11,7 @@ from api.models import (
     PartRequest,
     PartSale,
     Message,
+    Conversation,
 )
 from django.core.files.uploadedfile import SimpleUploadedFile
 
@@ -302,3 +303,46 @@ class PartSaleModelTest(TestCase):
                 ask_price=25.00,
                 condition="Used"
             )
+
+
+class ConversationModelTest(TestCase):
+    """Test cases for the Conversation model.
+
+    Tests that inbox rows are keyed by the unordered user pair and track the
+    latest message and per-side unread counts.
+    """
+
+    def setUp(self):
+        """Set up test data for Conversation model tests."""
+        self.user1 = User.objects.create_user(
+            email="user1@example.com", password="pass123", team_number=3647, phone="123-456-7890"
+        )
+        self.user2 = User.objects.create_user(
+            email="user2@example.com", password="pass123", team_number=5678, phone="234-567-8901"
+        )
+
+    def send(self, sender, receiver, text):
+        message = Message.objects.create(sender=sender, receiver=receiver, message=text)
+        Conversation.objects.record_message(message)
+        return message
+
+    def test_one_row_per_pair(self):
+        """Test that messages in both directions share one conversation."""
+        self.send(self.user1, self.user2, "Hi")
+        last = self.send(self.user2, self.user1, "Hello")
+        self.assertEqual(Conversation.objects.count(), 1)
+        conversation = Conversation.objects.get()
+        self.assertEqual(conversation.last_message, last)
+        self.assertEqual(conversation.other_user(self.user1), self.user2)
+
+    def test_unread_counts_per_side(self):
+        """Test that unread counts grow for the receiver and reset on mark_read."""
+        self.send(self.user1, self.user2, "One")
+        self.send(self.user1, self.user2, "Two")
+        conversation = Conversation.objects.get()
+        self.assertEqual(conversation.unread_for(self.user2), 2)
+        self.assertEqual(conversation.unread_for(self.user1), 0)
+
+        Conversation.objects.mark_read(self.user2, self.user1)
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.unread_for(self.user2), 0)
@@ -7,9 +7,17 @@ from api.serializers import (
     MessageSerializer,
     PartRequestSerializer,
     PartSaleSerializer,
-    PublicUserSerializer
+    PublicUserSerializer,
+    FieldSpec,
 )
+from api.projections import projection_for
+from api.renderers import ORJSONRenderer
+from address.models import Address, Country, Locality, State
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIRequestFactory
+from unittest import mock
+from utils.geolocation import GeocodingCache
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from datetime import datetime, timedelta
 import uuid
@@ -204,3 +212,127 @@ class MessageSerializerTest(TestCase):
         )
         serializer = MessageSerializer(message)
         self.assertEqual(serializer.data['receiver'], self.receiver.team_number)
+
+
+class UserAddressGeocodingTest(TestCase):
+    def setUp(self):
+        """Route geocoding through a local stand-in instead of Google"""
+        from api.tests.test_utils import FakeGeocoder
+
+        cache.clear()
+        self.geocoder = FakeGeocoder()
+        patcher = mock.patch("utils.geolocation.geocoder", GeocodingCache(client=self.geocoder))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user_data = {
+            "email": "geo@example.com",
+            "password": "testpass123",
+            "team_number": 3647,
+            "phone": "123-456-7890",
+            "address": "1001 Avenida De Las Americas, Houston, TX 77010",
+        }
+
+    def test_address_geocoded_once(self):
+        """Test registration geocodes once and takes coordinates from that result"""
+        with mock.patch("api.serializers.getTeamName", return_value="Millennium Falcons"):
+            serializer = UserSerializer(data=self.user_data)
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            user = serializer.save()
+        self.assertEqual(len(self.geocoder.calls), 1)
+        self.assertEqual(user.address.latitude, 29.7520)
+        self.assertEqual(user.address.longitude, -95.3583)
+        self.assertEqual(user.address.locality.name, "Houston")
+
+    def test_repeat_address_uses_cache(self):
+        """Test validating the same address again does not call the geocoder"""
+        UserSerializer(data=self.user_data).is_valid()
+        UserSerializer(data=dict(self.user_data, email="other@example.com")).is_valid()
+        self.assertEqual(len(self.geocoder.calls), 1)
+
+
+class ProjectionTest(TestCase):
+    def setUp(self):
+        """Listings covering null relations, images, addresses and hidden users"""
+        state = State.objects.create(name="Texas", code="TX", country=Country.objects.create(name="USA", code="US"))
+        locality = Locality.objects.create(name="Houston", postal_code="77010", state=state)
+        located = Address.objects.create(raw="1 Main St", locality=locality, latitude=29.75, longitude=-95.36)
+        bare = Address.objects.create(raw="Somewhere")
+        self.users = [
+            User.objects.create_user(
+                email="a@example.com", password="pass123", team_number=3647, phone="5550000001",
+                team_name="Millennium Falcons", is_active=True, address=located,
+            ),
+            User.objects.create_user(
+                email="b@example.com", password="pass123", team_number=254, phone="5550000002",
+                is_active=True, address=bare,
+            ),
+            User.objects.create_user(
+                email="c@example.com", password="pass123", team_number=118, phone="5550000003",
+                is_active=True,
+            ),
+            User.objects.create_user(
+                email="d@example.com", password="pass123", team_number=1678, phone="5550000004",
+            ),
+        ]
+        manufacturer = PartManufacturer.objects.create(name="REV", website="https://rev.example")
+        category = PartCategory.objects.create(name="Motors")
+        image = SimpleUploadedFile("neo.png", b"not really a png", content_type="image/png")
+        self.parts = [
+            Part.objects.create(
+                name="NEO", manufacturer=manufacturer, category=category, image=image,
+                description="Brushless   motor",
+            ),
+            Part.objects.create(name="Mystery Part"),
+        ]
+        for i, user in enumerate(self.users[:3]):
+            part = self.parts[i % 2]
+            PartRequest.objects.create(
+                part=part, user=user, quantity=i + 1, needed_for="Worlds\u2028Houston",
+                needed_date=datetime(2026, 4, 1).date() if i else None,
+            )
+            PartSale.objects.create(part=part, user=user, ask_price=i * 12.5, condition="New")
+
+    def assertSameBytes(self, serializer_class, queryset, spec=None):
+        expected = JSONRenderer().render(serializer_class(queryset, many=True, spec=spec).data)
+        actual = ORJSONRenderer().render(
+            projection_for(serializer_class, spec=spec).rows(queryset)
+        )
+        self.assertEqual(actual, expected)
+
+    def test_listings_match_serializers(self):
+        """Test that request and sale projections render the serializers' bytes"""
+        self.assertSameBytes(PartRequestSerializer, PartRequest.objects.order_by("quantity"))
+        self.assertSameBytes(PartSaleSerializer, PartSale.objects.order_by("ask_price"))
+
+    def test_parts_and_users_match_serializers(self):
+        """Test that part and public user projections render the serializers' bytes"""
+        self.assertSameBytes(PartSerializer, Part.objects.order_by("name"))
+        self.assertSameBytes(PublicUserSerializer, User.objects.public().order_by("team_number"))
+
+    def test_hidden_users_project_to_none(self):
+        """Test that inactive users are blanked like PublicUserSerializer does"""
+        rows = projection_for(PublicUserSerializer).rows(User.objects.order_by("team_number"))
+        self.assertEqual([row and row["team_number"] for row in rows], [118, 254, None, 3647])
+
+    def test_sparse_fieldsets_match_serializers(self):
+        """Test that ?fields= / ?expand= specs render the same bytes both ways"""
+        specs = [
+            FieldSpec({"id": {}, "quantity": {}, "part": {"name": {}}, "user": {}}, {"part": {}}),
+            FieldSpec(None, {}),
+            FieldSpec({"user": {"formatted_address": {}, "team_name": {}}}, {"user": {}}),
+            FieldSpec({"part": {"image": {}, "manufacturer": {}}}, {"part": {"category": {}}}),
+        ]
+        for spec in specs:
+            with self.subTest(fields=spec.fields, expand=spec.expand):
+                self.assertSameBytes(PartRequestSerializer, PartRequest.objects.order_by("quantity"), spec)
+                self.assertSameBytes(PartSaleSerializer, PartSale.objects.order_by("ask_price"), spec)
+
+    def test_unexpanded_objects_become_references(self):
+        """Test that nested objects left out of ?expand= are replaced by their keys"""
+        spec = FieldSpec({"id": {}, "part": {}, "user": {}}, {})
+        rows = PartRequestSerializer(PartRequest.objects.order_by("quantity"), many=True, spec=spec).data
+        self.assertEqual(
+            [(row["part_id"], row["user_team_number"]) for row in rows],
+            [(self.parts[0].id, 3647), (self.parts[1].id, 254), (self.parts[0].id, 118)],
+        )
+        self.assertEqual(set(rows[0]), {"id", "part_id", "user_team_number"})
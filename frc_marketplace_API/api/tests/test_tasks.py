@@ -0,0 +1,723 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from address.models import Address
+from django.core import mail
+from django.core.management import call_command
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from api.models import (
+    User,
+    Message,
+    Part,
+    PartManufacturer,
+    PartCategory,
+    PartRequest,
+    DigestState,
+    DigestLog,
+    FRCTeam,
+    TeamDirectoryPage,
+    ListingMatch,
+    PartSale,
+    ChangeLog,
+    SavedSearch,
+)
+from api import matching, metrics, notifications, percolator, presence
+from api.digest_rendering import DigestRenderer
+from api.tasks import (
+    flush_dm_notifications,
+    match_listing_task,
+    percolate_listing_task,
+    prepare_email,
+    send_email_batch_task,
+    queue_dm_notifications,
+    partition_by_region,
+    send_daily_requests_digest,
+    send_digest_chunk,
+    send_pending_activation_emails,
+    sync_team_directory,
+    prune_change_log,
+)
+from utils import blueAlliance
+
+
+def inline_chord(header):
+    """Stand-in for celery.chord that runs the chunks and the callback in this process."""
+    return lambda callback: callback([task() for task in header])
+
+
+def run_inline(test, *tasks):
+    """Make `task.delay` run the task in this process for the rest of `test`."""
+    for task in tasks:
+        patcher = mock.patch.object(task, "delay", task)
+        patcher.start()
+        test.addCleanup(patcher.stop)
+
+
+def sent_emails(send_email_batch_task):
+    """Email dicts handed to a patched send_email_batch_task."""
+    return [email for call in send_email_batch_task.delay.call_args_list for email in call.args[0]]
+
+
+def make_user(team_number, lat, lon, **kwargs):
+    address = Address.objects.create(raw=f"Team {team_number}", latitude=lat, longitude=lon)
+    return User.objects.create_user(
+        email=f"team{team_number}@example.com",
+        password="pass123",
+        team_number=team_number,
+        team_name=f"Team {team_number}",
+        phone=f"555{team_number:07d}",
+        address=address,
+        is_active=True,
+        **kwargs,
+    )
+
+
+class DailyDigestTest(TestCase):
+    def setUp(self):
+        """Teams in Houston, a nearby suburb, and Dallas (~225 miles away)"""
+        self.houston = make_user(3647, 29.7604, -95.3698)
+        self.katy = make_user(118, 29.7858, -95.8245)
+        self.dallas = make_user(148, 32.7767, -96.7970)
+        manufacturer = PartManufacturer.objects.create(name="REV Robotics")
+        category = PartCategory.objects.create(name="Motors")
+        self.part = Part.objects.create(name="NEO", manufacturer=manufacturer, category=category)
+
+    def request(self, user, days_until=None):
+        needed = timezone.now().date() + timedelta(days=days_until) if days_until is not None else None
+        return PartRequest.objects.create(part=self.part, user=user, needed_date=needed)
+
+    def run_digest(self):
+        with mock.patch("api.tasks.send_email_batch_task") as send_email_batch_task:
+            with mock.patch("api.tasks.chord", inline_chord):
+                with self.captureOnCommitCallbacks(execute=True):
+                    send_daily_requests_digest()
+        return {
+            email["recipient_list"][0]: email
+            for call in send_email_batch_task.delay.call_args_list
+            for email in call.args[0]
+        }
+
+    def test_digest_only_includes_nearby_requests(self):
+        """Test each team is sent requests within 50 miles, excluding their own"""
+        self.request(self.katy, days_until=3)
+        self.request(self.dallas, days_until=1)
+        emails = self.run_digest()
+
+        self.assertEqual(set(emails), {self.houston.email})
+        self.assertIn("Team 118", emails[self.houston.email]["message"])
+        self.assertNotIn("Team 148", emails[self.houston.email]["message"])
+
+    def test_digest_orders_by_days_until(self):
+        """Test the soonest-needed requests come first and undated ones last"""
+        later = self.request(self.katy, days_until=10)
+        undated = self.request(self.katy)
+        sooner = self.request(self.katy, days_until=2)
+        emails = self.run_digest()
+
+        message = emails[self.houston.email]["message"]
+        positions = [message.index(str(r.id)) for r in (sooner, later, undated)]
+        self.assertEqual(positions, sorted(positions))
+
+    def test_chunked_digest_matches_single_chunk(self):
+        """Splitting users into one-user chunks sends the same emails"""
+        self.request(self.katy, days_until=3)
+        self.request(self.dallas, days_until=1)
+        single = self.run_digest()
+        DigestState.objects.all().delete()
+        with mock.patch("api.tasks.DIGEST_CHUNK_SIZE", 1):
+            chunked = self.run_digest()
+        self.assertEqual(chunked, single)
+
+    def test_chunk_reports_timing(self):
+        """Each chunk reports what it processed and how long it took"""
+        request = self.request(self.katy, days_until=3)
+        with mock.patch("api.tasks.send_email_batch_task"):
+            stats = send_digest_chunk(
+                0, [str(self.houston.id)], [str(request.id)], timezone.now().isoformat()
+            )
+        self.assertEqual(
+            {key: stats[key] for key in ("chunk", "users", "skipped", "requests", "emails")},
+            {"chunk": 0, "users": 1, "skipped": 0, "requests": 1, "emails": 1},
+        )
+        self.assertGreaterEqual(stats["seconds"], 0)
+
+    def test_rerun_sends_nothing_new(self):
+        """Running the digest again never re-sends requests that already went out"""
+        first = self.request(self.katy, days_until=3)
+        self.assertEqual(set(self.run_digest()), {self.houston.email})
+        self.assertEqual(self.run_digest(), {})
+
+        state = DigestState.objects.get(user=self.houston)
+        self.assertEqual(state.last_request, first)
+        log = DigestLog.objects.get(user=self.houston)
+        self.assertEqual(log.request_ids, [str(first.id)])
+
+    def test_requests_from_before_created_at_are_not_sent(self):
+        """Old requests whose created_at was filled in at deploy time stay out of a first run"""
+        old = self.request(self.katy, days_until=3)
+        PartRequest.objects.filter(id=old.id).update(
+            request_date=timezone.now().date() - timedelta(days=30)
+        )
+        new = self.request(self.katy, days_until=5)
+        message = self.run_digest()[self.houston.email]["message"]
+
+        self.assertIn(str(new.id), message)
+        self.assertNotIn(str(old.id), message)
+
+    def test_next_run_only_includes_new_requests(self):
+        """Each run covers the requests created since the user's last digest"""
+        first = self.request(self.katy, days_until=3)
+        self.run_digest()
+        second = self.request(self.katy, days_until=5)
+        message = self.run_digest()[self.houston.email]["message"]
+
+        self.assertIn(str(second.id), message)
+        self.assertNotIn(str(first.id), message)
+        self.assertEqual(DigestLog.objects.filter(user=self.houston).count(), 2)
+
+    def test_retried_chunk_is_skipped(self):
+        """A chunk re-run for the same cutoff skips users it already covered"""
+        request = self.request(self.katy, days_until=3)
+        cutoff = timezone.now().isoformat()
+        args = (0, [str(self.houston.id)], [str(request.id)], cutoff)
+        with mock.patch("api.tasks.send_email_batch_task"):
+            send_digest_chunk(*args)
+            stats = send_digest_chunk(*args)
+        self.assertEqual((stats["skipped"], stats["emails"]), (1, 0))
+
+    def test_partition_keeps_regions_together(self):
+        """Users are grouped by region cell before being cut into chunks"""
+        users = [("a", 29.7, -95.3), ("b", 40.7, -74.0), ("c", 29.8, -95.8), ("d", 40.6, -73.9)]
+        chunks = partition_by_region(users, chunk_size=2)
+        self.assertEqual(sorted(sorted(u[0] for u in chunk) for chunk in chunks), [["a", "c"], ["b", "d"]])
+
+    def test_request_cards_render_once_per_run(self):
+        """Neighbours share a request's card; only the distance differs"""
+        # A second Houston team sees the same Katy request
+        make_user(624, 29.75, -95.36)
+        self.request(self.katy, days_until=3)
+        with mock.patch.object(
+            DigestRenderer, "_render_card", autospec=True, side_effect=DigestRenderer._render_card
+        ) as render_card:
+            emails = self.run_digest()
+
+        self.assertEqual(render_card.call_count, 1)
+        self.assertEqual(set(emails), {self.houston.email, "team624@example.com"})
+        self.assertIn("miles away", emails[self.houston.email]["message"])
+
+
+class TeamDirectorySyncTest(TestCase):
+    def setUp(self):
+        """Serve two TBA pages of teams followed by an empty page"""
+        cache.clear()
+        self.pages = {
+            0: [{"team_number": 254, "nickname": "The Cheesy Poofs", "city": "San Jose"}],
+            1: [{"team_number": 3647, "nickname": "Millennium Falcons", "city": "Torrance"}],
+            2: [],
+        }
+        self.requests = []
+
+    def fake_fetch(self, page, etag=None, last_modified=None):
+        self.requests.append((page, etag))
+        if etag == f"etag-{page}":
+            return 304, None, {}
+        return 200, self.pages[page], {"ETag": f"etag-{page}", "Last-Modified": "Mon, 06 Jan 2025 00:00:00 GMT"}
+
+    def test_sync_pages_into_directory(self):
+        """Test every page is stored with its validators"""
+        with mock.patch("api.tasks.fetch_teams_page", self.fake_fetch):
+            stats = sync_team_directory()
+        self.assertEqual(stats["teams"], 2)
+        self.assertEqual(FRCTeam.objects.get(team_number=254).city, "San Jose")
+        self.assertEqual(TeamDirectoryPage.objects.get(page=1).etag, "etag-1")
+
+    def test_resync_sends_validators_and_skips_unchanged_pages(self):
+        """Test a second sync is all conditional GETs answered with 304"""
+        with mock.patch("api.tasks.fetch_teams_page", self.fake_fetch):
+            sync_team_directory()
+            self.requests.clear()
+            stats = sync_team_directory()
+        self.assertEqual(self.requests, [(0, "etag-0"), (1, "etag-1"), (2, "etag-2")])
+        self.assertEqual(stats["unchanged"], 3)
+        self.assertEqual(stats["teams"], 0)
+
+    def test_get_team_name_reads_directory(self):
+        """Test getTeamName answers from the local table without any HTTP call"""
+        FRCTeam.objects.create(team_number=3647, nickname="Millennium Falcons")
+        with mock.patch("utils.blueAlliance.get_session") as get_session:
+            self.assertEqual(blueAlliance.getTeamName(3647), "Millennium Falcons")
+            self.assertEqual(blueAlliance.getTeamName("3647"), "Millennium Falcons")
+        get_session.assert_not_called()
+
+    def test_sync_refreshes_cached_names(self):
+        """Test a nickname cached before a sync is replaced by the synced one"""
+        FRCTeam.objects.create(team_number=254, nickname="Cheesy Poofs")
+        self.assertEqual(blueAlliance.getTeamName(254), "Cheesy Poofs")
+        with mock.patch("api.tasks.fetch_teams_page", self.fake_fetch):
+            sync_team_directory()
+        self.assertEqual(blueAlliance.getTeamName(254), "The Cheesy Poofs")
+
+    def test_get_team_name_falls_back_to_http(self):
+        """Test a directory miss fetches from TBA once and stores the team"""
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {"team_number": 118, "nickname": "Robonauts"}
+        with mock.patch("utils.blueAlliance.get_session") as get_session:
+            get_session.return_value.get.return_value = response
+            self.assertEqual(blueAlliance.getTeamName(118), "Robonauts")
+            self.assertEqual(blueAlliance.getTeamName(118), "Robonauts")
+        self.assertEqual(get_session.return_value.get.call_count, 1)
+        self.assertEqual(
+            get_session.return_value.get.call_args.kwargs["timeout"], blueAlliance.TBA_TIMEOUT
+        )
+
+
+@mock.patch("api.signals.send_activation_email")
+class UserActivationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="pending@example.com",
+            password="pass123",
+            team_number=1678,
+            phone="5550001678",
+        )
+        self.user = User.objects.get(pk=self.user.pk)
+
+    def test_new_inactive_user_is_pending(self, send):
+        """Signup flags the user so the activation email is owed"""
+        self.assertTrue(self.user.activation_email_pending)
+        self.assertEqual(self.user.changed_fields, set())
+
+    def test_save_without_activation_is_single_query(self, send):
+        """Ordinary saves no longer re-read the user row"""
+        self.user.set_password("another-pass")
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            with self.assertNumQueries(1):
+                self.user.save()
+        # The only deferred work is retiring cached user lists
+        self.assertEqual(len(callbacks), 1)
+        with mock.patch("api.signals.bump_version") as bump_version:
+            callbacks[0]()
+        bump_version.assert_called_once_with(User)
+        send.delay.assert_not_called()
+
+    def test_activation_queues_email_on_commit(self, send):
+        """False -> True queues one email after the transaction commits"""
+        self.user.is_active = True
+        self.assertEqual(self.user.changed_fields, {"is_active"})
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.user.save()
+        send.delay.assert_not_called()
+
+        for callback in callbacks:
+            callback()
+        send.delay.assert_called_once_with(self.user.pk)
+        self.assertFalse(User.objects.get(pk=self.user.pk).activation_email_pending)
+        self.assertEqual(self.user.changed_fields, set())
+
+    def test_resave_active_user_sends_nothing(self, send):
+        """Saving an already active user is not an activation"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = True
+            self.user.save()
+            self.user.full_name = "Citrus Circuits"
+            self.user.save()
+        send.delay.assert_called_once()
+
+    def test_direct_db_activation_is_swept(self, send):
+        """Activations that bypass the ORM are sent exactly once by the sweep"""
+        User.objects.filter(pk=self.user.pk).update(is_active=True)
+        with mock.patch("api.tasks.send_activation_email") as task_send:
+            self.assertEqual(send_pending_activation_emails(), 1)
+            self.assertEqual(send_pending_activation_emails(), 0)
+        task_send.delay.assert_called_once_with(self.user.pk)
+
+    def test_sweep_skips_users_already_emailed(self, send):
+        """The signal's claim stops the sweep from sending a duplicate"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = True
+            self.user.save()
+        with mock.patch("api.tasks.send_activation_email") as task_send:
+            self.assertEqual(send_pending_activation_emails(), 0)
+        task_send.delay.assert_not_called()
+
+    def test_backfill_flags_users_from_before_the_flag(self, send):
+        """Inactive users created before the flag existed are swept once activated"""
+        User.objects.filter(pk=self.user.pk).update(activation_email_pending=False)
+        active = make_user(254, 37.3, -121.9)
+        call_command("backfill_activation_emails", stdout=StringIO())
+        self.assertTrue(User.objects.get(pk=self.user.pk).activation_email_pending)
+        self.assertFalse(User.objects.get(pk=active.pk).activation_email_pending)
+
+        User.objects.filter(pk=self.user.pk).update(is_active=True)
+        with mock.patch("api.tasks.send_activation_email") as task_send:
+            self.assertEqual(send_pending_activation_emails(), 1)
+        task_send.delay.assert_called_once_with(self.user.pk)
+
+
+@mock.patch("api.tasks.send_email_task")
+@mock.patch("api.tasks.flush_dm_notifications.apply_async")
+class DMDigestTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.recipient = make_user(1678, 38.5, -121.7)
+        self.poofs = make_user(254, 37.3, -121.9)
+        self.cheesy = make_user(2056, 43.2, -79.8)
+
+    def send(self, sender, text):
+        message = Message.objects.create(sender=sender, receiver=self.recipient, message=text)
+        queue_dm_notifications([message])
+
+    def test_burst_schedules_one_flush(self, schedule_flush, send_email):
+        """Only the first message of a burst schedules a flush"""
+        for i in range(5):
+            self.send(self.poofs, f"message {i}")
+        schedule_flush.assert_called_once_with((str(self.recipient.id),), countdown=120)
+
+    def test_flush_waits_for_quiet_window(self, schedule_flush, send_email):
+        """A flush that fires while the chat is still active pushes itself back"""
+        self.send(self.poofs, "hello")
+        flush_dm_notifications(str(self.recipient.id))
+        self.assertEqual(schedule_flush.call_count, 2)
+        send_email.delay.assert_not_called()
+
+    @override_settings(DM_NOTIFICATION_WINDOW=0)
+    def test_burst_becomes_one_email(self, schedule_flush, send_email):
+        """Everything pending goes out in one email grouped by sender"""
+        self.send(self.poofs, "Do you have spare NEO motors?")
+        self.send(self.poofs, "We can trade bumpers")
+        self.send(self.cheesy, "x" * 500)
+        flush_dm_notifications(str(self.recipient.id))
+
+        send_email.delay.assert_called_once()
+        email = send_email.delay.call_args.kwargs
+        self.assertEqual(email["subject"], "3 New Messages from 2 Teams")
+        self.assertIn("Do you have spare NEO motors?", email["message"])
+        self.assertIn("We can trade bumpers", email["html_message"])
+        self.assertNotIn("x" * 300, email["message"])
+        self.assertEqual(notifications.savings(), {"tasks_saved": 4, "emails_saved": 2})
+
+        # Nothing is left to send twice
+        flush_dm_notifications(str(self.recipient.id))
+        send_email.delay.assert_called_once()
+
+    @override_settings(DM_NOTIFICATION_WINDOW=0)
+    def test_failed_send_keeps_entries(self, schedule_flush, send_email):
+        """Entries are only dropped once their email is queued, so a retry still sends them"""
+        self.send(self.poofs, "Do you have spare NEO motors?")
+        send_email.delay.side_effect = ConnectionError("broker down")
+        with self.assertRaises(ConnectionError):
+            flush_dm_notifications(str(self.recipient.id))
+
+        send_email.delay.side_effect = None
+        flush_dm_notifications(str(self.recipient.id))
+        self.assertEqual(send_email.delay.call_count, 2)
+        self.assertIn("spare NEO motors", send_email.delay.call_args.kwargs["message"])
+        flush_dm_notifications(str(self.recipient.id))
+        self.assertEqual(send_email.delay.call_count, 2)
+
+    @override_settings(DM_NOTIFICATION_WINDOW=0)
+    def test_last_retry_gives_up_and_unschedules(self, schedule_flush, send_email):
+        """After the final retry the flush stops raising and the next message schedules another"""
+        self.send(self.poofs, "Do you have spare NEO motors?")
+        send_email.delay.side_effect = ConnectionError("broker down")
+        result = flush_dm_notifications.apply(
+            args=(str(self.recipient.id),), retries=flush_dm_notifications.max_retries
+        )
+        self.assertTrue(result.successful())
+        self.assertEqual(schedule_flush.call_count, 1)
+
+        send_email.delay.side_effect = None
+        self.send(self.poofs, "We can trade bumpers")
+        self.assertEqual(schedule_flush.call_count, 2)
+        flush_dm_notifications(str(self.recipient.id))
+        self.assertIn("spare NEO motors", send_email.delay.call_args.kwargs["message"])
+
+    def test_lost_flush_does_not_block_recipient(self, schedule_flush, send_email):
+        """The scheduled marker expires soon after the longest wait, not after a day"""
+        self.send(self.poofs, "hello")
+        key = cache.make_and_validate_key(f"dm-pending:{self.recipient.id}:scheduled")
+        ttl = cache._cache.get_client(key).ttl(key)
+        self.assertTrue(0 < ttl <= 900 + 120, ttl)
+
+    @override_settings(DM_NOTIFICATION_WINDOW=0)
+    def test_recipient_online_at_flush(self, schedule_flush, send_email):
+        """Pending messages are dropped, not emailed, once the recipient is online"""
+        self.send(self.poofs, "hello")
+        presence.heartbeat(1678, "tab-1")
+        flush_dm_notifications(str(self.recipient.id))
+        send_email.delay.assert_not_called()
+        self.assertEqual(metrics.get(notifications.SUPPRESSED), 1)
+
+
+class FlakyConnection:
+    """Email connection double that rejects one address and counts sessions."""
+
+    def __init__(self, bad_address):
+        self.bad_address = bad_address
+        self.opened = 0
+        self.sent = []
+
+    def open(self):
+        self.opened += 1
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        for message in messages:
+            if self.bad_address in message.to:
+                raise OSError("550 mailbox unavailable")
+            self.sent.append(message)
+        return len(messages)
+
+
+class EmailBatchTest(TestCase):
+    def emails(self, count):
+        return [
+            prepare_email(f"Digest {i}", "body", "market@example.com", [f"team{i}@example.com"], "<p>body</p>")
+            for i in range(count)
+        ]
+
+    def test_batch_sends_every_email(self):
+        """All emails go out, with their HTML alternative"""
+        result = send_email_batch_task(self.emails(3))
+        self.assertEqual(result, {"sent": 3, "retrying": 0, "failed": 0})
+        self.assertEqual([m.to for m in mail.outbox], [[f"team{i}@example.com"] for i in range(3)])
+        self.assertEqual(mail.outbox[0].alternatives[0][1], "text/html")
+
+    @mock.patch("api.tasks.send_email_batch_task.apply_async")
+    def test_only_failed_emails_are_retried(self, apply_async):
+        """One session for the batch; a rejected email is retried alone with its attempt count"""
+        emails = self.emails(3)
+        connection = FlakyConnection("team1@example.com")
+        with mock.patch("api.tasks.get_connection", return_value=connection):
+            result = send_email_batch_task(emails)
+
+        self.assertEqual(result, {"sent": 2, "retrying": 1, "failed": 0})
+        self.assertEqual(len(connection.sent), 2)
+        # Reopened once after the failure
+        self.assertEqual(connection.opened, 2)
+        apply_async.assert_called_once_with(([emails[1]], [1]), countdown=5)
+
+    @mock.patch("api.tasks.send_email_batch_task.apply_async")
+    def test_gives_up_after_max_attempts(self, apply_async):
+        """An email that keeps failing is dropped after EMAIL_MAX_ATTEMPTS"""
+        connection = FlakyConnection("team0@example.com")
+        with mock.patch("api.tasks.get_connection", return_value=connection):
+            result = send_email_batch_task(self.emails(1), [3])
+        self.assertEqual(result, {"sent": 0, "retrying": 0, "failed": 1})
+        apply_async.assert_not_called()
+
+
+class ListingMatchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        run_inline(self, match_listing_task, percolate_listing_task)
+        self.buyer = make_user(3647, 29.76, -95.37)
+        self.near_seller = make_user(118, 29.62, -95.63)
+        self.far_seller = make_user(254, 37.34, -121.89)
+        self.part = Part.objects.create(name="NEO Brushless Motor")
+        self.other_part = Part.objects.create(name="Falcon 500")
+
+    def test_price_conventions(self):
+        """Free sales suit everyone, trades suit traders, and low bids score by ratio"""
+        self.assertEqual(matching.price_score(Decimal("50"), matching.FREE), 1.0)
+        self.assertEqual(matching.price_score(matching.TRADE, matching.TRADE), 1.0)
+        self.assertEqual(matching.price_score(Decimal("20"), Decimal("40")), 0.5)
+        self.assertEqual(matching.price_score(Decimal("60"), Decimal("40")), 1.0)
+        self.assertLess(
+            matching.price_score(matching.FREE, Decimal("40")),
+            matching.price_score(matching.TRADE, Decimal("40")),
+        )
+
+    def test_new_listing_matches_same_part_only(self):
+        """A new request is matched with other teams' sales of its part, nearest first"""
+        with self.captureOnCommitCallbacks(execute=True):
+            PartSale.objects.create(part=self.part, user=self.far_seller, ask_price=40)
+            PartSale.objects.create(part=self.part, user=self.near_seller, ask_price=40)
+            PartSale.objects.create(part=self.other_part, user=self.near_seller, ask_price=40)
+            PartSale.objects.create(part=self.part, user=self.buyer, ask_price=40)
+        with self.captureOnCommitCallbacks(execute=True):
+            request = PartRequest.objects.create(part=self.part, user=self.buyer, bid_price=40)
+
+        matches = list(ListingMatch.objects.filter(request=request).order_by("-score"))
+        self.assertEqual(
+            [match.sale.user.team_number for match in matches], [118, 254]
+        )
+        self.assertLess(matches[0].distance_miles, 30)
+
+    def test_edits_rescore_without_duplicates(self):
+        """Saving a listing again updates its matches in place"""
+        sale = PartSale.objects.create(part=self.part, user=self.near_seller, ask_price=40)
+        with self.captureOnCommitCallbacks(execute=True):
+            request = PartRequest.objects.create(part=self.part, user=self.buyer, bid_price=10)
+        low = ListingMatch.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            request.bid_price = 40
+            request.save()
+        high = ListingMatch.objects.get()
+        self.assertEqual(high.id, low.id)
+        self.assertGreater(high.score, low.score)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            request.part = self.other_part
+            request.save()
+        self.assertFalse(ListingMatch.objects.exists())
+        self.assertEqual(sale.matches.count(), 0)
+
+    def test_offline_teams_get_one_email(self):
+        """Each offline team gets a single email covering its new matches"""
+        PartSale.objects.create(part=self.part, user=self.near_seller, ask_price=0)
+        PartSale.objects.create(part=self.part, user=self.far_seller, ask_price=-1)
+        presence.heartbeat(118, "socket")
+        with mock.patch("api.tasks.send_email_batch_task") as send_email_batch_task:
+            with self.captureOnCommitCallbacks(execute=True):
+                PartRequest.objects.create(part=self.part, user=self.buyer)
+
+        emails = {email["recipient_list"][0]: email for email in sent_emails(send_email_batch_task)}
+        self.assertEqual(sorted(emails), ["team254@example.com", "team3647@example.com"])
+        buyer_email = emails["team3647@example.com"]
+        self.assertEqual(buyer_email["subject"], "2 New Matches for Your Listings")
+        self.assertIn("Team 118 is offering NEO Brushless Motor", buyer_email["message"])
+
+    def test_pairs_beyond_the_cap_are_kept(self):
+        """A rerun adds at most the cap in new pairs but keeps ones the other side made"""
+        request = PartRequest.objects.create(part=self.part, user=self.buyer, bid_price=40)
+        with mock.patch.object(matching, "MAX_MATCHES_PER_LISTING", 1):
+            with self.captureOnCommitCallbacks(execute=True):
+                PartSale.objects.create(part=self.part, user=self.near_seller, ask_price=40)
+                PartSale.objects.create(part=self.part, user=self.far_seller, ask_price=40)
+            self.assertEqual(request.matches.count(), 2)
+
+            new = matching.match_listing(PartRequest, request.id)
+        self.assertEqual(new, [])
+        self.assertEqual(request.matches.count(), 2)
+
+
+class SavedSearchPercolationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        run_inline(self, match_listing_task, percolate_listing_task)
+        self.buyer = make_user(3647, 29.76, -95.37)
+        self.near_seller = make_user(118, 29.62, -95.63)
+        self.far_seller = make_user(254, 37.34, -121.89)
+        self.rev = PartManufacturer.objects.create(name="REV Robotics")
+        self.motors = PartCategory.objects.create(name="Motors")
+        self.neo = Part.objects.create(
+            name="NEO Brushless Motor", manufacturer=self.rev, category=self.motors
+        )
+        self.falcon = Part.objects.create(name="Falcon 500", category=self.motors)
+
+    def save_search(self, **kwargs):
+        address = self.buyer.address
+        if kwargs.get("radius_miles") is not None:
+            kwargs.update(latitude=address.latitude, longitude=address.longitude)
+        return SavedSearch.objects.create(user=self.buyer, **kwargs)
+
+    def test_searches_are_filed_under_their_most_selective_criterion(self):
+        """Part beats manufacturer beats category beats radius beats words"""
+        self.assertEqual(
+            self.save_search(part=self.neo, manufacturer=self.rev).buckets,
+            [f"part:{self.neo.id}"],
+        )
+        self.assertEqual(
+            self.save_search(category=self.motors, query="neo").buckets,
+            [f"category:{self.motors.id}"],
+        )
+        self.assertIn("region:29.264", self.save_search(radius_miles=25).buckets)
+        self.assertEqual(self.save_search(query="NEO motors").buckets, ["term:motor"])
+        self.assertEqual(self.save_search(kind=SavedSearch.SALES, max_price=50).buckets, ["all"])
+
+    def test_only_searches_sharing_a_bucket_are_checked(self):
+        """Searches for other parts, categories or words are never loaded"""
+        falcon_search = self.save_search(part=self.falcon)
+        for i in range(20):
+            self.save_search(query=f"gearbox{i}")
+        neo_search = self.save_search(query="neo motor")
+        category_search = self.save_search(category=self.motors, kind=SavedSearch.SALES)
+
+        listing, hits = percolator.percolate(
+            PartSale, PartSale.objects.create(part=self.neo, user=self.near_seller, ask_price=40).pk
+        )
+        self.assertEqual({search.id for search in hits}, {neo_search.id, category_search.id})
+        self.assertEqual(metrics.get(percolator.CANDIDATES), 2)
+        self.assertNotIn(falcon_search, hits)
+
+    def test_price_radius_and_kind_are_exact(self):
+        """Candidates are checked against every criterion, not just their bucket"""
+        cheap = self.save_search(query="neo", max_price=30)
+        near = self.save_search(query="neo", radius_miles=50)
+        requests_only = self.save_search(query="neo", kind=SavedSearch.REQUESTS)
+        trade = self.save_search(query="neo", max_price=10)
+
+        near_sale = PartSale.objects.create(part=self.neo, user=self.near_seller, ask_price=40)
+        self.assertEqual(percolator.percolate(PartSale, near_sale.pk)[1], [near])
+        far_trade = PartSale.objects.create(part=self.neo, user=self.far_seller, ask_price=-1)
+        self.assertEqual(
+            {search.id for search in percolator.percolate(PartSale, far_trade.pk)[1]},
+            {cheap.id, trade.id},
+        )
+        far_request = PartRequest.objects.create(part=self.neo, user=self.far_seller)
+        self.assertEqual(
+            {search.id for search in percolator.percolate(PartRequest, far_request.pk)[1]},
+            {cheap.id, trade.id, requests_only.id},
+        )
+
+    def test_words_match_whole_words(self):
+        """Query words must each be a word of the part, not a fragment of one"""
+        self.save_search(query="neo")
+        fragment = self.save_search(query="ne")
+        sale = PartSale.objects.create(part=self.neo, user=self.near_seller, ask_price=40)
+        hits = percolator.percolate(PartSale, sale.pk)[1]
+        self.assertEqual(len(hits), 1)
+        self.assertNotIn(fragment, hits)
+
+    def test_own_listings_are_not_reported(self):
+        """A team's saved search ignores the team's own listings"""
+        self.save_search(part=self.neo)
+        sale = PartSale.objects.create(part=self.neo, user=self.buyer, ask_price=40)
+        self.assertEqual(percolator.percolate(PartSale, sale.pk)[1], [])
+
+    def test_offline_owner_gets_one_email_per_listing(self):
+        """A new listing matching several of a team's searches sends one email; edits send none"""
+        self.save_search(name="Motors", category=self.motors)
+        self.save_search(name="REV", manufacturer=self.rev)
+        with mock.patch("api.tasks.send_email_batch_task") as send_email_batch_task:
+            with self.captureOnCommitCallbacks(execute=True):
+                sale = PartSale.objects.create(part=self.neo, user=self.near_seller, ask_price=0)
+
+            emails = sent_emails(send_email_batch_task)
+            self.assertEqual(len(emails), 1)
+            self.assertEqual(emails[0]["recipient_list"], ["team3647@example.com"])
+            self.assertEqual(emails[0]["subject"], "New Sale for NEO Brushless Motor")
+            self.assertIn("Team 118 is offering NEO Brushless Motor (free)", emails[0]["message"])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                sale.quantity = 3
+                sale.save()
+            self.assertEqual(len(sent_emails(send_email_batch_task)), 1)
+
+    def test_online_owner_is_not_emailed(self):
+        """Teams with a live socket get the push instead of an email"""
+        self.save_search(part=self.neo)
+        presence.heartbeat(3647, "socket")
+        with mock.patch("api.tasks.send_email_batch_task") as send_email_batch_task:
+            with self.captureOnCommitCallbacks(execute=True):
+                PartRequest.objects.create(part=self.neo, user=self.far_seller)
+        self.assertEqual(sent_emails(send_email_batch_task), [])
+
+
+class ChangeLogPruneTest(TestCase):
+    def test_old_rows_are_pruned(self):
+        """Rows older than the retention window are deleted, newer ones kept"""
+        with self.captureOnCommitCallbacks(execute=True):
+            part = Part.objects.create(name="NEO Brushless Motor")
+        ChangeLog.objects.create(
+            kind="parts", object_id=str(part.id), action=ChangeLog.UPDATED,
+            changed_at=timezone.now() - timedelta(days=30),
+        )
+        self.assertEqual(prune_change_log(), 1)
+        self.assertEqual(list(ChangeLog.objects.values_list("action", flat=True)), ["created"])
@@ -0,0 +1,146 @@
+import random
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from utils.utils import (
+    haversine,
+    haversine_many,
+    haversine_matrix,
+    within_radius,
+    nearest_k,
+    GridIndex,
+)
+from utils.geolocation import GeocodingCache
+
+
+class GridIndexTest(SimpleTestCase):
+    def setUp(self):
+        """Scatter points worldwide plus clusters near the antimeridian and a pole"""
+        rng = random.Random(3647)
+        self.points = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(500)]
+        self.points += [(rng.uniform(-60, 60), rng.uniform(178, 180)) for _ in range(100)]
+        self.points += [(rng.uniform(-60, 60), rng.uniform(-180, -178)) for _ in range(100)]
+        self.points += [(rng.uniform(88, 90), rng.uniform(-180, 180)) for _ in range(100)]
+        self.index = GridIndex(cell_degrees=1.0)
+        for i, (lat, lon) in enumerate(self.points):
+            self.index.insert(lat, lon, i)
+
+    def brute_force(self, lat, lon, radius):
+        return {
+            i
+            for i, (plat, plon) in enumerate(self.points)
+            if haversine(lat, lon, plat, plon) <= radius
+        }
+
+    def test_within_matches_brute_force(self):
+        """Test grid queries return exactly the brute-force radius matches"""
+        queries = [(29.75, -95.36), (0.0, 179.9), (10.0, -179.95), (89.5, 0.0), (-45.0, 20.0)]
+        for lat, lon in queries + self.points[::50]:
+            for radius in (50, 300):
+                found = {i for i, _ in self.index.within(lat, lon, radius)}
+                self.assertEqual(found, self.brute_force(lat, lon, radius), (lat, lon, radius))
+
+    def test_within_reports_haversine_distance(self):
+        """Test reported distances are the scalar haversine distances"""
+        lat, lon = self.points[0]
+        for i, distance in self.index.within(lat, lon, 500):
+            self.assertEqual(distance, haversine(lat, lon, *self.points[i]))
+
+
+class BatchHaversineTest(SimpleTestCase):
+    def setUp(self):
+        """Random points across the continental US"""
+        rng = random.Random(254)
+        self.lats = [rng.uniform(25, 49) for _ in range(300)]
+        self.lons = [rng.uniform(-124, -67) for _ in range(300)]
+        self.origin = (29.7604, -95.3698)
+
+    def scalar(self, lat, lon):
+        return [haversine(lat, lon, la, lo) for la, lo in zip(self.lats, self.lons)]
+
+    def test_haversine_many_matches_scalar(self):
+        """Test the vectorized distances agree with the scalar function"""
+        distances = haversine_many(*self.origin, self.lats, self.lons)
+        for got, expected in zip(distances, self.scalar(*self.origin)):
+            self.assertAlmostEqual(got, expected, places=6)
+
+    def test_haversine_matrix_matches_scalar(self):
+        """Test each matrix row equals the one-to-many distances"""
+        matrix = haversine_matrix(self.lats[:5], self.lons[:5], self.lats, self.lons)
+        self.assertEqual(matrix.shape, (5, 300))
+        for row, (lat, lon) in zip(matrix, zip(self.lats, self.lons)):
+            for got, expected in zip(row, self.scalar(lat, lon)):
+                self.assertAlmostEqual(got, expected, places=6)
+
+    def test_within_radius_and_nearest_k(self):
+        """Test radius filtering and top-k selection against a sorted scalar scan"""
+        expected = sorted(
+            (d, i) for i, d in enumerate(self.scalar(*self.origin))
+        )
+        indices, distances = within_radius(*self.origin, self.lats, self.lons, 500)
+        self.assertEqual(list(indices), [i for d, i in expected if d <= 500])
+        self.assertTrue(all(d <= 500 for d in distances))
+
+        indices, distances = nearest_k(*self.origin, self.lats, self.lons, 10)
+        self.assertEqual(list(indices), [i for d, i in expected[:10]])
+
+        indices, _ = nearest_k(*self.origin, self.lats, self.lons, 10, radius_miles=1)
+        self.assertEqual(list(indices), [i for d, i in expected if d <= 1][:10])
+
+
+class FakeGeocoder:
+    """Local stand-in for googlemaps.Client that counts lookups"""
+
+    def __init__(self):
+        self.calls = []
+
+    def geocode(self, address):
+        self.calls.append(address)
+        if "nowhere" in address.lower():
+            return []
+        return [
+            {
+                "formatted_address": "1001 Avenida De Las Americas, Houston, TX 77010, USA",
+                "address_components": [
+                    {"long_name": "1001", "types": ["street_number"]},
+                    {"long_name": "Avenida De Las Americas", "types": ["route"]},
+                    {"long_name": "Houston", "types": ["locality"]},
+                    {"long_name": "Texas", "types": ["administrative_area_level_1"]},
+                    {"long_name": "United States", "types": ["country"]},
+                    {"long_name": "77010", "types": ["postal_code"]},
+                ],
+                "geometry": {"location": {"lat": 29.7520, "lng": -95.3583}},
+            }
+        ]
+
+
+class GeocodingCacheTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = FakeGeocoder()
+        self.geocoder = GeocodingCache(client=self.client, maxsize=2)
+
+    def test_normalized_addresses_share_one_lookup(self):
+        """Test case and spacing variants hit the cache after the first lookup"""
+        first = self.geocoder.geocode("1001 Avenida De Las Americas, Houston, TX")
+        second = self.geocoder.geocode("  1001 avenida de las americas ,houston,  tx ")
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.client.calls), 1)
+
+    def test_shared_tier_survives_process_cache(self):
+        """Test a cold in-process LRU falls back to the shared cache, not the API"""
+        self.geocoder.geocode("1001 Avenida De Las Americas")
+        self.geocoder.clear_local()
+        self.geocoder.geocode("1001 Avenida De Las Americas")
+        self.assertEqual(len(self.client.calls), 1)
+
+    def test_local_lru_is_bounded(self):
+        """Test the in-process tier evicts beyond maxsize"""
+        for address in ["A St", "B St", "C St"]:
+            self.geocoder.geocode(address)
+        self.assertEqual(len(self.geocoder._local), 2)
+
+    def test_empty_results_are_not_cached(self):
+        """Test failed lookups are retried rather than remembered"""
+        self.assertEqual(self.geocoder.geocode("Nowhere"), [])
+        self.geocoder.geocode("Nowhere")
+        self.assertEqual(len(self.client.calls), 2)
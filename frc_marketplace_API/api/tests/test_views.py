@@ -1,9 +1,21 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.test import APIClient
 from rest_framework import status
-from api.models import User, Part, PartManufacturer, PartCategory, Message, PartRequest, PartSale
+from address.models import Address
+from api.models import (
+    User, Part, PartManufacturer, PartCategory, Message, PartRequest, PartSale, SavedSearch,
+)
+from api.pagination import encode_cursor
+from api.tasks import match_listing_task, percolate_listing_task
+from api.views import request_view
 import uuid
+from unittest import mock
 from datetime import datetime, timedelta
 
 class UserViewsTest(TestCase):
@@ -114,6 +126,34 @@ class MessageViewsTest(TestCase):
         response = self.client.post("/api/message/", message_data, format="json")
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_dm_list_orders_conversations(self):
+        """Test the inbox lists each counterpart once, most recent first"""
+        user3 = User.objects.create_user(
+            email="user3@example.com", password="pass123", team_number=254, phone="2545678901"
+        )
+        for receiver, text in [(5678, "First"), (254, "Second"), (5678, "Third")]:
+            self.client.post(
+                "/api/message/",
+                {"id": str(uuid.uuid4()), "message": text, "receiver": receiver},
+                format="json",
+            )
+        response = self.client.get("/api/dms/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row["team_number"] for row in response.data], [5678, 254])
+        self.assertEqual(response.data[0]["most_recent_message"], "Third")
+        self.assertTrue(response.data[0]["is_read"])
+
+        self.client.force_authenticate(user=self.user2)
+        response = self.client.get("/api/dms/")
+        self.assertEqual(response.data[0]["unread_count"], 2)
+        self.assertFalse(response.data[0]["is_read"])
+
+        self.client.force_authenticate(user=user3)
+        response = self.client.get("/api/dms/")
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]["most_recent_message"], "Second")
+        self.assertEqual(response.data[0]["unread_count"], 1)
+
     def test_get_conversation(self):
         """Test retrieving conversation between two users"""
         Message.objects.create(
@@ -203,4 +243,672 @@ class RequestSaleViewsTest(TestCase):
             "additional_info": "Test sale"
         }
         response = self.client.post("/api/sales/", data=sale_data, format="json",headers=self.request_headers)
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+class SearchViewsTest(TestCase):
+    def setUp(self):
+        # Create a small catalog to search over
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email="search@example.com",
+            password="pass123",
+            team_number=3647,
+            team_name="Millennium Falcons",
+            is_active=True,
+        )
+        self.manufacturer = PartManufacturer.objects.create(name="REV Robotics")
+        self.category = PartCategory.objects.create(name="Motors")
+        self.neo = Part.objects.create(
+            name="NEO Brushless Motor",
+            model_id="REV-21-1650",
+            manufacturer=self.manufacturer,
+            category=self.category,
+        )
+        self.hub = Part.objects.create(
+            name="Control Hub",
+            manufacturer=self.manufacturer,
+            category=PartCategory.objects.create(name="Electronics"),
+        )
+        PartRequest.objects.create(part=self.neo, user=self.user, quantity=2)
+
+    def test_search_requires_query(self):
+        """Test that a search without q is rejected instead of dumping everything"""
+        response = self.client.get("/api/search/all/")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_ranks_matching_parts(self):
+        """Test that matching parts come back ranked and non-matches are excluded"""
+        response = self.client.get("/api/search/all/", {"q": "neo motor"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["parts"][0]["id"], str(self.neo.id))
+        self.assertNotIn(str(self.hub.id), [p["id"] for p in response.data["parts"]])
+        self.assertEqual(len(response.data["requests"]), 1)
+
+    def test_search_by_manufacturer_and_team(self):
+        """Test matching on manufacturer name and team number"""
+        response = self.client.get("/api/search/all/", {"q": "REV Robotics", "types": "parts"})
+        self.assertEqual(len(response.data["parts"]), 2)
+        self.assertNotIn("users", response.data)
+
+        response = self.client.get("/api/search/all/", {"q": "frc3647", "types": "users"})
+        self.assertEqual(response.data["users"][0]["team_number"], 3647)
+
+    def test_search_cursor_pages_through_hits(self):
+        """Test that per-type limits and cursors page without repeating hits"""
+        response = self.client.get(
+            "/api/search/all/", {"q": "REV", "types": "parts", "limit": 1}
+        )
+        first = response.data["parts"]
+        cursor = response.data["next"]["parts"]
+        self.assertEqual(len(first), 1)
+        self.assertIsNotNone(cursor)
+
+        response = self.client.get(
+            "/api/search/all/",
+            {"q": "REV", "types": "parts", "limit": 1, "parts_cursor": cursor},
+        )
+        self.assertEqual(len(response.data["parts"]), 1)
+        self.assertNotEqual(response.data["parts"][0]["id"], first[0]["id"])
+        self.assertIsNone(response.data["next"]["parts"])
+
+    def test_search_rejects_bad_cursor(self):
+        """Test that a garbage cursor is a client error"""
+        response = self.client.get(
+            "/api/search/all/", {"q": "neo", "types": "parts", "parts_cursor": "nope"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_rejects_cursor_values_of_the_wrong_type(self):
+        """Test that a well-formed cursor without a float rank and a UUID id is a client error"""
+        for values in ([0.5, "not-a-uuid"], ["high", str(uuid.uuid4())], [0.5, None]):
+            response = self.client.get(
+                "/api/search/all/",
+                {"q": "neo", "types": "parts", "parts_cursor": encode_cursor(values)},
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, values)
+
+
+class ListQueryCountTest(TestCase):
+    def setUp(self):
+        # Create listings spread across several teams, parts and addresses
+        self.client = APIClient()
+        cache.clear()
+        self.manufacturer = PartManufacturer.objects.create(name="Test Manufacturer")
+        self.category = PartCategory.objects.create(name="Test Category")
+        self.team_number = 100
+
+    def add_listings(self, count):
+        # Run the commit hooks so cached list responses are retired as in production
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(count):
+                self.team_number += 1
+                user = User.objects.create_user(
+                    email=f"team{self.team_number}@example.com",
+                    password="pass123",
+                    team_number=self.team_number,
+                    phone=f"555{self.team_number:07d}",
+                    is_active=True,
+                )
+                part = Part.objects.create(
+                    name=f"Part {self.team_number}",
+                    manufacturer=self.manufacturer,
+                    category=self.category,
+                )
+                PartRequest.objects.create(part=part, user=user)
+                PartSale.objects.create(part=part, user=user, ask_price=10)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries)
+
+    def test_list_query_count_is_constant(self):
+        """Test that list endpoints issue the same number of queries for 1 or 10 rows"""
+        urls = ["/api/requests/", "/api/sales/", "/api/parts/", "/api/users/"]
+        self.add_listings(1)
+        few = {url: self.count_queries(url) for url in urls}
+        self.add_listings(9)
+        many = {url: self.count_queries(url) for url in urls}
+        self.assertEqual(few, many)
+
+
+class CursorPaginationTest(TestCase):
+    def setUp(self):
+        # Create two users with a handful of listings and messages between them
+        self.client = APIClient()
+        cache.clear()
+        self.user1 = User.objects.create_user(
+            email="user1@example.com", password="pass123", team_number=3647, phone="364756789",
+            is_active=True,
+        )
+        self.user2 = User.objects.create_user(
+            email="user2@example.com", password="pass123", team_number=5678, phone="3647567890"
+        )
+        manufacturer = PartManufacturer.objects.create(name="Test Manufacturer")
+        category = PartCategory.objects.create(name="Test Category")
+        self.part = Part.objects.create(
+            name="Test Part", manufacturer=manufacturer, category=category
+        )
+        for i in range(5):
+            PartRequest.objects.create(part=self.part, user=self.user1, quantity=i + 1)
+            Message.objects.create(
+                sender=self.user1, receiver=self.user2, message=f"Message {i}"
+            )
+        self.client.force_authenticate(user=self.user1)
+
+    def collect_pages(self, url, page_size):
+        """Follow next cursors until exhausted, returning every page"""
+        pages = []
+        params = {"page_size": page_size}
+        while True:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response.data["results"])
+            if response.data["next"] is None:
+                return pages
+            params = {"page_size": page_size, "cursor": response.data["next"]}
+
+    def test_list_without_cursor_params_is_unchanged(self):
+        """Test that plain list requests still return a bare list"""
+        response = self.client.get("/api/requests/")
+        self.assertIsInstance(response.data, list)
+        self.assertEqual(len(response.data), 5)
+
+    def test_cursor_pages_cover_every_row_once(self):
+        """Test that keyset pages are bounded and never repeat or skip rows"""
+        pages = self.collect_pages("/api/requests/", 2)
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        ids = [row["id"] for page in pages for row in page]
+        self.assertEqual(len(set(ids)), 5)
+
+    def test_message_cursor_pages_newest_first(self):
+        """Test that DM history pages run newest first by (timestamp, id)"""
+        pages = self.collect_pages(f"/api/message/{self.user2.team_number}/", 3)
+        messages = [row["message"] for page in pages for row in page]
+        self.assertEqual(messages, [f"Message {i}" for i in reversed(range(5))])
+
+    def test_legacy_message_offsets(self):
+        """Test that limit/offset paging still works without a COUNT query"""
+        response = self.client.get(
+            f"/api/message/{self.user2.team_number}/", {"limit": 2, "offset": 4}
+        )
+        self.assertEqual([row["message"] for row in response.data], ["Message 0"])
+
+    def test_invalid_cursor(self):
+        """Test that a tampered cursor is rejected"""
+        response = self.client.get("/api/requests/", {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cursor_values_of_the_wrong_type(self):
+        """Test that a well-formed cursor with values of the wrong type is rejected"""
+        for values in (["2024-01-01", "not-a-uuid"], ["not-a-date", str(uuid.uuid4())], [[], {}]):
+            response = self.client.get("/api/requests/", {"cursor": encode_cursor(values)})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, values)
+
+
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        # Create one part to list, with an empty response cache
+        self.client = APIClient()
+        cache.clear()
+        self.manufacturer = PartManufacturer.objects.create(name="Test Manufacturer")
+        self.category = PartCategory.objects.create(name="Test Category")
+        self.part = Part.objects.create(
+            name="Cached Part", manufacturer=self.manufacturer, category=self.category
+        )
+
+    def test_repeat_list_is_served_without_queries(self):
+        """Test that a second identical GET comes from the cache, byte for byte"""
+        first = self.client.get("/api/parts/")
+        # Only the conditional GET validators touch the database
+        with self.assertNumQueries(3):
+            second = self.client.get("/api/parts/")
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second["Content-Type"], "application/json")
+        self.assertEqual(second.content, first.content)
+
+    def test_query_params_are_part_of_the_key(self):
+        """Test that a cursor page is not answered with the plain list"""
+        self.client.get("/api/parts/")
+        response = self.client.get("/api/parts/", {"page_size": 1})
+        self.assertIn("results", response.json())
+
+    def test_save_retires_cached_lists(self):
+        """Test that saving a model the list reads from forces a fresh render"""
+        self.client.get("/api/parts/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = "Renamed Category"
+            self.category.save()
+        response = self.client.get("/api/parts/")
+        self.assertEqual(response.json()[0]["category"]["name"], "Renamed Category")
+
+    def test_unrelated_save_keeps_cached_lists(self):
+        """Test that writes to other models leave the cached list in place"""
+        response = self.client.get("/api/parts/categories/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.part.name = "Renamed Part"
+            self.part.save()
+        with self.assertNumQueries(1):
+            self.client.get("/api/parts/categories/")
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        # Create one request with its part and poster, with an empty response cache
+        self.client = APIClient()
+        cache.clear()
+        self.user = User.objects.create_user(
+            email="poster@example.com", password="pass123", team_number=3647,
+            phone="5553647000", is_active=True,
+        )
+        self.category = PartCategory.objects.create(name="Test Category")
+        self.part = Part.objects.create(name="Test Part", category=self.category)
+        self.request = PartRequest.objects.create(part=self.part, user=self.user)
+        self.url = f"/api/requests/id/{self.request.id}/"
+
+    def test_detail_sends_validators(self):
+        """Test that detail responses carry an ETag and Last-Modified"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["ETag"].startswith('"'))
+        self.assertIn("Last-Modified", response)
+
+    def test_matching_etag_is_not_modified(self):
+        """Test that If-None-Match with the current ETag is a 304 with one query"""
+        etag = self.client.get(self.url)["ETag"]
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+
+    def test_if_modified_since_is_not_modified(self):
+        """Test that If-Modified-Since at Last-Modified is a 304"""
+        last_modified = self.client.get(self.url)["Last-Modified"]
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_nested_change_changes_etag(self):
+        """Test that editing a row shown inside the request changes its ETag"""
+        etag = self.client.get(self.url)["ETag"]
+        self.category.name = "Renamed Category"
+        self.category.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_list_etag_tracks_deletes_and_params(self):
+        """Test that list ETags differ per query string and change when rows go"""
+        etag = self.client.get("/api/requests/")["ETag"]
+        self.assertNotEqual(self.client.get("/api/requests/", {"page_size": 1})["ETag"], etag)
+        with self.assertNumQueries(5):
+            response = self.client.get("/api/requests/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.request.delete()
+        response = self.client.get("/api/requests/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_lists_send_no_last_modified(self):
+        """Test that a list only sends an ETag, so If-Modified-Since never hides a delete"""
+        response = self.client.get("/api/requests/")
+        self.assertNotIn("Last-Modified", response)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.request.delete()
+        response = self.client.get(
+            "/api/requests/", HTTP_IF_MODIFIED_SINCE="Mon, 01 Jan 2035 00:00:00 GMT"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), [])
+
+    def test_permissions_run_before_not_modified(self):
+        """Test that a client failing the view's permission check never learns the ETag matched"""
+        etag = self.client.get(self.url)["ETag"]
+        with mock.patch.object(request_view.cls, "permission_classes", [IsAuthenticated]):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+
+    def test_unknown_id_falls_through(self):
+        """Test that a missing id still gets the view's 404"""
+        response = self.client.get(f"/api/requests/id/{uuid.uuid4()}/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn("ETag", response)
+
+
+class NormalizedPayloadTest(TestCase):
+    def setUp(self):
+        # Create several listings for one popular part from two teams
+        self.client = APIClient()
+        cache.clear()
+        self.users = [
+            User.objects.create_user(
+                email=f"team{n}@example.com", password="pass123", team_number=n,
+                team_name=f"Team {n}", phone=f"555000{n:04d}", is_active=True,
+            )
+            for n in (3647, 254)
+        ]
+        manufacturer = PartManufacturer.objects.create(name="REV Robotics")
+        category = PartCategory.objects.create(name="Motors")
+        self.part = Part.objects.create(
+            name="NEO Brushless Motor", manufacturer=manufacturer, category=category
+        )
+        for i in range(6):
+            PartRequest.objects.create(part=self.part, user=self.users[i % 2], quantity=i + 1)
+
+    def denormalize(self, payload, rows):
+        """Rebuild nested rows from a normalized payload"""
+        rebuilt = []
+        for row in rows:
+            row = dict(row)
+            part = dict(payload["parts"][row.pop("part_id")])
+            part["manufacturer"] = payload["manufacturers"][part["manufacturer_id"]]
+            part["category"] = payload["categories"][part["category_id"]]
+            row["part"] = part
+            row["user"] = payload["users"][str(row.pop("user_team_number"))]
+            rebuilt.append(row)
+        return rebuilt
+
+    def test_list_sideloads_each_object_once(self):
+        """Test that normalized lists reference one copy of each part and team"""
+        plain = self.client.get("/api/requests/").json()
+        payload = self.client.get("/api/requests/", {"format": "normalized"}).json()
+        self.assertEqual(len(payload["parts"]), 1)
+        self.assertEqual(set(payload["users"]), {"3647", "254"})
+        self.assertEqual(len(payload["manufacturers"]), 1)
+        self.assertEqual(self.denormalize(payload, payload["results"]), plain)
+
+    def test_cursor_page_is_normalized(self):
+        """Test that cursor pages keep their cursor alongside the sideloads"""
+        response = self.client.get("/api/requests/", {"format": "normalized", "page_size": 4})
+        payload = response.json()
+        self.assertEqual(len(payload["results"]), 4)
+        self.assertIsNotNone(payload["next"])
+        self.assertEqual(list(payload["parts"]), [str(self.part.id)])
+
+    def test_search_rows_move_under_results(self):
+        """Test that normalized search keeps hits apart from the sideloaded dictionaries"""
+        plain = self.client.get("/api/search/all/", {"q": "neo", "types": "requests"}).json()
+        payload = self.client.get(
+            "/api/search/all/", {"q": "neo", "types": "requests", "format": "normalized"}
+        ).json()
+        self.assertEqual(self.denormalize(payload, payload["results"]["requests"]), plain["requests"])
+        self.assertEqual(payload["next"], plain["next"])
+
+    def test_fields_and_expand_narrow_normalized_payloads(self):
+        """Test that ?fields= and ?expand= apply to rows and sideloads alike"""
+        payload = self.client.get(
+            "/api/requests/", {"format": "normalized", "fields": "id,part.name", "page_size": 2}
+        ).json()
+        self.assertEqual(set(payload["results"][0]), {"id", "part_id"})
+        self.assertEqual(payload["parts"], {str(self.part.id): {"name": self.part.name}})
+        self.assertEqual(payload["users"], {})
+
+        payload = self.client.get(
+            "/api/requests/", {"format": "normalized", "fields": "id,part,user", "expand": "user"}
+        ).json()
+        self.assertEqual(payload["results"][0]["part_id"], str(self.part.id))
+        self.assertEqual(payload["parts"], {})
+        self.assertEqual(set(payload["users"]), {"3647", "254"})
+
+    def test_plain_json_format_is_unchanged(self):
+        """Test that ?format=json still selects the nested payload"""
+        response = self.client.get("/api/requests/", {"format": "json"})
+        self.assertIn("part", response.json()[0])
+
+
+class SparseFieldsetTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        self.user = User.objects.create_user(
+            email="team3647@example.com", password="pass123", team_number=3647,
+            team_name="Millennium Falcons", phone="5550003647", is_active=True,
+        )
+        manufacturer = PartManufacturer.objects.create(name="REV Robotics")
+        category = PartCategory.objects.create(name="Motors")
+        self.part = Part.objects.create(
+            name="NEO Brushless Motor", manufacturer=manufacturer, category=category
+        )
+        self.request = PartRequest.objects.create(part=self.part, user=self.user, quantity=2)
+
+    def test_fields_narrow_list_rows(self):
+        """Test that ?fields= keeps only the named fields, nested ones included"""
+        response = self.client.get("/api/requests/", {"fields": "id,quantity,part.name"})
+        self.assertEqual(
+            response.json(),
+            [{"id": str(self.request.id), "quantity": 2, "part": {"name": "NEO Brushless Motor"}}],
+        )
+
+    def test_expand_references_other_objects(self):
+        """Test that nested objects missing from ?expand= come back as keys"""
+        response = self.client.get("/api/requests/", {"expand": "part"})
+        row = response.json()[0]
+        self.assertEqual(row["part"]["name"], "NEO Brushless Motor")
+        self.assertEqual(row["user_team_number"], 3647)
+        self.assertNotIn("user", row)
+
+    def test_cursor_pages_and_details_take_specs(self):
+        """Test that cursor pages and detail views honour ?fields= too"""
+        page = self.client.get("/api/requests/", {"page_size": 5, "fields": "id,quantity"}).json()
+        self.assertEqual(page["results"], [{"id": str(self.request.id), "quantity": 2}])
+        detail = self.client.get(f"/api/requests/id/{self.request.id}/", {"fields": "quantity", "expand": ""})
+        self.assertEqual(detail.json(), {"quantity": 2})
+
+    def test_detail_etag_varies_with_fields(self):
+        """Test that narrowed and full details are tagged differently"""
+        url = f"/api/requests/id/{self.request.id}/"
+        full = self.client.get(url)
+        narrow = self.client.get(url, {"fields": "quantity"})
+        self.assertNotEqual(full["ETag"], narrow["ETag"])
+
+    def test_serializer_path_selects_fewer_columns(self):
+        """Test that a narrowed spec loads only the columns it renders"""
+        with self.settings(API_FAST_ROWS=False), CaptureQueriesContext(connection) as narrow:
+            self.client.get("/api/requests/", {"fields": "id,part.name", "expand": "part"})
+        cache.clear()
+        with self.settings(API_FAST_ROWS=False), CaptureQueriesContext(connection) as full:
+            self.client.get("/api/requests/")
+        select = lambda queries: [q["sql"] for q in queries if 'FROM "api_partrequest"' in q["sql"]][-1]
+        self.assertNotIn('"api_part"."description"', select(narrow))
+        self.assertNotIn("api_user", select(narrow))
+        self.assertIn("api_user", select(full))
+
+
+@override_settings(CHANGE_FEED_SETTLE_SECONDS=0)
+class ChangeFeedTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        self.user = User.objects.create_user(
+            email="team3647@example.com", password="pass123", team_number=3647,
+            team_name="Millennium Falcons", phone="5550003647", is_active=True,
+        )
+        self.part = Part.objects.create(name="NEO Brushless Motor")
+        self.cursor = self.client.get("/api/changes/").json()["next"]
+
+    def feed(self, **params):
+        return self.client.get("/api/changes/", {"cursor": self.cursor, **params})
+
+    def test_created_updated_and_deleted_rows(self):
+        """Test that saves show the current object and deletes leave a tombstone"""
+        with self.captureOnCommitCallbacks(execute=True):
+            request = PartRequest.objects.create(part=self.part, user=self.user, quantity=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            request.quantity = 4
+            request.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            sale = PartSale.objects.create(part=self.part, user=self.user, ask_price=10)
+        payload = self.feed().json()
+        self.assertEqual(
+            [(c["type"], c["action"]) for c in payload["changes"]],
+            [("requests", "created"), ("sales", "created")],
+        )
+        self.assertEqual(payload["changes"][0]["data"]["quantity"], 4)
+        self.assertFalse(payload["has_more"])
+
+        self.cursor = payload["next"]
+        sale_id = str(sale.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            sale.delete()
+        payload = self.feed().json()
+        self.assertEqual(
+            payload["changes"],
+            [{"type": "sales", "id": sale_id, "action": "deleted", "data": None}],
+        )
+        self.cursor = payload["next"]
+        self.assertEqual(self.feed().json()["changes"], [])
+
+    def test_pages_are_bounded(self):
+        """Test that limit caps each call and the cursor picks up where it stopped"""
+        for quantity in range(5):
+            with self.captureOnCommitCallbacks(execute=True):
+                PartRequest.objects.create(part=self.part, user=self.user, quantity=quantity)
+        seen = []
+        while True:
+            payload = self.feed(limit=2).json()
+            self.assertLessEqual(len(payload["changes"]), 2)
+            seen += [c["data"]["quantity"] for c in payload["changes"]]
+            self.cursor = payload["next"]
+            if not payload["has_more"]:
+                break
+        self.assertEqual(seen, [0, 1, 2, 3, 4])
+
+    def test_rolled_back_writes_are_not_logged(self):
+        """Test that only committed writes reach the feed"""
+        with self.captureOnCommitCallbacks(execute=False):
+            PartRequest.objects.create(part=self.part, user=self.user)
+        self.assertEqual(self.feed().json()["changes"], [])
+
+    def test_types_filter(self):
+        """Test that ?types= narrows the feed"""
+        with self.captureOnCommitCallbacks(execute=True):
+            Part.objects.create(name="Falcon 500")
+            PartRequest.objects.create(part=self.part, user=self.user)
+        payload = self.feed(types="parts").json()
+        self.assertEqual([c["type"] for c in payload["changes"]], ["parts"])
+        self.assertEqual(self.feed(types="users").status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_expired_and_invalid_cursors(self):
+        """Test that cursors older than the retained log are refused with 410"""
+        with self.settings(CHANGE_LOG_RETENTION_DAYS=0):
+            later = timezone.now() + timedelta(seconds=5)
+            with mock.patch("api.changes.timezone.now", return_value=later):
+                self.assertEqual(self.feed().status_code, status.HTTP_410_GONE)
+        self.assertEqual(
+            self.client.get("/api/changes/", {"cursor": "bogus"}).status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+
+class MatchesViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        for task in (match_listing_task, percolate_listing_task):
+            patcher = mock.patch.object(task, "delay", task)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.buyer, self.seller, self.other = [
+            User.objects.create_user(
+                email=f"team{n}@example.com", password="pass123", team_number=n,
+                team_name=f"Team {n}", phone=f"555000{n:04d}", is_active=True,
+            )
+            for n in (3647, 118, 254)
+        ]
+        self.part = Part.objects.create(name="NEO Brushless Motor")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cheap = PartSale.objects.create(part=self.part, user=self.seller, ask_price=10)
+            self.pricey = PartSale.objects.create(part=self.part, user=self.other, ask_price=80)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.request = PartRequest.objects.create(part=self.part, user=self.buyer, bid_price=20)
+
+    def test_matches_for_each_side(self):
+        """Test that buyers see sales for their requests and sellers see requests for their sales"""
+        self.client.force_authenticate(user=self.buyer)
+        matches = self.client.get("/api/matches/").json()
+        self.assertEqual([m["sale"]["id"] for m in matches], [str(self.cheap.id), str(self.pricey.id)])
+        self.assertEqual(matches[0]["request"]["id"], str(self.request.id))
+        self.assertGreater(matches[0]["score"], matches[1]["score"])
+
+        self.client.force_authenticate(user=self.seller)
+        self.assertEqual(len(self.client.get("/api/matches/", {"role": "seller"}).json()), 1)
+        self.assertEqual(self.client.get("/api/matches/", {"role": "buyer"}).json(), [])
+
+    def test_cursor_pages(self):
+        """Test that matches page by score with a cursor"""
+        self.client.force_authenticate(user=self.buyer)
+        first = self.client.get("/api/matches/", {"page_size": 1}).json()
+        second = self.client.get("/api/matches/", {"page_size": 1, "cursor": first["next"]}).json()
+        self.assertEqual(first["results"][0]["sale"]["id"], str(self.cheap.id))
+        self.assertEqual(second["results"][0]["sale"]["id"], str(self.pricey.id))
+        self.assertIsNone(second["next"])
+
+    def test_requires_login(self):
+        """Test that anonymous clients cannot list matches"""
+        response = self.client.get("/api/matches/")
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+
+
+class SavedSearchViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        address = Address.objects.create(raw="Houston", latitude=29.76, longitude=-95.37)
+        self.user, self.other = [
+            User.objects.create_user(
+                email=f"team{n}@example.com", password="pass123", team_number=n,
+                team_name=f"Team {n}", phone=f"555000{n:04d}", is_active=True,
+                address=address if n == 3647 else None,
+            )
+            for n in (3647, 118)
+        ]
+        self.part = Part.objects.create(name="NEO Brushless Motor")
+        self.client.force_authenticate(user=self.user)
+
+    def test_create_and_list(self):
+        """Test that a saved search is created for the logged-in team and listed back"""
+        response = self.client.post(
+            "/api/saved-searches/",
+            {"name": "Motors", "query": "neo", "radius_miles": 50, "kind": "sales"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        search = SavedSearch.objects.get()
+        self.assertEqual(search.user, self.user)
+        self.assertEqual((search.latitude, search.longitude), (29.76, -95.37))
+        self.assertTrue(search.buckets[0].startswith("region:"))
+
+        listed = self.client.get("/api/saved-searches/").json()
+        self.assertEqual([s["id"] for s in listed], [str(search.id)])
+        self.client.force_authenticate(user=self.other)
+        self.assertEqual(self.client.get("/api/saved-searches/").json(), [])
+
+    def test_invalid_searches_are_rejected(self):
+        """Test that empty searches, huge radii and radii without an address are refused"""
+        for user, data in (
+            (self.user, {"name": "Anything"}),
+            (self.user, {"query": "neo", "radius_miles": 5000}),
+            (self.other, {"part_id": str(self.part.id), "radius_miles": 50}),
+        ):
+            self.client.force_authenticate(user=user)
+            response = self.client.post("/api/saved-searches/", data, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, data)
+        self.assertFalse(SavedSearch.objects.exists())
+
+    def test_edit_refiles_and_delete(self):
+        """Test that editing a search moves it to its new bucket and only its owner can delete it"""
+        search = SavedSearch.objects.create(user=self.user, query="neo")
+        response = self.client.patch(
+            f"/api/saved-searches/{search.id}/", {"part_id": str(self.part.id)}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        search.refresh_from_db()
+        self.assertEqual(search.buckets, [f"part:{self.part.id}"])
+
+        self.client.force_authenticate(user=self.other)
+        response = self.client.delete(f"/api/saved-searches/{search.id}/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.client.force_authenticate(user=self.user)
+        response = self.client.delete(f"/api/saved-searches/{search.id}/")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(SavedSearch.objects.exists())
@@ -33,6 +33,10 @@ from .views import (
     password_reset_request,
     password_reset_confirm,
     daily_digest_view,
+    change_feed_view,
+    matches_view,
+    saved_searches_view,
+    saved_search_view,
 )
 
 urlpatterns = [
@@ -78,6 +82,10 @@ urlpatterns = [
     path("parts/manufacturers/", manufacturer_view),
     path("search/all/", search_all_view, name="search_all_view"),
     path("sales/", part_sale_views, name="part_sale_views"),
+    path("changes/", change_feed_view, name="change_feed_view"),
+    path("matches/", matches_view, name="matches_view"),
+    path("saved-searches/", saved_searches_view, name="saved_searches_view"),
+    path("saved-searches/<str:search_id>/", saved_search_view, name="saved_search_view"),
     path('password-reset/', password_reset_request, name='password-reset'),
     path('password-reset/confirm/', password_reset_confirm, name='password-reset-confirm'),
     path('daily-digest/', daily_digest_view, name='daily-digest'),
@@ -13,10 +13,14 @@ from .models import (
     Part,
     PartRequest,
     Message,
+    Conversation,
     PartCategory,
     PartManufacturer,
+    ListingMatch,
+    SavedSearch,
 )
 from .serializers import (
+    FieldSpec,
     MessageSerializer,
     PartSaleSerializer,
     UserSerializer,
@@ -25,53 +29,132 @@ from .serializers import (
     PartRequestSerializer,
     PartCategorySerializer,
     PartManufacturerSerializer,
+    ListingMatchSerializer,
+    SavedSearchSerializer,
 )
 from rest_framework.permissions import IsAuthenticated
 from django.db import models
-from django.core.paginator import Paginator, EmptyPage
 from django.conf import settings
 from django.shortcuts import get_object_or_404
-from .tasks import send_email_task, send_dm_notification, send_daily_requests_digest, send_welcome_email, send_password_reset_email
+from .pagination import (
+    paginated_response,
+    wants_cursor_page,
+    MAX_PAGE_SIZE,
+    PART_ORDERING,
+    REQUEST_ORDERING,
+    SALE_ORDERING,
+    USER_ORDERING,
+    MESSAGE_ORDERING,
+    NAME_ORDERING,
+    MATCH_ORDERING,
+)
+from .search import search, SEARCH_TYPES, DEFAULT_LIMIT, MAX_LIMIT
+from .projections import (
+    empty_included,
+    list_data,
+    normalize_rows,
+    normalized_format,
+    projection_for,
+    serialize_many,
+)
+from .response_cache import cached_response
+from .conditional import conditional_get, list_validators, detail_validators
+from . import changes
+from .tasks import send_email_task, queue_dm_notifications, send_daily_requests_digest, send_welcome_email, send_password_reset_email
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str  # use force_str instead of force_text in newer Django versions
 
+SEARCH_SERIALIZERS = {
+    "users": PublicUserSerializer,
+    "parts": PartSerializer,
+    "requests": PartRequestSerializer,
+    "sales": PartSaleSerializer,
+}
+
 
 @api_view(["GET"])
 def search_all_view(request):
-    """View for searching EVERYTHING"""
-    if request.method == "GET":
-        total_data = {}
-        users = User.objects.all()
-        parts = Part.objects.all()
-        requests = PartRequest.objects.all()
-        sales = PartSale.objects.all()
-        
-        user_serializer = PublicUserSerializer(users, many=True)
-        # Filter out any null users from the serialized data
-        filtered_users = [user for user in user_serializer.data if user is not None]
-        
-        part_serializer = PartSerializer(parts, many=True)
-        request_serializer = PartRequestSerializer(requests, many=True)
-        sale_serializer = PartSaleSerializer(sales, many=True)
+    """
+    Ranked search across users, parts, requests and sales.
+
+    Query params:
+    - q: search text (required)
+    - types: comma separated subset of users,parts,requests,sales
+    - limit: hits per type (default 10, max 50)
+    - <type>_cursor: cursor from a previous response's "next" to page a type
+    - format=normalized: hits under "results", nested rows sideloaded by key
+    - fields / expand: sparse fieldsets, as on the list endpoints
+    """
+    q = request.query_params.get("q", "").strip()
+    if not q:
+        return Response(
+            {"error": "Query parameter 'q' is required"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    types = request.query_params.get("types")
+    types = [t for t in types.split(",") if t] if types else list(SEARCH_TYPES)
+    unknown = set(types) - set(SEARCH_TYPES)
+    if unknown:
+        return Response(
+            {"error": f"Unknown search types: {', '.join(sorted(unknown))}"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
-        total_data["users"] = filtered_users
-        total_data["parts"] = part_serializer.data
-        total_data["requests"] = request_serializer.data
-        total_data["sales"] = sale_serializer.data
-        return Response(total_data, status=status.HTTP_200_OK)
-    return JsonResponse({"error": "Only GET requests are allowed"}, status=405)
+    try:
+        limit = min(int(request.query_params.get("limit", DEFAULT_LIMIT)), MAX_LIMIT)
+        if limit < 1:
+            raise ValueError("limit must be positive")
+        cursors = {t: request.query_params.get(f"{t}_cursor") for t in types}
+        normalized = normalized_format(request)
+        spec = FieldSpec.from_request(request)
+        projections = {
+            t: projection_for(SEARCH_SERIALIZERS[t], normalized, spec) for t in types
+        }
+        results = search(q, types=types, limit=limit, cursors=cursors, projections=projections)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    included = empty_included()
+    total_data = {"next": {}}
+    # Normalized payloads keep rows apart from the sideloaded "users"/"parts"
+    rows = total_data.setdefault("results", {}) if normalized else total_data
+    for search_type, (hits, next_cursor) in results.items():
+        serializer_class = SEARCH_SERIALIZERS[search_type]
+        if normalized:
+            hits = normalize_rows(serializer_class, hits, included, spec)
+        elif projections[search_type]:
+            hits = [projections[search_type].represent(row) for row in hits]
+        else:
+            hits = serializer_class(hits, many=True, spec=spec).data
+        rows[search_type] = hits
+        total_data["next"][search_type] = next_cursor
+    if normalized:
+        total_data.update(included)
+    return Response(total_data, status=status.HTTP_200_OK)
 
 
 # Create your views here.
 @api_view(["GET", "POST"])
+@conditional_get(list_validators(User))
+@cached_response("users", (User,))
 def user_views(request):
     """views for GETTING and CREATING users"""
     if request.method == "GET":
+        if wants_cursor_page(request):
+            return paginated_response(
+                request, User.objects.public(), PublicUserSerializer, USER_ORDERING
+            )
         users = User.objects.all()
-        serializer = PublicUserSerializer(users, many=True)
         # Filter out any null users from the serialized data
-        filtered_users = [user for user in serializer.data if user is not None]
+        filtered_users = [
+            user
+            for user in serialize_many(
+                PublicUserSerializer, users, FieldSpec.from_request(request)
+            )
+            if user is not None
+        ]
         return Response(filtered_users, status=status.HTTP_200_OK)
 
     if request.method == "POST":
@@ -95,11 +178,15 @@ def user_views(request):
 
 
 @api_view(["GET"])
+@conditional_get(detail_validators(User, "team_number", field="team_number"))
 def user_by_team_number_view(request, team_number):
     """Fetch a specific user's details by id."""
     try:
-        user = User.objects.get(team_number=team_number)
-        serializer = PublicUserSerializer(user)
+        spec = FieldSpec.from_request(request)
+        user = PublicUserSerializer.setup_eager_loading(User.objects, spec).get(
+            team_number=team_number
+        )
+        serializer = PublicUserSerializer(user, spec=spec)
         # Check if serialized user is null
         if serializer.data is None:
             return Response(
@@ -263,10 +350,16 @@ def logout_view(request):
 
 
 @api_view(["GET", "POST"])
+@conditional_get(list_validators(PartManufacturer))
+@cached_response("manufacturers", (PartManufacturer,))
 def manufacturer_view(request):
     """GET/POST for part manufacturers."""
     if request.method == "GET":
         manufacturers = PartManufacturer.objects.all()
+        if wants_cursor_page(request):
+            return paginated_response(
+                request, manufacturers, PartManufacturerSerializer, NAME_ORDERING
+            )
         serializer = PartManufacturerSerializer(manufacturers, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
     if request.method == "POST":
@@ -278,10 +371,16 @@ def manufacturer_view(request):
 
 
 @api_view(["GET", "POST"])
+@conditional_get(list_validators(PartCategory))
+@cached_response("categories", (PartCategory,))
 def category_view(request):
     """GET/POST for part categories."""
     if request.method == "GET":
         categories = PartCategory.objects.all()
+        if wants_cursor_page(request):
+            return paginated_response(
+                request, categories, PartCategorySerializer, NAME_ORDERING
+            )
         serializer = PartCategorySerializer(categories, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
     if request.method == "POST":
@@ -293,12 +392,15 @@ def category_view(request):
 
 
 @api_view(["GET", "POST"])
+@conditional_get(list_validators(Part, related=(PartManufacturer, PartCategory)))
+@cached_response("parts", (Part, PartManufacturer, PartCategory))
 def part_views(request):
     """Views for GETTING and CREATING Parts."""
     if request.method == "GET":
         parts = Part.objects.all()
-        serializer = PartSerializer(parts, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        if wants_cursor_page(request):
+            return paginated_response(request, parts, PartSerializer, PART_ORDERING)
+        return Response(list_data(request, PartSerializer, parts), status=status.HTTP_200_OK)
     if request.method == "POST":
         serializer = PartSerializer(data=request.data)
         if serializer.is_valid():
@@ -321,12 +423,21 @@ def part_views(request):
 
 @permission_classes([IsAuthenticated])
 @api_view(["GET", "POST"])
+@conditional_get(
+    list_validators(PartRequest, related=(User, Part, PartManufacturer, PartCategory))
+)
+@cached_response("requests", (PartRequest, User, Part, PartManufacturer, PartCategory))
 def part_request_views(request):
     """Views for GETTING and CREATING Part Requests."""
     if request.method == "GET":
         part_requests = PartRequest.objects.all()
-        serializer = PartRequestSerializer(part_requests, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        if wants_cursor_page(request):
+            return paginated_response(
+                request, part_requests, PartRequestSerializer, REQUEST_ORDERING
+            )
+        return Response(
+            list_data(request, PartRequestSerializer, part_requests), status=status.HTTP_200_OK
+        )
 
     if request.method == "POST":
         user_id = request.headers.get("X-User-ID")
@@ -354,11 +465,20 @@ def part_request_views(request):
 
 
 @api_view(["GET"])
+@conditional_get(
+    detail_validators(
+        PartRequest, "request_id",
+        related=("part", "user", "part__manufacturer", "part__category"),
+    )
+)
 def request_view(request, request_id):
     """Fetch a specific request's details by id."""
     try:
-        part_request = PartRequest.objects.get(id=request_id)
-        serializer = PartRequestSerializer(part_request)
+        spec = FieldSpec.from_request(request)
+        part_request = PartRequestSerializer.setup_eager_loading(
+            PartRequest.objects, spec
+        ).get(id=request_id)
+        serializer = PartRequestSerializer(part_request, spec=spec)
         return Response(serializer.data, status=status.HTTP_200_OK)
     except PartRequest.DoesNotExist:
         return Response(
@@ -404,11 +524,20 @@ def delete_request_view(request, request_id):
         return Response({"error": str(e)}, status=500)
 
 @api_view(["GET"])
+@conditional_get(
+    detail_validators(
+        PartSale, "sale_id",
+        related=("part", "user", "part__manufacturer", "part__category"),
+    )
+)
 def sale_view(request, sale_id):
     """Fetch a specific sale's details by id."""
     try:
-        part_sale = PartSale.objects.get(id=sale_id)
-        serializer = PartSaleSerializer(part_sale)
+        spec = FieldSpec.from_request(request)
+        part_sale = PartSaleSerializer.setup_eager_loading(PartSale.objects, spec).get(
+            id=sale_id
+        )
+        serializer = PartSaleSerializer(part_sale, spec=spec)
         return Response(serializer.data, status=status.HTTP_200_OK)
     except PartSale.DoesNotExist:
         return Response(
@@ -457,37 +586,51 @@ def delete_sale_view(request, sale_id):
 
 
 @api_view(["GET"])
+@conditional_get(
+    detail_validators(Part, "part_id", related=("manufacturer", "category"))
+)
 def part_view(part, part_id):
     """Fetch a specific part's details by id."""
     try:
-        part = Part.objects.get(id=part_id)
-        serializer = PartSerializer(part)
+        spec = FieldSpec.from_request(part)
+        part = PartSerializer.setup_eager_loading(Part.objects, spec).get(id=part_id)
+        serializer = PartSerializer(part, spec=spec)
         return Response(serializer.data, status=status.HTTP_200_OK)
     except Part.DoesNotExist:
         return Response({"error": "Part not found"}, status=status.HTTP_404_NOT_FOUND)
 
 
 @api_view(["GET"])
-def requests_by_part_view(part, part_id):
+def requests_by_part_view(request, part_id):
     """Fetch all of specific part's requests."""
     try:
         part = Part.objects.get(id=part_id)
         requests_for_part = PartRequest.objects.filter(part=part)
-        serializer = PartRequestSerializer(requests_for_part, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        if wants_cursor_page(request):
+            return paginated_response(
+                request, requests_for_part, PartRequestSerializer, REQUEST_ORDERING
+            )
+        return Response(
+            list_data(request, PartRequestSerializer, requests_for_part), status=status.HTTP_200_OK
+        )
     except Part.DoesNotExist:
         return Response(
             {"error": "Part requests not found"}, status=status.HTTP_404_NOT_FOUND
         )
 
 @api_view(["GET"])
-def sales_by_part_view(part, part_id):
+def sales_by_part_view(request, part_id):
     """Fetch all of specific part's sales."""
     try:
         part = Part.objects.get(id=part_id)
         sales_for_part = PartSale.objects.filter(part=part)
-        serializer = PartSaleSerializer(sales_for_part, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        if wants_cursor_page(request):
+            return paginated_response(
+                request, sales_for_part, PartSaleSerializer, SALE_ORDERING
+            )
+        return Response(
+            list_data(request, PartSaleSerializer, sales_for_part), status=status.HTTP_200_OK
+        )
     except Part.DoesNotExist:
         return Response(
             {"error": "Part sales not found"}, status=status.HTTP_404_NOT_FOUND
@@ -506,8 +649,13 @@ def requests_by_user_view(request, team_number):
             status=status.HTTP_404_NOT_FOUND,
         )
     part_request = PartRequest.objects.filter(user_id=user)
-    serializer = PartRequestSerializer(part_request, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    if wants_cursor_page(request):
+        return paginated_response(
+            request, part_request, PartRequestSerializer, REQUEST_ORDERING
+        )
+    return Response(
+        list_data(request, PartRequestSerializer, part_request), status=status.HTTP_200_OK
+    )
 
 @api_view(["GET"])
 def sales_by_user_view(request, team_number):
@@ -521,17 +669,31 @@ def sales_by_user_view(request, team_number):
             status=status.HTTP_404_NOT_FOUND,
         )
     part_sale = PartSale.objects.filter(user_id=user)
-    serializer = PartSaleSerializer(part_sale, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    if wants_cursor_page(request):
+        return paginated_response(
+            request, part_sale, PartSaleSerializer, SALE_ORDERING
+        )
+    return Response(
+        list_data(request, PartSaleSerializer, part_sale), status=status.HTTP_200_OK
+    )
 
 
 @api_view(["GET", "POST"])
+@conditional_get(
+    list_validators(PartSale, related=(User, Part, PartManufacturer, PartCategory))
+)
+@cached_response("sales", (PartSale, User, Part, PartManufacturer, PartCategory))
 def part_sale_views(request):
     """Method for GETTING and CREATING Part Sales."""
     if request.method == "GET":
         part_sales = PartSale.objects.all()
-        serializer = PartSaleSerializer(part_sales, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        if wants_cursor_page(request):
+            return paginated_response(
+                request, part_sales, PartSaleSerializer, SALE_ORDERING
+            )
+        return Response(
+            list_data(request, PartSaleSerializer, part_sales), status=status.HTTP_200_OK
+        )
     if request.method == "POST":
         user_id = request.headers.get("X-User-ID")
         try:
@@ -560,10 +722,8 @@ def messages_by_user_get_view(request, team_number):
     """
     View for handling direct messages (DMs):
     - GET: Retrieve messages between the logged-in user and a specific user.
+    - Pass ?cursor= / ?page_size= for keyset pages, or the legacy limit/offset.
     """
-    limit = int(request.query_params.get("limit", 25))
-    offset = int(request.query_params.get("offset", 0))
-
     try:
         receiver = User.objects.get(team_number=team_number)
     except User.DoesNotExist:
@@ -576,22 +736,27 @@ def messages_by_user_get_view(request, team_number):
     messages = Message.objects.filter(
         (models.Q(sender=sender) & models.Q(receiver=receiver))
         | (models.Q(sender=receiver) & models.Q(receiver=sender))
-    ).order_by("-timestamp")
+    )
 
-    paginator = Paginator(messages, limit)
-    
+    if wants_cursor_page(request):
+        return paginated_response(
+            request, messages, MessageSerializer, MESSAGE_ORDERING
+        )
+
+    # Legacy offset paging: a plain slice, without the COUNT(*) Paginator runs
     try:
-        page_number = offset // limit + 1
-        paginated_messages = paginator.page(page_number)
-    except EmptyPage:
-        return Response([], status=status.HTTP_200_OK)
-    except Exception as e:
+        limit = min(int(request.query_params.get("limit", 25)), MAX_PAGE_SIZE)
+        offset = int(request.query_params.get("offset", 0))
+        if limit < 1 or offset < 0:
+            raise ValueError("limit must be positive and offset non-negative")
+    except ValueError as e:
         return Response(
             {"error": f"Pagination error: {str(e)}"},
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    serializer = MessageSerializer(paginated_messages, many=True)
+    page = messages.order_by(*MESSAGE_ORDERING)[offset : offset + limit]
+    serializer = MessageSerializer(page, many=True, spec=FieldSpec.from_request(request))
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
@@ -614,7 +779,7 @@ def message_by_id_get_view(request, message_id):
     sender = request.user
 
     if sender == message.sender or sender == message.receiver:
-        serializer = MessageSerializer(message)
+        serializer = MessageSerializer(message, spec=FieldSpec.from_request(request))
         return Response(serializer.data, status=status.HTTP_200_OK)
     else:
         return Response(
@@ -629,68 +794,32 @@ def dm_list_view(request):
     Get the list of unique users the current user has messaged with, ordered by most recent message.
     """
     try:
-        user = request.user.id
+        user = request.user
 
-        # Fetch conversations (users who have sent or received messages with the current user)
-        conversations = (
-            Message.objects.filter(models.Q(sender=user) | models.Q(receiver=user))
-            .values("sender", "receiver")
-            .annotate(most_recent=models.Max("timestamp"))
+        # One indexed query over the user's conversation rows
+        conversations = Conversation.objects.for_user(user).select_related(
+            "user_a", "user_b", "last_message__receiver"
         )
 
-        # Collect unique user IDs
-        user_ids = set()
-        for convo in conversations:
-            user_ids.add(convo["sender"])
-            user_ids.add(convo["receiver"])
-        user_ids.discard(user)  # Exclude the current user
-
         # Prepare data for response
         user_data = []
-        for uid in user_ids:
-            # Fetch the most recent message for this conversation
-            recent_message = (
-                Message.objects.filter(
-                    (
-                        models.Q(sender=user, receiver_id=uid)
-                        | models.Q(sender_id=uid, receiver=user)
-                    )
-                )
-                .order_by("-timestamp")
-                .first()
-            )
-
-            # Include relevant user and message data
+        for conversation in conversations:
+            other = conversation.other_user(user)
+            recent_message = conversation.last_message
+            unread = conversation.unread_for(user)
             user_data.append(
                 {
-                    "team_number": (
-                        recent_message.sender.team_number
-                        if recent_message.sender.id == uid
-                        else recent_message.receiver.team_number
-                    ),
-                    "team_name": (
-                        recent_message.sender.team_name
-                        if recent_message.sender.id == uid
-                        else recent_message.receiver.team_name
-                    ),
-                    "full_name": (
-                        recent_message.sender.full_name
-                        if recent_message.sender.id == uid
-                        else recent_message.receiver.full_name
-                    ),
-                    "most_recent_message": recent_message.message,
-                    "receiver": recent_message.receiver.team_number,
-                    "timestamp": recent_message.timestamp,
-                    "profile_photo": (
-                        recent_message.sender.profile_photo
-                        if recent_message.sender.id == uid
-                        else recent_message.receiver.profile_photo
-                    ),
-                    "is_read": (
-                        recent_message.is_read
-                        if recent_message.sender != user
-                        else True
+                    "team_number": other.team_number,
+                    "team_name": other.team_name,
+                    "full_name": other.full_name,
+                    "most_recent_message": recent_message.message if recent_message else "",
+                    "receiver": (
+                        recent_message.receiver.team_number if recent_message else None
                     ),
+                    "timestamp": conversation.last_message_at,
+                    "profile_photo": other.profile_photo,
+                    "is_read": unread == 0,
+                    "unread_count": unread,
                 }
             )
 
@@ -726,6 +855,7 @@ def mark_messages_as_read(request):
         Message.objects.filter(sender=other_user, receiver=user, is_read=False).update(
             is_read=True
         )
+        Conversation.objects.mark_read(user, other_user)
 
         return Response({"detail": "Messages marked as read."}, status=200)
 
@@ -769,14 +899,10 @@ def message_post_view(request):
             receiver=receiver,
             message=message,
         )
+        Conversation.objects.record_message(message)
 
-        # Use Celery to send the email asynchronously
-        if receiver.email:
-            send_dm_notification.delay(
-                sender_id=sender.id,
-                recipient_id=receiver.id,
-                message_content=message.message
-            )
+        # Use Celery to send the email asynchronously, unless they are online
+        queue_dm_notifications([message])
 
         serializer = MessageSerializer(message)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -865,4 +991,121 @@ def daily_digest_view(request):
     View for handling daily part requests digest.
     """
     send_daily_requests_digest.delay()
-    return Response({'message': 'Daily digest email sent'})
\ No newline at end of file
+    return Response({'message': 'Daily digest email sent'})
+
+
+@api_view(["GET"])
+def change_feed_view(request):
+    """
+    Parts, requests and sales created, updated or deleted since a cursor.
+
+    Query params:
+    - cursor: "next" from the previous call; without it only a starting cursor
+      is returned, to be taken before loading the lists
+    - types: comma separated subset of parts,requests,sales
+    - limit: log entries read per call (default 100, max 500)
+
+    Each change carries the object as its list endpoint renders it, or data
+    null for a deletion. Keep calling while "has_more" is true. 410 means the
+    cursor is older than the retained log and the lists must be reloaded.
+    """
+    kinds = request.query_params.get("types")
+    kinds = [k for k in kinds.split(",") if k] if kinds else None
+    unknown = set(kinds or ()) - set(changes.FEED_SERIALIZERS)
+    if unknown:
+        return Response(
+            {"error": f"Unknown change types: {', '.join(sorted(unknown))}"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    cursor = request.query_params.get("cursor")
+    if not cursor:
+        return Response(
+            {"changes": [], "next": changes.head_cursor(), "has_more": False},
+            status=status.HTTP_200_OK,
+        )
+    try:
+        limit = min(
+            int(request.query_params.get("limit", changes.DEFAULT_LIMIT)), changes.MAX_LIMIT
+        )
+        if limit < 1:
+            raise ValueError("limit must be positive")
+        position = changes.parse_cursor(cursor)
+    except changes.CursorExpired as e:
+        return Response({"error": str(e)}, status=status.HTTP_410_GONE)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(
+        changes.read_changes(position, kinds=kinds, limit=limit), status=status.HTTP_200_OK
+    )
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def matches_view(request):
+    """
+    Matches for the logged-in team, best first: sales that could fill its
+    requests and requests its sales could fill.
+
+    Query params:
+    - role: "buyer" for matches on its requests only, "seller" for its sales
+    - cursor / page_size: keyset pages, as on the list endpoints
+    """
+    user = request.user
+    sides = {"buyer": models.Q(request__user=user), "seller": models.Q(sale__user=user)}
+    role = request.query_params.get("role")
+    if role is not None and role not in sides:
+        return Response(
+            {"error": "role must be 'buyer' or 'seller'"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    matches = ListingMatch.objects.filter(
+        sides[role] if role else sides["buyer"] | sides["seller"]
+    )
+    if wants_cursor_page(request):
+        return paginated_response(request, matches, ListingMatchSerializer, MATCH_ORDERING)
+    serializer = ListingMatchSerializer(
+        matches.order_by(*MATCH_ORDERING), many=True, spec=FieldSpec.from_request(request)
+    )
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+@api_view(["GET", "POST"])
+@permission_classes([IsAuthenticated])
+def saved_searches_view(request):
+    """
+    GET: the logged-in team's saved searches, newest first.
+    POST: save a search. New listings that match it are pushed to the team's
+    socket, or emailed when it is offline.
+    """
+    if request.method == "GET":
+        searches = SavedSearch.objects.filter(user=request.user).order_by("-created_at")
+        serializer = SavedSearchSerializer(searches, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    serializer = SavedSearchSerializer(data=request.data, context={"request": request})
+    if serializer.is_valid():
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(["PATCH", "DELETE"])
+@permission_classes([IsAuthenticated])
+def saved_search_view(request, search_id):
+    """Edit or delete one of the logged-in team's saved searches."""
+    try:
+        search = SavedSearch.objects.get(id=search_id, user=request.user)
+    except (SavedSearch.DoesNotExist, ValidationError):
+        return Response({"error": "Saved search not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    if request.method == "DELETE":
+        search.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    serializer = SavedSearchSerializer(
+        search, data=request.data, partial=True, context={"request": request}
+    )
+    if serializer.is_valid():
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_200_OK)
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -21,4 +21,16 @@ app.conf.beat_schedule = {
         'task': 'api.tasks.send_daily_requests_digest',
         'schedule': crontab(hour=8, minute=0),  # Run at 8 AM every day
     },
+    'sync-team-directory': {
+        'task': 'api.tasks.sync_team_directory',
+        'schedule': crontab(hour=3, minute=0, day_of_week=1),  # Mondays at 3 AM
+    },
+    'send-pending-activation-emails': {
+        'task': 'api.tasks.send_pending_activation_emails',
+        'schedule': crontab(minute='*/5'),  # Catch activations made directly in the DB
+    },
+    'prune-change-log': {
+        'task': 'api.tasks.prune_change_log',
+        'schedule': crontab(hour=4, minute=0),  # Every day at 4 AM
+    },
 }
\ No newline at end of file
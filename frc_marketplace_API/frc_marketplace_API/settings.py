@@ -46,6 +46,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",  # For full-text and trigram search
     # Third-party apps
     "phone_field",  # For model support
     "address",  # For model support
@@ -98,6 +99,43 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Chat messages are fanned out first and written in batches (see api/message_buffer.py)
+CHAT_WRITE_BEHIND = config("CHAT_WRITE_BEHIND", cast=bool, default=True)
+CHAT_FLUSH_INTERVAL_MS = config("CHAT_FLUSH_INTERVAL_MS", cast=int, default=20)
+CHAT_FLUSH_BATCH_SIZE = config("CHAT_FLUSH_BATCH_SIZE", cast=int, default=200)
+
+# DM emails are coalesced per recipient until the chat is quiet this long (see api/notifications.py)
+DM_NOTIFICATION_WINDOW = config("DM_NOTIFICATION_WINDOW", cast=int, default=120)
+DM_NOTIFICATION_MAX_WAIT = config("DM_NOTIFICATION_MAX_WAIT", cast=int, default=900)
+
+REST_FRAMEWORK = {
+    # Same bytes as DRF's JSONRenderer, encoded with orjson (see api/renderers.py)
+    "DEFAULT_RENDERER_CLASSES": [
+        "api.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+        "api.renderers.NormalizedJSONRenderer",
+    ],
+}
+
+# Big list endpoints build rows with .values() instead of serializers (see api/projections.py)
+API_FAST_ROWS = config("API_FAST_ROWS", cast=bool, default=True)
+
+# Rendered list responses are reused until a model they read from changes (see api/response_cache.py)
+RESPONSE_CACHE_TTL = config("RESPONSE_CACHE_TTL", cast=int, default=300)
+
+# Days of history the /api/changes/ feed keeps; older cursors must resync (see api/changes.py)
+CHANGE_LOG_RETENTION_DAYS = config("CHANGE_LOG_RETENTION_DAYS", cast=int, default=7)
+
+# Changes younger than this are held back so entries committing out of order are not skipped
+CHANGE_FEED_SETTLE_SECONDS = config("CHANGE_FEED_SETTLE_SECONDS", cast=int, default=2)
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": f"redis://redis:{config('REDIS_PORT_CONTAINER', default=6379)}/1",
+    },
+}
+
 
 LOGGING = {
     "version": 1,
@@ -1,25 +1,104 @@
+import time
 import requests
+from requests.adapters import HTTPAdapter
 from decouple import config
+from django.core.cache import cache
 
 BASE_URL = "https://www.thebluealliance.com/api/v3/"
+TBA_TIMEOUT = 5  # seconds
+TEAM_FIELDS = ("nickname", "name", "city", "state_prov", "country", "rookie_year")
+# How long a worker may serve a nickname from the shared cache
+TEAM_NAME_TTL = 3600
+_DIRECTORY_VERSION_KEY = "team_directory:version"
+
+_session = None
+
+
+def get_session():
+    """Shared keep-alive session for TBA calls."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        _session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=10))
+        _session.headers["X-TBA-Auth-Key"] = config("BLUE_ALLIANCE_API_KEY")
+    return _session
+
+
+def fetch_teams_page(page, etag=None, last_modified=None):
+    """
+    GET /teams/{page}, sending the validators from the previous fetch.
+    Returns (status_code, teams, response headers); teams is None on 304.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    response = get_session().get(
+        f"{BASE_URL}teams/{page}", headers=headers, timeout=TBA_TIMEOUT
+    )
+    if response.status_code == 304:
+        return 304, None, response.headers
+    response.raise_for_status()
+    return response.status_code, response.json(), response.headers
+
+
+def _directory_version():
+    version = cache.get(_DIRECTORY_VERSION_KEY)
+    if version is None:
+        cache.add(_DIRECTORY_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(_DIRECTORY_VERSION_KEY)
+    return version
+
+
+def clear_team_names():
+    """Drop every worker's cached nicknames, e.g. after a directory sync."""
+    try:
+        cache.incr(_DIRECTORY_VERSION_KEY)
+    except ValueError:
+        cache.set(_DIRECTORY_VERSION_KEY, time.time_ns(), None)
+
+
+def _directory_team_name(team_number):
+    # Misses raise and are not cached, so they are retried
+    from api.models import FRCTeam
+
+    key = f"team_name:{_directory_version()}:{team_number}"
+    nickname = cache.get(key)
+    if nickname is None:
+        nickname = (
+            FRCTeam.objects.filter(team_number=team_number)
+            .values_list("nickname", flat=True)
+            .first()
+        )
+        if nickname is None:
+            raise LookupError(team_number)
+        cache.set(key, nickname, TEAM_NAME_TTL)
+    return nickname
+
 
 def getTeamName(team_number):
-    api_key = config("BLUE_ALLIANCE_API_KEY")
-    url = f"{BASE_URL}team/frc{team_number}"
+    try:
+        return _directory_team_name(int(team_number))
+    except LookupError:
+        pass
 
-    headers = {
-        "X-TBA-Auth-Key": api_key,
-    }
+    url = f"{BASE_URL}team/frc{team_number}"
 
     try:
-        response = requests.get(url, headers=headers)
+        response = get_session().get(url, timeout=TBA_TIMEOUT)
 
         response.raise_for_status()
         data = response.json()
 
+        from api.models import FRCTeam
+
+        FRCTeam.objects.update_or_create(
+            team_number=int(team_number),
+            defaults={field: data.get(field) for field in TEAM_FIELDS},
+        )
         return data["nickname"]
     except requests.exceptions.RequestException as e:
         print(f"Error fetching data for team {team_number}: {e}")
         return f'Team {team_number}'
-
-
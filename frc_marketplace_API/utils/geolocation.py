@@ -1,14 +1,108 @@
-import requests
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import googlemaps
 from decouple import config
+from django.core.cache import cache
+
+# Geocodes barely change, so keep them for a month in the shared cache
+GEOCODE_CACHE_TTL = 60 * 60 * 24 * 30
+GEOCODE_LOCAL_CACHE_SIZE = 1024
+
+
+def normalize_address(address):
+    """Collapse case, whitespace and comma spacing so equivalent strings share a key."""
+    parts = [" ".join(part.split()) for part in address.lower().split(",")]
+    return ", ".join(part for part in parts if part)
+
+
+class GeocodingCache:
+    """
+    Geocoder with an in-process LRU in front of the shared Django cache (Redis).
+
+    `client` is anything with a googlemaps-style geocode(address) method; by
+    default one googlemaps.Client is created lazily and reused, so its HTTP
+    session is pooled across calls. Only non-empty results are cached.
+    """
+
+    def __init__(self, client=None, ttl=GEOCODE_CACHE_TTL, maxsize=GEOCODE_LOCAL_CACHE_SIZE):
+        self._client = client
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = googlemaps.Client(key=config("GOOGLE_API_KEY"))
+        return self._client
+
+    def _key(self, normalized):
+        return "geocode:" + hashlib.sha1(normalized.encode()).hexdigest()
+
+    def _local_get(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            expires, results = entry
+            if expires < time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return results
+
+    def _local_set(self, key, results):
+        with self._lock:
+            self._local[key] = (time.monotonic() + self.ttl, results)
+            self._local.move_to_end(key)
+            while len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+
+    def geocode(self, address):
+        """Return the geocoder's result list for `address`, using the caches first."""
+        normalized = normalize_address(address)
+        if not normalized:
+            return []
+        key = self._key(normalized)
+
+        results = self._local_get(key)
+        if results is not None:
+            return results
+
+        results = cache.get(key)
+        if results is None:
+            results = self.client.geocode(address)
+            if not results:
+                return []
+            cache.set(key, results, self.ttl)
+        self._local_set(key, results)
+        return results
+
+
+geocoder = GeocodingCache()
+
+
+def geocode(address):
+    """Geocode through the shared module-level cache."""
+    return geocoder.geocode(address)
+
+
+def coordinates_from_result(result):
+    """(lat, lng) of a single geocode result."""
+    location = result["geometry"]["location"]
+    return location["lat"], location["lng"]
 
 
 def get_coordinates(address):
-    api_key = config("GOOGLE_API_KEY")
-    url = f"https://maps.googleapis.com/maps/api/geocode/json?address={address}&key={api_key}"
-    response = requests.get(url)
-    data = response.json()
-    if data['status'] == 'OK':
-        location = data['results'][0]['geometry']['location']
-        return location['lat'], location['lng']
+    results = geocode(address)
+    if results:
+        return coordinates_from_result(results[0])
     else:
-        raise ValueError("Unable to fetch coordinates.")
\ No newline at end of file
+        raise ValueError("Unable to fetch coordinates.")
@@ -1,4 +1,9 @@
-from math import radians, sin, cos, sqrt, atan2
+from math import radians, degrees, sin, cos, asin, sqrt, atan2, floor, ceil
+import numpy as np
+
+# Radius of earth in miles
+EARTH_RADIUS_MILES = 3959
+
 
 def haversine(lat1, lon1, lat2, lon2):
     """
@@ -16,9 +21,131 @@ def haversine(lat1, lon1, lat2, lon2):
     c = 2 * atan2(sqrt(a), sqrt(1-a))
     
     # Radius of earth in miles
-    r = 3959
+    r = EARTH_RADIUS_MILES
     
     # Calculate distance
     distance = c * r
     
     return distance
+
+
+def haversine_many(lat, lon, lats, lons):
+    """
+    Vectorized haversine from one point to N points (decimal degrees).
+    Returns an array of N distances in miles.
+    """
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(np.asarray(lats, dtype=float)), np.radians(np.asarray(lons, dtype=float))
+
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return c * EARTH_RADIUS_MILES
+
+
+def haversine_matrix(lats1, lons1, lats2, lons2):
+    """
+    Vectorized haversine between M points and N points (decimal degrees).
+    Returns an M x N array of distances in miles.
+    """
+    lat1 = np.radians(np.asarray(lats1, dtype=float))[:, np.newaxis]
+    lon1 = np.radians(np.asarray(lons1, dtype=float))[:, np.newaxis]
+    lat2 = np.radians(np.asarray(lats2, dtype=float))[np.newaxis, :]
+    lon2 = np.radians(np.asarray(lons2, dtype=float))[np.newaxis, :]
+
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return c * EARTH_RADIUS_MILES
+
+
+def within_radius(lat, lon, lats, lons, radius_miles):
+    """
+    Indices and distances of the points within radius_miles of (lat, lon),
+    nearest first.
+    """
+    distances = haversine_many(lat, lon, lats, lons)
+    indices = np.flatnonzero(distances <= radius_miles)
+    order = np.argsort(distances[indices], kind="stable")
+    return indices[order], distances[indices][order]
+
+
+def nearest_k(lat, lon, lats, lons, k, radius_miles=None):
+    """
+    Indices and distances of the k points nearest to (lat, lon), nearest first,
+    optionally limited to radius_miles.
+    """
+    distances = haversine_many(lat, lon, lats, lons)
+    indices = np.arange(len(distances))
+    if radius_miles is not None:
+        indices = np.flatnonzero(distances <= radius_miles)
+    if k < len(indices):
+        # argpartition is O(N); only the k survivors get fully sorted
+        indices = indices[np.argpartition(distances[indices], k)[:k]]
+    order = np.argsort(distances[indices], kind="stable")
+    return indices[order], distances[indices][order]
+
+
+def bounding_box(lat, lon, radius_miles):
+    """
+    Return (min_lat, max_lat, min_lon, max_lon) enclosing every point within
+    radius_miles of (lat, lon). Longitudes may fall outside [-180, 180] when the
+    box crosses the antimeridian; a box touching a pole spans all longitudes.
+    """
+    # Pad slightly so float rounding never drops a point sitting on the boundary
+    angular = radius_miles / EARTH_RADIUS_MILES * (1 + 1e-9)
+    min_lat = lat - degrees(angular)
+    max_lat = lat + degrees(angular)
+    if min_lat <= -90 or max_lat >= 90 or cos(radians(lat)) <= sin(angular):
+        return max(min_lat, -90), min(max_lat, 90), -180.0, 180.0
+    dlon = degrees(asin(sin(angular) / cos(radians(lat))))
+    return min_lat, max_lat, lon - dlon, lon + dlon
+
+
+class GridIndex:
+    """
+    Buckets points into fixed lat/lon cells so radius queries only score nearby points.
+
+    Cells are `cell_degrees` on a side. within() scans the cells overlapping the
+    query's bounding box and then applies the exact haversine cut-off, so its
+    results match a brute-force scan over every point.
+    """
+
+    def __init__(self, cell_degrees=1.0):
+        self.cell_degrees = cell_degrees
+        self.columns = ceil(360 / cell_degrees)
+        self.cells = {}
+        self.size = 0
+
+    def cell(self, lat, lon):
+        """Coordinates of the cell holding (lat, lon)."""
+        return floor(lat / self.cell_degrees), floor(lon / self.cell_degrees) % self.columns
+
+    def insert(self, lat, lon, item):
+        """Add an item located at (lat, lon)."""
+        self.cells.setdefault(self.cell(lat, lon), []).append((lat, lon, item))
+        self.size += 1
+
+    def cells_within(self, lat, lon, radius_miles):
+        """Cell coordinates that may hold points within radius_miles of (lat, lon)."""
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_miles)
+        rows = range(
+            floor(min_lat / self.cell_degrees), floor(max_lat / self.cell_degrees) + 1
+        )
+        first = floor(min_lon / self.cell_degrees)
+        last = floor(max_lon / self.cell_degrees)
+        if last - first + 1 >= self.columns:
+            columns = range(self.columns)
+        else:
+            columns = {column % self.columns for column in range(first, last + 1)}
+        return [(row, column) for row in rows for column in columns]
+
+    def within(self, lat, lon, radius_miles):
+        """Yield (item, distance) for every point within radius_miles of (lat, lon)."""
+        for cell in self.cells_within(lat, lon, radius_miles):
+            for point_lat, point_lon, item in self.cells.get(cell, ()):
+                distance = haversine(lat, lon, point_lat, point_lon)
+                if distance <= radius_miles:
+                    yield item, distance